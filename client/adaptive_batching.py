@@ -0,0 +1,43 @@
+class AdaptiveBatchSizer:
+    """Adapts the number of messages that are consumed at once from the observed throughput and poll latency.
+
+    If a consumed batch is full, more messages are likely queued. The batch size is then doubled as long as the
+    poll latency stays below the target latency. If a full batch takes longer than the target latency, the batch
+    size shrinks to the number of messages that are consumed within the target latency at the observed throughput.
+    If the batches are only partially filled, the batch size shrinks towards twice the observed number of messages.
+    A full batch of a request that was capped below the batch size, e.g. by stream(), doesn't grow the batch size.
+    """
+
+    def __init__(self, initial=100, minimum=10, maximum=10000, target_latency=0.05, smoothing=0.2):
+        """
+        :param initial: initial batch size
+        :param minimum: minimal batch size
+        :param maximum: maximal batch size
+        :param target_latency: maximal duration in seconds of a poll of a full batch
+        :param smoothing: weight of the latest observation in the exponentially weighted throughput
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = max(minimum, min(maximum, initial))
+        self.target_latency = target_latency
+        self.smoothing = smoothing
+        self.throughput = 0.0  # exponentially weighted messages per second of full batches
+
+    def update(self, num_messages, requested, latency):
+        """
+        Updates the batch size with the observation of a poll.
+        :param num_messages: number of consumed messages
+        :param requested: number of messages that were requested, may be capped below the batch size
+        :param latency: duration of the poll in seconds
+        :return: the new batch size
+        """
+        if num_messages < requested:
+            self.size = max(self.minimum, (self.size + 2 * num_messages) // 2)
+            return self.size
+        if latency > 0:
+            self.throughput += self.smoothing * (num_messages / latency - self.throughput)
+        if latency > self.target_latency:
+            self.size = max(self.minimum, min(self.size, int(self.throughput * self.target_latency)))
+        elif requested >= self.size:
+            self.size = min(self.maximum, self.size * 2)
+        return self.size
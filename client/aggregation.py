@@ -0,0 +1,100 @@
+import math
+import numbers
+from array import array
+
+
+class WindowAggregator:
+    """Tumbling-window aggregation of a numeric datastream, configured in the instance file, e.g.:
+
+        "aggregation": {"window": 10, "percentiles": [50, 95, 99]}
+
+    The samples are buffered in an array of doubles. A window is closed by the first sample of a later window, and
+    its summary is sent as a single datapoint of the same datastream with the start of the window as phenomenon time.
+    The result of the datapoint is the mean of the window, such that it stays numeric for consumers and stream apps,
+    and the summary is added to its attributes under the key "aggregation", e.g.
+    {"count": 100, "min": 0.1, "max": 2.3, "mean": 1.1, "last": 0.9, "p50": 1.0, "p95": 2.1, "p99": 2.3}.
+    The windows are aligned to multiples of the window length since the unix epoch. Late samples of an already
+    closed window are added to the current window.
+    """
+
+    KEYS = ("window", "percentiles")
+
+    def __init__(self, window, percentiles=None):
+        """
+        :param window: length of a window in seconds
+        :param percentiles: optional list of percentiles between 0 and 100 that are added to the summary
+        """
+        if not isinstance(window, numbers.Real) or window <= 0:
+            raise ValueError(f"Invalid aggregation window: {window}, must be a positive number of seconds.")
+        percentiles = tuple(percentiles or ())
+        for percentile in percentiles:
+            if not isinstance(percentile, numbers.Real) or not 0 <= percentile <= 100:
+                raise ValueError(f"Invalid percentile: {percentile}, must be a number between 0 and 100.")
+        self.window_us = int(window * 1e6)
+        self.percentiles = percentiles
+        self.values = array("d")
+        self.window_start = None
+        self.last_result = None
+        self.attributes = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a WindowAggregator from the "aggregation" entry of a datastream in the instance file."""
+        if not isinstance(config, dict) or "window" not in config or not set(config).issubset(cls.KEYS):
+            raise ValueError(f"Invalid aggregation {config}, the key 'window' is required, allowed keys are "
+                             f"{cls.KEYS}.")
+        return cls(**config)
+
+    def add(self, result, time_us, attributes=None):
+        """
+        Adds a sample to its window.
+        :param result: numeric result of the sample
+        :param time_us: phenomenon time of the sample in microseconds since the unix epoch
+        :param attributes: attributes of the sample, the summary is sent with the attributes of the last sample
+        :return: tuple (window start in microseconds, mean, attributes) if the sample closed a window, else None
+        """
+        if isinstance(result, bool) or not isinstance(result, numbers.Real):
+            raise ValueError(f"Invalid result '{result}', only numeric results can be aggregated.")
+        start = time_us - time_us % self.window_us
+        closed = None
+        if self.window_start is None:
+            self.window_start = start
+        elif start > self.window_start:
+            closed = self.flush()
+            self.window_start = start
+        self.values.append(result)
+        self.last_result = result
+        self.attributes = attributes
+        return closed
+
+    def flush(self):
+        """
+        Closes the current window.
+        :return: tuple (window start in microseconds, mean, attributes), where the attributes of the last sample hold
+            the summary under the key "aggregation", None if the window is empty
+        """
+        values = self.values
+        if not values:
+            return None
+        count = len(values)
+        summary = {"count": count, "min": min(values), "max": max(values), "mean": math.fsum(values) / count,
+                   "last": self.last_result}
+        if self.percentiles:
+            ordered = sorted(values)
+            for percentile in self.percentiles:
+                summary[f"p{percentile:g}"] = self.percentile(ordered, percentile)
+        attributes = dict(self.attributes) if self.attributes else dict()
+        attributes["aggregation"] = summary
+        closed = (self.window_start, summary["mean"], attributes)
+        self.values = array("d")
+        self.window_start = None
+        self.attributes = None
+        return closed
+
+    @staticmethod
+    def percentile(ordered, percentile):
+        """Returns the percentile of sorted values with linear interpolation between the closest ranks."""
+        rank = (len(ordered) - 1) * percentile / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
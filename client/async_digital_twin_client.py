@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+
+import confluent_kafka
+
+try:
+    from .digital_twin_client import DigitalTwinClient
+except ImportError:
+    from client.digital_twin_client import DigitalTwinClient
+
+
+class AsyncDigitalTwinClient:
+    """The asyncio interface of the Digital Twin Client.
+
+    Producing and consuming never block the event loop: the Kafka producer and consumer are polled in dedicated
+    threads that hand delivery reports and consumed datapoints over to the event loop. Usage:
+
+        async with AsyncDigitalTwinClient(**CONFIG) as client:
+            client.register(instance_file=INSTANCES)
+            client.subscribe(subscription_file=SUBSCRIPTIONS)
+            await client.produce("temperature", 23.4)
+            async for datapoint in client:
+                print(datapoint)
+    """
+
+    def __init__(self, client_name, system_name, server_uri, kafka_bootstrap_servers, poll_timeout=0.1,
+                 max_queued_batches=100, on_error="ignore", **kwargs):
+        """Asyncio client library of devices for streaming semantically enriched data.
+        :parameter client_name (string): Name of the client device this application runs on.
+        :parameter system_name (string): Name of the system this application is dedicated to.
+        :parameter server_uri (string): URL of the server to which this application should connect to.
+        :parameter kafka_bootstrap_servers (string): The Kafka servers as comma-separated string
+        :keyword poll_timeout (float): Maximal duration in seconds a poll of the polling threads blocks, default is 0.1
+        :keyword max_queued_batches (int): Maximal number of consumed batches that are queued for the event loop.
+            If reached, the consumer thread waits until the application catches up, default is 100
+        :keyword on_error (string): behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :keyword kwargs: further keyword arguments of the DigitalTwinClient, e.g. producer_options or codec. Only
+            the "async" produce_mode is supported, as the delivery reports resolve the futures of produce()
+        """
+        produce_mode = kwargs["producer_options"].produce_mode if kwargs.get("producer_options") else "async"
+        if produce_mode != "async":
+            raise Exception(f"init: Invalid produce_mode '{produce_mode}', the AsyncDigitalTwinClient only "
+                            f"supports 'async'.")
+        self.client = DigitalTwinClient(client_name, system_name, server_uri, kafka_bootstrap_servers, **kwargs)
+        self.logger = self.client.logger
+        self.poll_timeout = poll_timeout
+        self.max_queued_batches = max_queued_batches
+        self.on_error = on_error
+
+        self.loop = None
+        self.batches = None
+        self.current_batch = deque()
+        self.halt_event = threading.Event()
+        self.threads = list()
+        self.subscribed = False
+        self.closed = False
+
+    def register(self, instance_file):
+        """Register the datastreams of the instance file, see DigitalTwinClient.register."""
+        self.client.register(instance_file)
+
+    def subscribe(self, subscription_file):
+        """Subscribe to the datastreams of the subscription file, see DigitalTwinClient.subscribe.
+        The consumer thread is started with the first subscription."""
+        self.client.subscribe(subscription_file)
+        self.subscribed = True
+        if self.loop is not None and not any(t.name == "consumer" for t in self.threads):
+            self._start_thread("consumer", self._consume_loop)
+
+    async def start(self):
+        """Bind the client to the running event loop and start the polling threads."""
+        self.loop = asyncio.get_event_loop()
+        self.batches = asyncio.Queue(maxsize=self.max_queued_batches)
+        self.halt_event.clear()
+        self.closed = False
+        self._start_thread("producer", self._poll_producer_loop)
+        if self.subscribed:
+            self._start_thread("consumer", self._consume_loop)
+        return self
+
+    async def ready(self, timeout=None):
+        """
+        Waits without blocking the event loop until the broker metadata was received, see DigitalTwinClient.on_ready.
+        :param timeout: maximal duration in seconds to wait, raises an asyncio.TimeoutError if it elapses
+        :return: True
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.client.on_ready(lambda: loop.call_soon_threadsafe(self._resolve, future, None, True))
+        return await asyncio.wait_for(future, timeout)
+
+    def _start_thread(self, name, target):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    async def produce(self, quantity, result, timestamp=None, **kwargs):
+        """
+        Sends a datapoint of a registered datastream and resolves as soon as its delivery report was received.
+        :param quantity: Quantity of the Data
+        :param result: The actual value without units. Can be boolean, integer, float, category or an object
+        :param timestamp: either ISO 8601 or a 10,13,16 or 19 digit unix epoch format. If not given, it will be created.
+        :param kwargs: additional keyword arguments that hold tags or additional quantities to describe the datapoint
+        :return: the delivered confluent_kafka Message, raises a KafkaException if the delivery failed, None if the
+            datapoint was suppressed by the deadband of its datastream, added to the current window of its
+            aggregation or spooled until the brokers are reachable again
+        """
+        if self.loop is None:
+            await self.start()
+        messages = self.client.prepare_datapoint(quantity, result, timestamp, kwargs)
+        if not messages:
+            return None
+        future = self.loop.create_future()
+
+        def on_delivery(err, msg):
+            # called after the delivery_report by the thread that polled, the future is resolved within the event loop
+            self.loop.call_soon_threadsafe(self._resolve, future, err, msg)
+
+        # Backpressure: wait without blocking the event loop while the window of in-flight messages is full, the
+        # wrapped client only blocks if the window is filled by other threads meanwhile
+        while self.client.in_flight >= self.client.max_in_flight:
+            await asyncio.sleep(self.poll_timeout)
+        if not self.client.send_many_to_kafka_bootstrap(messages, callback=on_delivery):
+            # the message was spooled, it is replayed by the client
+            return None
+        return await future
+
+    @staticmethod
+    def _resolve(future, err, msg):
+        if future.cancelled():
+            return
+        if err is not None:
+            future.set_exception(confluent_kafka.KafkaException(err))
+        else:
+            future.set_result(msg)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Returns the next subscribed datapoint, waits until the consumer thread has received one."""
+        while not self.current_batch:
+            if self.closed and (self.batches is None or self.batches.empty()):
+                raise StopAsyncIteration
+            if self.loop is None:
+                await self.start()
+            batch = await self.batches.get()
+            if batch is None:  # the client was closed
+                raise StopAsyncIteration
+            self.current_batch.extend(batch)
+        return self.current_batch.popleft()
+
+    def _poll_producer_loop(self):
+        """Serves the delivery reports of the producer, runs in a dedicated thread. The wrapped client serves them as
+        well when it polls or flushes the producer, which is serialized by its delivery_lock."""
+        while not self.halt_event.is_set():
+            self.client.producer.poll(self.poll_timeout)
+
+    def _consume_loop(self):
+        """Consumes and decodes batches of datapoints and hands them over to the event loop, runs in a dedicated
+        thread. Waits while the queue of batches is full."""
+        while not self.halt_event.is_set():
+            try:
+                batch = self.client.consume_via_bootstrap(timeout=self.poll_timeout, on_error=self.on_error)
+            except Exception as e:
+                self.logger.error(f"AsyncDigitalTwinClient: Error while consuming: {e}")
+                continue
+            if batch:
+                future = asyncio.run_coroutine_threadsafe(self.batches.put(batch), self.loop)
+                while not self.halt_event.is_set():
+                    try:
+                        future.result(timeout=self.poll_timeout)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        continue
+                else:
+                    future.cancel()
+
+    async def flush(self, timeout=None):
+        """Waits until all queued messages are delivered without blocking the event loop.
+        :return: number of messages that are still in the queue"""
+        return await self.loop.run_in_executor(None, self.client.flush, timeout)
+
+    async def close(self):
+        """Stops the polling threads, flushes the producer and disconnects the client."""
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        self.halt_event.set()
+        self.closed = True
+        for thread in self.threads:
+            await self.loop.run_in_executor(None, thread.join)
+        self.threads = list()
+        if self.batches is not None:
+            try:
+                self.batches.put_nowait(None)
+            except asyncio.QueueFull:
+                # the iterator isn't waiting, it stops after the queued batches as the client is closed
+                pass
+        await self.loop.run_in_executor(None, self.client.disconnect)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
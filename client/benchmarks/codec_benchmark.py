@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the per-message encode and decode cost of the client wire path.
+
+Compares the previous implementation, i.e. json.dumps(...).encode('utf-8') and
+json.loads(value.decode('utf-8')), with the codecs of client.codec. Run from the repository root:
+    python client/benchmarks/codec_benchmark.py
+"""
+import os
+import sys
+import json
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from client.codec import JsonCodec, OrjsonCodec, orjson
+
+NUMBER = 100000
+MESSAGE = {"phenomenonTime": "2018-12-03T15:55:39.054752+00:00",
+           "resultTime": "2018-12-03T15:55:39.054901+00:00",
+           "datastream": {"quantity": "temperature", "client_app": "machine_1",
+                          "system": "at.srfg.MachineFleet.Machine1", "thing": "machine"},
+           "result": 23.283468294,
+           "attributes": {"longitude": 13.040768, "latitude": 47.822876, "attitude": 424.5}}
+VALUE = json.dumps(MESSAGE, separators=(',', ':')).encode('utf-8')
+
+
+def legacy_encode():
+    return json.dumps(MESSAGE, separators=(',', ':')).encode('utf-8')
+
+
+def legacy_decode():
+    return json.loads(VALUE.decode('utf-8', errors='ignore'))
+
+
+def bench(name, function):
+    duration = min(timeit.repeat(function, number=NUMBER, repeat=5))
+    print(f"{name:<24} {duration / NUMBER * 1e6:8.3f} us/msg")
+    return duration
+
+
+if __name__ == "__main__":
+    print(f"Per-message cost for a {len(VALUE)} byte message, best of 5 runs with {NUMBER} messages each:")
+    bench("encode json (before)", legacy_encode)
+    bench("encode JsonCodec", lambda: JsonCodec.encode(MESSAGE))
+    if orjson:
+        bench("encode OrjsonCodec", lambda: OrjsonCodec.encode(MESSAGE))
+    bench("decode json (before)", legacy_decode)
+    bench("decode JsonCodec", lambda: JsonCodec.decode(VALUE))
+    if orjson:
+        bench("decode OrjsonCodec", lambda: OrjsonCodec.decode(VALUE))
+    else:
+        print("orjson is not installed, install it via 'pip install orjson' to benchmark the OrjsonCodec.")
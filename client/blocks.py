@@ -0,0 +1,203 @@
+import sys
+import base64
+import struct
+import numbers
+from array import array
+
+try:
+    from . import timestamps
+    from .datapoint import Datapoint
+except ImportError:
+    from client import timestamps
+    from client.datapoint import Datapoint
+
+# NumPy is optional and only used to pack and unpack arrays without conversion
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the binary variant starts with a zero byte, which is invalid in JSON, followed by the type of the message
+MAGIC = b"\x00DTB"
+HEADER = struct.Struct("<4sI")  # magic, length of the JSON header
+# array typecodes and NumPy dtypes of the packed results, all arrays are little-endian
+DTYPES = {"float64": ("d", "<f8"), "float32": ("f", "<f4"), "int64": ("q", "<i8")}
+ENCODINGS = ("base64", "binary")
+
+
+def pack_array(values, dtype):
+    """Packs a sequence of numbers into little-endian bytes of the dtype "float64", "float32" or "int64"."""
+    typecode, np_dtype = DTYPES[dtype]
+    if np is not None and isinstance(values, np.ndarray):
+        return np.ascontiguousarray(values, dtype=np_dtype).tobytes()
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_array(buffer, dtype):
+    """Unpacks little-endian bytes of the dtype "float64", "float32" or "int64" into an array.array."""
+    typecode, _ = DTYPES[dtype]
+    unpacked = array(typecode)
+    unpacked.frombytes(buffer)
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
+def render_block(codec, template, phenomenon_time, result_time, results, dtype="float64", interval=None,
+                 sample_times=None, attributes=None, encoding="base64"):
+    """
+    Serializes a block of samples of a single datastream. The sample times are either given by a fixed interval or
+    delta-encoded as int64 microseconds, where the first delta is relative to the phenomenonTime of the block. The
+    "base64" encoding is a JSON message of the form:
+    {"phenomenonTime": ..., "resultTime": ..., "datastream": {...},
+     "block": {"count": 1000, "dtype": "float32", "interval": 1000, "results": "<base64>"}, "attributes": {...}}
+    with "deltas": "<base64>" instead of the interval for irregular samples. The "binary" encoding consists of the
+    MAGIC, the length of the JSON message without the packed arrays, the JSON message and the raw deltas and results.
+    :param codec: codec of the wire format, see client.codec
+    :param template: DatastreamTemplate of the datastream
+    :param phenomenon_time: ISO 8601 string of the time of the block
+    :param result_time: ISO 8601 string of the resultTime
+    :param results: sequence or NumPy array of the numeric results
+    :param dtype: dtype of the packed results, "float64" (default), "float32" or "int64"
+    :param interval: fixed interval between the samples in seconds, the first sample is at the phenomenonTime
+    :param sample_times: sequence of the times of the samples in microseconds since the unix epoch, or a NumPy
+        datetime64 array
+    :param attributes: dict of attributes, only the additional_attributes of the datastream are sent
+    :param encoding: "base64" (default) or "binary"
+    :return: the message as bytes
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Invalid dtype '{dtype}', must be one of {list(DTYPES)}.")
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Invalid encoding '{encoding}', must be one of {ENCODINGS}.")
+    if (interval is None) == (sample_times is None):
+        raise ValueError("Either the interval or the sample_times of a block must be given.")
+    packed_results = pack_array(results, dtype)
+    count = len(packed_results) // struct.calcsize(DTYPES[dtype][0])
+    block = {"count": count, "dtype": dtype}
+    packed_deltas = b""
+    if interval is not None:
+        if not isinstance(interval, numbers.Real) or interval <= 0:
+            raise ValueError(f"Invalid interval '{interval}', must be a positive number of seconds.")
+        block["interval"] = interval * 1e6
+    else:
+        if len(sample_times) != count:
+            raise ValueError(f"The block has {count} results but {len(sample_times)} sample_times.")
+        if np is not None and isinstance(sample_times, np.ndarray):
+            if sample_times.dtype.kind == "M":
+                sample_times = sample_times.astype("datetime64[us]")
+            deltas = np.diff(np.concatenate(([timestamps.iso8601_to_us(phenomenon_time)],
+                                             sample_times.astype("int64"))))
+        else:
+            previous = timestamps.iso8601_to_us(phenomenon_time)
+            deltas = list()
+            for sample_time in sample_times:
+                deltas.append(int(sample_time) - previous)
+                previous = int(sample_time)
+        packed_deltas = pack_array(deltas, "int64")
+
+    message = {"phenomenonTime": phenomenon_time, "resultTime": result_time, "datastream": template.datastream,
+               "block": block}
+    if template.attributes:
+        message["attributes"] = {k: v for k, v in attributes.items() if k in template.attributes} \
+            if attributes else dict()
+    if encoding == "base64":
+        if packed_deltas:
+            block["deltas"] = base64.b64encode(packed_deltas).decode("ascii")
+        block["results"] = base64.b64encode(packed_results).decode("ascii")
+        return codec.encode(message)
+    header = codec.encode(message)
+    return b"".join((HEADER.pack(MAGIC, len(header)), header, packed_deltas, packed_results))
+
+
+def decode_binary(codec, value):
+    """Decodes a message of the "binary" encoding into the form of the "base64" encoding with the packed arrays as
+    bytes instead of base64 strings."""
+    _, length = HEADER.unpack_from(value, 0)
+    start = HEADER.size + length
+    data = codec.decode(value[HEADER.size:start])
+    block = data["block"]
+    size = block["count"] * struct.calcsize(DTYPES[block["dtype"]][0])
+    if "interval" not in block:
+        block["deltas"] = value[start:start + block["count"] * 8]
+        start += block["count"] * 8
+    block["results"] = value[start:start + size]
+    return data
+
+
+class Block:
+    """A consumed block of samples of a single datastream.
+
+    The results are kept as packed array of the dtype of the block, and the sample times as array of microseconds
+    since the unix epoch, such that they can be handed to columnar consumers without datapoint objects. datapoints()
+    expands the block into a Datapoint per sample.
+    """
+
+    __slots__ = ("system", "thing", "quantity", "client_app", "topic", "partition", "phenomenon_time",
+                 "result_time", "attributes", "dtype", "times_us", "results")
+
+    def __init__(self, data, block):
+        """
+        :param data: decoded and augmented message without the "block", see MessageDecoder.parse
+        :param block: the "block" of the message with the packed arrays as base64 strings or bytes
+        """
+        datastream = data["datastream"]
+        self.system = sys.intern(datastream["system"])
+        self.thing = datastream.get("thing")
+        self.quantity = datastream.get("quantity")
+        self.client_app = datastream.get("client_app")
+        self.topic = data["topic"]
+        self.partition = data["partition"]
+        self.phenomenon_time = data["phenomenonTime"]
+        self.result_time = data.get("resultTime")
+        self.attributes = data.get("attributes")
+        self.dtype = block["dtype"]
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Invalid block dtype '{self.dtype}'.")
+        count = block["count"]
+        self.results = unpack_array(self.to_bytes(block["results"]), self.dtype)
+        start = timestamps.iso8601_to_us(self.phenomenon_time)
+        if "interval" in block:
+            interval = block["interval"]
+            self.times_us = array("q", (start + int(round(i * interval)) for i in range(count)))
+        else:
+            self.times_us = unpack_array(self.to_bytes(block["deltas"]), "int64")
+            previous = start
+            for i, delta in enumerate(self.times_us):
+                previous += delta
+                self.times_us[i] = previous
+        if len(self.results) != count or len(self.times_us) != count:
+            raise ValueError(f"Invalid block, expected {count} samples but got {len(self.results)} results and "
+                             f"{len(self.times_us)} times.")
+
+    @staticmethod
+    def to_bytes(packed):
+        return base64.b64decode(packed) if isinstance(packed, str) else packed
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return (f"Block(system={self.system}, thing={self.thing}, quantity={self.quantity}, "
+                f"phenomenonTime={self.phenomenon_time}, count={len(self)}, dtype={self.dtype})")
+
+    def datapoints(self):
+        """Returns a Datapoint per sample of the block."""
+        datastream = {"quantity": self.quantity, "system": self.system}
+        if self.client_app is not None:
+            datastream["client_app"] = self.client_app
+        if self.thing is not None:
+            datastream["thing"] = self.thing
+        data = {"phenomenonTime": None, "resultTime": self.result_time, "result": None, "datastream": datastream,
+                "topic": self.topic, "partition": self.partition}
+        if self.attributes is not None:
+            data["attributes"] = self.attributes
+        datapoints = list()
+        for time_us, result in zip(self.times_us, self.results):
+            data["phenomenonTime"] = timestamps.us_to_iso8601(time_us)
+            data["result"] = result
+            datapoints.append(Datapoint.from_data(data))
+        return datapoints
@@ -0,0 +1,77 @@
+import json
+
+# orjson is an optional dependency that encodes directly into bytes and decodes from bytes
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    """Codec of the wire format based on the json module of the standard library."""
+    name = "json"
+
+    @staticmethod
+    def encode(obj):
+        """Serializes an object into compact JSON encoded as UTF-8 bytes."""
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def decode(buffer):
+        """Deserializes JSON from a bytes buffer. The json module requires a str, decoding it explicitly is faster
+        than the encoding detection of json.loads(bytes). Raises a ValueError on invalid content."""
+        if isinstance(buffer, (bytes, bytearray)):
+            buffer = buffer.decode('utf-8')
+        return json.loads(buffer)
+
+
+class OrjsonCodec:
+    """Codec of the wire format based on orjson, that is bytes-native and several times faster than the json
+    module. Objects that orjson can't serialize, e.g. integers above 64 bit, fall back to the json module.
+
+    The payloads differ from those of the json module: non-ASCII characters are written as UTF-8 instead of \\u
+    escapes, and the floats NaN and Infinity are written as null, i.e. such a result is consumed as None. The message
+    keys are therefore not encoded by the codec, see encode_key."""
+    name = "orjson"
+    options = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    @classmethod
+    def encode(cls, obj):
+        """Serializes an object into compact JSON encoded as UTF-8 bytes."""
+        try:
+            return orjson.dumps(obj, option=cls.options)
+        except TypeError:
+            return JsonCodec.encode(obj)
+
+    @staticmethod
+    def decode(buffer):
+        """Deserializes JSON from a bytes buffer. Raises a ValueError on invalid content."""
+        return orjson.loads(buffer)
+
+
+CODECS = {JsonCodec.name: JsonCodec, OrjsonCodec.name: OrjsonCodec}
+
+
+def encode_key(key):
+    """
+    Encodes a Kafka message key as compact JSON with escaped non-ASCII characters regardless of the codec. The
+    partition of a message is derived from the bytes of its key, such that all clients must encode keys alike.
+    :param key: name of the thing or client
+    :return: the key as bytes
+    """
+    return JsonCodec.encode(key)
+
+
+def get_codec(name=None):
+    """
+    Returns the codec with the given name.
+    :param name: "orjson", "json" or None to use the fastest available codec
+    :return: codec class with the static methods encode(obj) -> bytes and decode(buffer) -> obj
+    """
+    if name is None:
+        return OrjsonCodec if orjson else JsonCodec
+    if name not in CODECS:
+        raise ValueError(f"Invalid codec '{name}', must be one of {list(CODECS.keys())}.")
+    if name == OrjsonCodec.name and not orjson:
+        raise ImportError("The codec 'orjson' requires the package orjson, install it via 'pip install orjson'.")
+    return CODECS[name]
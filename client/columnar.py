@@ -0,0 +1,156 @@
+import numbers
+
+try:
+    from . import timestamps
+except ImportError:
+    from client import timestamps
+
+# NumPy is optional and only required for columnar consuming
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ColumnarBatch:
+    """Micro-batch of consumed datapoints stored in columns.
+
+    phenomenon_time: int64 array of the phenomenonTime in nanoseconds since the unix epoch
+    result: float64 array of the results, NaN where the result is not numeric
+    is_numeric: bool array that is True where the result is numeric
+    system_codes, thing_codes, quantity_codes: int32 arrays of codes into the lists systems, things and quantities
+    non_numeric: list of tuples (index, result) of the results that are not numeric, incl. booleans
+    """
+
+    def __init__(self, phenomenon_time, result, is_numeric, system_codes, thing_codes, quantity_codes,
+                 systems, things, quantities, non_numeric):
+        self.phenomenon_time = phenomenon_time
+        self.result = result
+        self.is_numeric = is_numeric
+        self.system_codes = system_codes
+        self.thing_codes = thing_codes
+        self.quantity_codes = quantity_codes
+        self.systems = systems
+        self.things = things
+        self.quantities = quantities
+        self.non_numeric = non_numeric
+
+    def __len__(self):
+        return len(self.result)
+
+    def __repr__(self):
+        return (f"ColumnarBatch(size={len(self)}, systems={self.systems}, things={self.things}, "
+                f"quantities={self.quantities}, non_numeric={len(self.non_numeric)})")
+
+    def select(self, system=None, thing=None, quantity=None):
+        """
+        Returns a boolean mask of the datapoints of a datastream, e.g. batch.result[batch.select(quantity="temp")]
+        :param system: name of the system, any system if None
+        :param thing: name of the thing, any thing if None
+        :param quantity: shortname of the datastream, any datastream if None
+        :return: NumPy bool array
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for value, codes, categories in ((system, self.system_codes, self.systems),
+                                         (thing, self.thing_codes, self.things),
+                                         (quantity, self.quantity_codes, self.quantities)):
+            if value is not None:
+                mask &= codes == (categories.index(value) if value in categories else -1)
+        return mask
+
+
+class ColumnarBatchBuilder:
+    """Collects decoded datapoints and blocks and builds a ColumnarBatch with the arrays allocated at once.
+
+    The times and results of the datapoints are collected in lists, which are converted into an array chunk as soon
+    as a block is appended, whose samples are added as array chunks as they are.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("Columnar consuming requires NumPy, install it via 'pip install numpy'.")
+        self.phenomenon_times = list()
+        self.results = list()
+        self.numeric = list()
+        self.non_numeric = list()
+        self.codes = {"system": ([], {}), "thing": ([], {}), "quantity": ([], {})}
+        # converted array chunks of (phenomenon_time, result, is_numeric) and their total length
+        self.chunks = list()
+        self.chunked = 0
+
+    def __len__(self):
+        return self.chunked + len(self.results)
+
+    def append(self, datapoint):
+        """
+        Appends a decoded Datapoint, its datastream is taken from its attributes without decoding the payload.
+        :param datapoint: the Datapoint
+        :return: True if appended, False if the datapoint is invalid as it has no phenomenonTime
+        """
+        phenomenon_time = datapoint.phenomenon_time
+        if phenomenon_time is None:
+            return False
+        index = len(self)
+        self.phenomenon_times.append(phenomenon_time)
+        result = datapoint.result
+        if isinstance(result, numbers.Real) and not isinstance(result, bool):
+            self.results.append(result)
+            self.numeric.append(True)
+        else:
+            self.results.append(np.nan)
+            self.numeric.append(False)
+            self.non_numeric.append((index, result))
+
+        for level, value in (("system", datapoint.system), ("thing", datapoint.thing),
+                             ("quantity", datapoint.quantity)):
+            codes, categories = self.codes[level]
+            code = categories.get(value)
+            if code is None:
+                code = categories[value] = len(categories)
+            codes.append(code)
+        return True
+
+    def append_block(self, block):
+        """Appends the samples of a decoded Block without datapoints per sample."""
+        self.flush_rows()
+        count = len(block)
+        self.chunks.append((np.frombuffer(block.times_us, dtype="int64") * 1000,
+                            np.frombuffer(block.results, dtype=block.results.typecode).astype("float64"),
+                            np.ones(count, dtype=bool)))
+        self.chunked += count
+        for level, value in (("system", block.system), ("thing", block.thing), ("quantity", block.quantity)):
+            codes, categories = self.codes[level]
+            code = categories.get(value)
+            if code is None:
+                code = categories[value] = len(categories)
+            codes.extend([code] * count)
+
+    def flush_rows(self):
+        """Converts the collected datapoints into an array chunk."""
+        if self.results:
+            self.chunks.append((timestamps.iso8601_to_ns_array(self.phenomenon_times),
+                                np.array(self.results, dtype="float64"), np.array(self.numeric, dtype=bool)))
+            self.chunked += len(self.results)
+            self.phenomenon_times = list()
+            self.results = list()
+            self.numeric = list()
+
+    def build(self):
+        """Returns the collected datapoints and blocks as ColumnarBatch."""
+        encoded = dict()
+        for level, (codes, categories) in self.codes.items():
+            encoded[level] = (np.array(codes, dtype="int32"), list(categories.keys()))
+        self.flush_rows()
+        if self.chunks:
+            phenomenon_time, result, is_numeric = (np.concatenate(column) for column in zip(*self.chunks))
+        else:
+            phenomenon_time = np.array([], dtype="int64")
+            result = np.array([], dtype="float64")
+            is_numeric = np.array([], dtype=bool)
+        return ColumnarBatch(
+            phenomenon_time=phenomenon_time,
+            result=result,
+            is_numeric=is_numeric,
+            system_codes=encoded["system"][0], thing_codes=encoded["thing"][0],
+            quantity_codes=encoded["quantity"][0], systems=encoded["system"][1], things=encoded["thing"][1],
+            quantities=encoded["quantity"][1], non_numeric=self.non_numeric)
@@ -0,0 +1,209 @@
+import sys
+from collections.abc import MutableMapping
+
+
+class _Missing:
+    """Marks a field that is not part of the message."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        # unpickled as the same module-level instance, such that identity checks keep working in worker processes
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class Datapoint(MutableMapping):
+    """A compact, read-only consumed datapoint.
+
+    The identity of the datastream is kept in the attributes system, thing and quantity, and the message origin in
+    topic and partition, all as interned strings, such that a batch shares a single copy of each. The payload is
+    decoded on first access of another field, which is skipped for datapoints that are identified by their message
+    headers and never read. The MessageDecoder checks the shape of the payload, such that invalid messages are handled
+    according to its on_error, a payload that is malformed otherwise raises a ValueError on that access.
+
+    For compatibility, a Datapoint is also a mutable mapping of the former datapoint dict, e.g.:
+    {"phenomenonTime": ..., "resultTime": ..., "result": ..., "attributes": {...}, "datastream": {...},
+     "partition": 0, "topic": "dom.comp.work-center.station.ext"}
+    The dict of the "datastream" is built once, such that it can be modified in place. The first assignment or
+    deletion of a key copies the datapoint into a backing dict, which is used by the mapping and the properties from
+    then on, while the attributes system, thing, quantity, topic and partition keep the origin of the message.
+    to_dict() returns a copy as dict, e.g. to serialize the datapoint.
+    """
+
+    __slots__ = ("system", "thing", "quantity", "topic", "partition", "_value", "_codec", "_phenomenon_time",
+                 "_result_time", "_result", "_attributes", "_client_app", "_extra", "_datastream_extra", "_datastream",
+                 "_data")
+
+    # keys of the mapping that are stored in slots, in the order of the messages
+    FIELDS = {"phenomenonTime": "_phenomenon_time", "resultTime": "_result_time", "result": "_result",
+              "attributes": "_attributes"}
+
+    def __init__(self, system, thing, quantity, topic, partition, value=None, codec=None):
+        """
+        :param system: name of the system of the datastream
+        :param thing: name of the thing of the datastream, or None
+        :param quantity: shortname of the datastream
+        :param topic: topic of the message
+        :param partition: partition of the message
+        :param value: encoded payload of the message that is decoded on first access, see from_data otherwise
+        :param codec: codec of the wire format that decodes the value, see client.codec
+        """
+        self.system = intern(system)
+        self.thing = intern(thing)
+        self.quantity = intern(quantity)
+        self.topic = intern(topic)
+        self.partition = partition
+        self._value = value
+        self._codec = codec
+        # the built dict of the datastream, and the backing dict once the datapoint is modified
+        self._datastream = None
+        self._data = None
+
+    @classmethod
+    def from_data(cls, data):
+        """Creates a Datapoint from a decoded and augmented message of the form of the mapping."""
+        datastream = data["datastream"]
+        datapoint = cls(datastream.get("system"), datastream.get("thing"), datastream.get("quantity"),
+                        data["topic"], data["partition"])
+        datapoint._fill(dict(data))
+        return datapoint
+
+    def _load(self):
+        data = self._codec.decode(self._value)
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid datapoint, the message isn't an object: {data}")
+        self._fill(data)
+        self._value = None
+        self._codec = None
+
+    def _fill(self, data):
+        # the fields are popped from the decoded message, the remaining keys are kept as they are
+        for key, slot in self.FIELDS.items():
+            setattr(self, slot, data.pop(key, MISSING))
+        datastream = data.pop("datastream", None)
+        datastream = dict(datastream) if isinstance(datastream, dict) else dict()
+        self._client_app = intern(datastream.pop("client_app", MISSING))
+        for level in ("quantity", "system", "thing"):
+            datastream.pop(level, None)
+        self._datastream_extra = datastream or None
+        data.pop("topic", None)
+        data.pop("partition", None)
+        self._extra = data or None
+
+    def _field(self, slot):
+        if self._value is not None:
+            self._load()
+        return getattr(self, slot)
+
+    def _get(self, key, slot):
+        if self._data is not None:
+            return self._data.get(key)
+        value = self._field(slot)
+        return None if value is MISSING else value
+
+    @property
+    def phenomenon_time(self):
+        return self._get("phenomenonTime", "_phenomenon_time")
+
+    @property
+    def result_time(self):
+        return self._get("resultTime", "_result_time")
+
+    @property
+    def result(self):
+        return self._get("result", "_result")
+
+    @property
+    def attributes(self):
+        return self._get("attributes", "_attributes")
+
+    @property
+    def client_app(self):
+        if self._data is not None:
+            datastream = self._data.get("datastream")
+            return datastream.get("client_app") if isinstance(datastream, dict) else None
+        value = self._field("_client_app")
+        return None if value is MISSING else value
+
+    @property
+    def datastream(self):
+        """The metadata of the datastream as dict, built on first access."""
+        if self._data is not None:
+            return self._data.get("datastream")
+        if self._datastream is None:
+            datastream = {"quantity": self.quantity}
+            client_app = self._field("_client_app")
+            if client_app is not MISSING:
+                datastream["client_app"] = client_app
+            datastream["system"] = self.system
+            if self.thing is not None:
+                datastream["thing"] = self.thing
+            if self._datastream_extra:
+                datastream.update(self._datastream_extra)
+            self._datastream = datastream
+        return self._datastream
+
+    def __getitem__(self, key):
+        if self._data is not None:
+            return self._data[key]
+        if key == "topic":
+            return self.topic
+        if key == "partition":
+            return self.partition
+        if key == "datastream":
+            return self.datastream
+        slot = self.FIELDS.get(key)
+        if slot is not None:
+            value = self._field(slot)
+            if value is not MISSING:
+                return value
+        elif self._field("_extra") and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._materialize()[key] = value
+
+    def __delitem__(self, key):
+        del self._materialize()[key]
+
+    def _materialize(self):
+        """Copies the datapoint into the backing dict, which holds the modifications."""
+        if self._data is None:
+            self._data = {key: self[key] for key in self}
+        return self._data
+
+    def __iter__(self):
+        if self._data is not None:
+            yield from self._data
+            return
+        for key, slot in self.FIELDS.items():
+            if self._field(slot) is not MISSING:
+                yield key
+        yield "datastream"
+        if self._extra:
+            yield from self._extra
+        yield "partition"
+        yield "topic"
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Datapoint({self.to_dict()})"
+
+    def to_dict(self):
+        """Returns a copy of the datapoint as dict."""
+        data = {key: self[key] for key in self}
+        if isinstance(data.get("datastream"), dict):
+            data["datastream"] = dict(data["datastream"])
+        return data
@@ -0,0 +1,76 @@
+import numbers
+
+
+class Deadband:
+    """Change-only filter of a datastream, configured in the instance file, e.g.:
+
+        "deadband": {"absolute": 0.5, "relative": 0.01, "heartbeat": 60, "min_interval": 1}
+
+    A numeric result is sent if it differs from the last sent result by more than the absolute threshold or by more
+    than the relative threshold times the last sent result. Without thresholds and for other results, each change is
+    sent. Regardless of changes, a result is sent if the last one was sent at least heartbeat seconds ago, and no
+    result is sent within min_interval seconds after the last one. The phenomenon time of the datapoints is used as
+    clock, such that replayed or batched data is filtered like live data.
+    """
+
+    KEYS = ("absolute", "relative", "heartbeat", "min_interval")
+
+    def __init__(self, absolute=None, relative=None, heartbeat=None, min_interval=None):
+        """
+        :param absolute: minimal absolute change of a numeric result that is sent
+        :param relative: minimal change of a numeric result relative to the last sent result, e.g. 0.01 for 1 %
+        :param heartbeat: maximal duration in seconds without a sent result
+        :param min_interval: minimal duration in seconds between two sent results
+        """
+        for key, value in zip(self.KEYS, (absolute, relative, heartbeat, min_interval)):
+            if value is not None and (not isinstance(value, numbers.Real) or value < 0):
+                raise ValueError(f"Invalid deadband '{key}': {value}, must be a non-negative number.")
+        self.absolute = absolute
+        self.relative = relative
+        self.heartbeat_us = None if heartbeat is None else int(heartbeat * 1e6)
+        self.min_interval_us = None if min_interval is None else int(min_interval * 1e6)
+        self.last_result = None
+        self.last_time_us = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a Deadband from the "deadband" entry of a datastream in the instance file."""
+        if not isinstance(config, dict) or not set(config).issubset(cls.KEYS):
+            raise ValueError(f"Invalid deadband {config}, allowed keys are {cls.KEYS}.")
+        return cls(**config)
+
+    def accept(self, result, time_us):
+        """
+        Checks if a datapoint is sent, and if so, remembers it as last sent datapoint.
+        :param result: the result of the datapoint
+        :param time_us: the phenomenon time of the datapoint in microseconds since the unix epoch
+        :return: True if the datapoint is sent, False if it is suppressed
+        """
+        if self.last_time_us is not None:
+            elapsed = time_us - self.last_time_us
+            # datapoints that are older than the last sent one are passed through
+            if elapsed >= 0:
+                if self.min_interval_us is not None and elapsed < self.min_interval_us:
+                    return False
+                if (self.heartbeat_us is None or elapsed < self.heartbeat_us) and not self.changed(result):
+                    return False
+        self.last_result = result
+        self.last_time_us = time_us
+        return True
+
+    def changed(self, result):
+        """Checks if a result differs significantly from the last sent result."""
+        last = self.last_result
+        if isinstance(result, numbers.Real) and isinstance(last, numbers.Real) \
+                and not isinstance(result, bool) and not isinstance(last, bool) \
+                and (self.absolute is not None or self.relative is not None):
+            difference = abs(result - last)
+            if difference != difference:
+                # a change from or to NaN is significant, unlike repeated NaNs
+                return not (result != result and last != last)
+            if self.absolute is not None and difference > self.absolute:
+                return True
+            if self.relative is not None and difference > self.relative * abs(last):
+                return True
+            return False
+        return result != last
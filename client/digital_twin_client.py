@@ -4,11 +4,11 @@ import json
 import jstyleson
 import time
 
-import pytz
 import random
 import logging
 import requests
-from datetime import datetime
+import threading
+from collections import deque
 
 # confluent_kafka is based on librdkafka, details in install_kafka_requirements.sh
 import confluent_kafka
@@ -16,17 +16,58 @@ import confluent_kafka
 # confluent_kafka is based on librdkafka, details in requirements.txt
 try:
     from .sensorThingsRegisterHelper import SensorThingsRegisterHelper
+    from .subscription_index import SubscriptionIndex
+    from .codec import get_codec, encode_key
+    from .message_template import DatastreamTemplate, RecordTemplate
+    from . import timestamps
+    from .columnar import ColumnarBatchBuilder
+    from .adaptive_batching import AdaptiveBatchSizer
+    from .message_decoder import MessageDecoder
+    from .worker_pool import PartitionWorkerPool
+    from .metrics import ClientMetrics, to_prometheus_text, serve_prometheus
+    from .spool import Spool
+    from .deadband import Deadband
+    from .aggregation import WindowAggregator
+    from .blocks import Block, render_block
+    from .partitioning import crc32_partition, murmur2_partition
+    from .envelope import DatastreamRegistry, EnvelopeTemplate
+    from .sequence_tracker import SequenceTracker
+    from .options import ProducerOptions, ConsumerOptions
     # from .type_mappings import type_mappings
 except ImportError:
     from client.sensorThingsRegisterHelper import SensorThingsRegisterHelper
+    from client.subscription_index import SubscriptionIndex
+    from client.codec import get_codec, encode_key
+    from client.message_template import DatastreamTemplate, RecordTemplate
+    from client import timestamps
+    from client.columnar import ColumnarBatchBuilder
+    from client.adaptive_batching import AdaptiveBatchSizer
+    from client.message_decoder import MessageDecoder
+    from client.worker_pool import PartitionWorkerPool
+    from client.metrics import ClientMetrics, to_prometheus_text, serve_prometheus
+    from client.spool import Spool
+    from client.deadband import Deadband
+    from client.aggregation import WindowAggregator
+    from client.blocks import Block, render_block
+    from client.partitioning import crc32_partition, murmur2_partition
+    from client.envelope import DatastreamRegistry, EnvelopeTemplate
+    from client.sequence_tracker import SequenceTracker
+    from client.options import ProducerOptions, ConsumerOptions
     # from client.type_mappings import type_mappings
 
 
 class DigitalTwinClient:
     """The Digital Twin Client Class that serves to connect an application for data streaming."""
 
+    # delivery errors of messages that are spooled and replayed later, if a spool is configured
+    SPOOLED_ERRORS = (confluent_kafka.KafkaError._MSG_TIMED_OUT, confluent_kafka.KafkaError._TRANSPORT,
+                      confluent_kafka.KafkaError._ALL_BROKERS_DOWN, confluent_kafka.KafkaError._PURGE_QUEUE,
+                      confluent_kafka.KafkaError._PURGE_INFLIGHT)
+
     def __init__(self, client_name, system_name, server_uri, kafka_bootstrap_servers,
-                 communicate_via=None, break_on_errors=True):
+                 communicate_via=None, break_on_errors=True, producer_options=None, consumer_options=None,
+                 spool_options=None, codec=None, statistics_interval_ms=10000, connect_timeout=10.0,
+                 sequence_numbers=True, server_credentials=None):
         """Client library of devices for streaming semantically enriched data.
         :parameter client_name (string): Name of the client device this application runs on.
         :parameter system_name (string): Name of the system this application is dedicated to.
@@ -36,6 +77,25 @@ class DigitalTwinClient:
             kafka1:9092,kafka2:9093,kafka3:9094
         :keyword produce_via (string, None): Choose the protocol to produce to, default: None="kafka"
         :keyword break_on_errors (boolean): Break on errors like an onmatched key, default is True
+        :keyword producer_options (ProducerOptions, None): Options of the producer like the produce_mode, the
+            batching and the wire_format, see client.options, default: None uses the defaults of ProducerOptions
+        :keyword consumer_options (ConsumerOptions, None): Options of the consumer like the batch size, the
+            commit_mode and the partition_targeting, see client.options, default: None uses the defaults of
+            ConsumerOptions
+        :keyword spool_options (SpoolOptions, None): Options of a disk-backed spool for producing while the brokers
+            are unreachable, see client.options, default: None disables spooling
+        :keyword codec (string, None): JSON codec of the wire path, "orjson" or "json", default: None uses orjson if
+            it is installed and the json module otherwise
+        :keyword statistics_interval_ms (int): Interval in ms in which librdkafka reports its statistics, which are
+            summarized in metrics(), default is 10000, 0 disables the statistics
+        :keyword connect_timeout (float): Timeout in seconds of a request of the broker metadata, which signals the
+            readiness of the client, the request is retried until it succeeds, default is 10.0
+        :keyword sequence_numbers (boolean): Stamp the produced messages with the id of the producer session and a
+            monotonic sequence number per datastream, and check the sequence numbers of the consumed messages for
+            gaps, duplicates and reorderings, which are counted in the metrics(), default is True
+        :keyword server_credentials (tuple, None): Tuple (user_id, authorization) of an admin of the system on the
+            server, required to fetch the ids of the datastreams for the "binary" and "auto" wire_format and to
+            resolve the ids of consumed binary messages, default is None
         """
         # Init logging
         self.logger = logging.getLogger("PR Client Logger")
@@ -63,9 +123,56 @@ class DigitalTwinClient:
         self.mapping = dict()
         self.mapping["logging"] = {"name": "logging", "@iot.id": -1,  # TODO logging should not be part of the mapping
                                    "kafka-topic": self.config["system_name"] + ".log"}
+        # Precompiled message templates for each datastream of the mapping, and for the records per (topic, thing)
+        self.templates = dict()
+        self.record_templates = dict()
+        # Change-only filters and window aggregators of the datastreams with a "deadband" or an "aggregation" in the
+        # instance file
+        self.deadbands = dict()
+        self.aggregators = dict()
         self.subscriptions = set()
+        self.subscription_index = SubscriptionIndex()
         self.break_on_errors = break_on_errors
 
+        # Settings for producing, the produced counter is increased by the producing thread and the delivered counter
+        # by the delivery reports
+        self.producer_options = producer_options = producer_options or ProducerOptions()
+        self.consumer_options = consumer_options = consumer_options or ConsumerOptions()
+        self.spool_options = spool_options
+        self.produce_mode = producer_options.produce_mode
+        self.max_in_flight = producer_options.max_in_flight
+        self.produced = 0
+        self.delivered = 0
+        # delivery reports are served by any thread that polls or flushes the producer, e.g. the replay thread
+        self.delivery_lock = threading.Lock()
+        self.delivery_errors = deque(maxlen=1000)
+        self.codec = get_codec(codec)
+        self.wire_format = producer_options.wire_format
+        # Kept out of the config, as it is logged
+        self.server_credentials = server_credentials
+        # Cached ids of the datastreams of the system, fetched from the server on registration and on unknown ids
+        self.registry = DatastreamRegistry(self.codec, loader=self.fetch_datastream_ids)
+        # Counters, latency histograms and librdkafka statistics, see metrics()
+        self.statistics = ClientMetrics()
+
+        # Settings for consuming, the batch size is either fixed or adapted by the AdaptiveBatchSizer
+        self.consume_batch_size = consumer_options.consume_batch_size
+        self.batch_sizer = AdaptiveBatchSizer(initial=self.consume_batch_size) \
+            if consumer_options.adaptive_batching else None
+        # Sequence numbers of the produced datastreams restart with each session, i.e. instance of the client
+        self.session_id = os.urandom(8).hex() if sequence_numbers else None
+        self.sequence_tracker = SequenceTracker() if sequence_numbers else None
+        self.decoder = MessageDecoder(self.subscription_index, self.codec, logger_name=self.logger.name,
+                                      metrics=self.statistics, registry=self.registry, tracker=self.sequence_tracker)
+        self.commit_mode = consumer_options.commit_mode
+        self.commit_interval = consumer_options.commit_interval
+        self.partition_targeting = consumer_options.partition_targeting
+        # next offsets per (topic, partition) of consumed and of acknowledged messages
+        self.consumed_offsets = dict()
+        self.acked_offsets = dict()
+        self.last_commit = time.time()
+        self.compile_template("logging")
+
         # Check the connection to Kafka, note that the connection to the brokers are preferred
         self.logger.debug("init: Checking Kafka connection")
         self.producer = None
@@ -77,18 +184,33 @@ class DigitalTwinClient:
 
         if self.config["kafka_bootstrap_servers"]:
             # Create Kafka Producer
-            self.producer = confluent_kafka.Producer({'bootstrap.servers': self.config["kafka_bootstrap_servers"],
-                                                      'client.id': self.config["client_name"],
-                                                      'request.timeout.ms': 10000,  # wait up to 10 seconds
-                                                      'default.topic.config': {'acks': 'all'}})
-            # poll some seconds until the producer has processed pending events (not all)
-            _ = self.producer.poll(3)
+            producer_conf = {'bootstrap.servers': self.config["kafka_bootstrap_servers"],
+                             'client.id': self.config["client_name"],
+                             'request.timeout.ms': 10000,  # wait up to 10 seconds
+                             'linger.ms': producer_options.linger_ms if self.produce_mode != "sync" else 0,
+                             'batch.num.messages': producer_options.batch_num_messages,
+                             'queue.buffering.max.messages': self.max_in_flight,
+                             # the partitions of a thing's key are computed with it, see targeted_partitions()
+                             'partitioner': 'consistent_random',
+                             'default.topic.config': {'acks': 'all'}}
+            if statistics_interval_ms:
+                producer_conf['statistics.interval.ms'] = statistics_interval_ms
+                producer_conf['stats_cb'] = self.statistics.stats_callback("producer")
+            producer_conf['error_cb'] = self.error_report
+            self.producer = confluent_kafka.Producer(producer_conf)
 
             # Create Kafka Consumer
             conf = {'bootstrap.servers': self.config["kafka_bootstrap_servers"],
                     'session.timeout.ms': 6000,
                     'auto.offset.reset': 'latest',
                     'group.id': self.config["kafka_group_id"]}
+            if self.commit_mode == "manual":
+                conf['enable.auto.commit'] = False
+                conf['on_commit'] = self.commit_report
+            conf.update(consumer_options.librdkafka_config())
+            if statistics_interval_ms:
+                conf['statistics.interval.ms'] = statistics_interval_ms
+                conf['stats_cb'] = self.statistics.stats_callback("consumer")
             self.consumer = confluent_kafka.Consumer(**conf)
 
         # select how to produce a datapoint, mqtt and rest could be implemented
@@ -98,6 +220,38 @@ class DigitalTwinClient:
             self.produce = self.produce_via_kafka
             self.consume = self.consume_via_bootstrap
 
+        # Stops the background threads on disconnect
+        self.halt_event = threading.Event()
+        # Readiness is signalled as soon as the broker metadata was received, see wait_ready() and on_ready()
+        self.connect_timeout = connect_timeout
+        self.ready_event = threading.Event()
+        self.ready_callbacks = list()
+        self.ready_lock = threading.Lock()
+
+        # Store-and-forward spool for producing while the brokers are unreachable
+        self.broker_down = False
+        self.spool = None
+        if spool_options is not None and self.producer is not None:
+            self.spool = Spool(spool_options.directory, segment_bytes=spool_options.segment_bytes,
+                               max_bytes=spool_options.max_bytes, logger_name=self.logger.name)
+            self.spool_watermark = spool_options.watermark if spool_options.watermark is not None \
+                else self.max_in_flight // 2
+            self.replay_rate = spool_options.replay_rate
+            self.spool_thread = threading.Thread(target=self._replay_spool_loop, name="spool-replay", daemon=True)
+            self.spool_thread.start()
+
+        # Sender thread of the "background" produce_mode. The queue holds tuples (prepare, args) of a method that
+        # returns the serialized messages, or (None, messages) of already serialized messages. Appending to and
+        # popping from a deque are atomic, such that producing threads only contend for the GIL
+        self.sender_queue = deque()
+        self.sender_queue_size = producer_options.sender_queue_size
+        self.sender_wakeup = threading.Event()
+        self.sender_active = False
+        self.sender_thread = None
+        if self.produce_mode == "background" and self.producer is not None:
+            self.sender_thread = threading.Thread(target=self._sender_loop, name="sender", daemon=True)
+            self.sender_thread.start()
+
         self.check_kafka_connection()  # TODO check if the system already exists, break otherwise (should be efficient)
 
     # def check_gost_connection(self):
@@ -118,13 +272,9 @@ class DigitalTwinClient:
     def check_kafka_connection(self):
         # distinguish to connect to the kafka_bootstrap_servers (preferred) or to kafka_rest
         if self.config["kafka_bootstrap_servers"]:
-            # poll some seconds until the producer has processed pending events (not all)
-            polled_msgs = self.producer.poll(3)
-            # print(f"polled {polled_msgs} msgs")
-            # if ret_poll != 0:  # unfortunately, polling may return 0 even if the connection is disturbed
-            #     self.logger.error(f"init: Error, couldn't connect to kafka bootstrap server "
-            #                       f"'{self.config['kafka_bootstrap_servers']}', poll() returns {ret_poll}")
-            #     raise Exception(f"init: Error, couldn't connect to kafka bootstrap server.")
+            # request the broker metadata in the background instead of polling for a fixed duration, the
+            # messages that are produced meanwhile are queued in librdkafka
+            threading.Thread(target=self._await_metadata, name="metadata", daemon=True).start()
 
         else:
             kafka_rest_url = "http://" + self.config["kafka_rest_server"] + "/topics"
@@ -150,6 +300,83 @@ class DigitalTwinClient:
         self.produce("logging", "Started Digital Twin Client with name '{}' for system '{}'".format(
             self.config["client_name"], self.config["system_name"]))
 
+    def fetch_datastream_ids(self):
+        """
+        Fetches the wire format of the system and the ids of its datastreams from the server, used by the registry.
+        :return: dict {"wire_format": ..., "datastreams": [...]}, None if the server isn't reachable
+        """
+        server_uri = self.config["server_uri"]
+        if not server_uri:
+            return None
+        if self.server_credentials is None:
+            self.logger.warning("fetch_datastream_ids: Can't fetch the datastream ids without server_credentials.")
+            return None
+        user_id, authorization = self.server_credentials
+        url = "{}/distributionnetwork/datastream_ids/{}/{}".format(
+            server_uri.rstrip("/") if "://" in server_uri else "http://" + server_uri.rstrip("/"),
+            user_id, self.config["system_name"].replace(".", "_"))
+        try:
+            res = requests.get(url, headers={"Authorization": authorization}, timeout=5)
+            if res.status_code == 200:
+                return res.json()
+            self.logger.warning(f"fetch_datastream_ids: Bad response with code {res.status_code} from '{url}'.")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.warning(f"fetch_datastream_ids: Can't fetch the datastream ids from '{url}': {e}")
+        return None
+
+    def _await_metadata(self):
+        """Requests the cluster metadata until it is received and signals the readiness, runs in a dedicated
+        thread."""
+        while not self.halt_event.is_set():
+            started = time.time()
+            try:
+                metadata = self.producer.list_topics(timeout=self.connect_timeout)
+            except confluent_kafka.KafkaException as e:
+                self.logger.warning(f"init: Couldn't connect to the kafka bootstrap server "
+                                    f"'{self.config['kafka_bootstrap_servers']}', retrying: {e}")
+                self.broker_down = True
+                # retry at most every connect_timeout, list_topics returns immediately on some errors
+                self.halt_event.wait(max(0.0, self.connect_timeout - (time.time() - started)))
+                continue
+            self.logger.info(f"init: Successfully connected to the Kafka bootstrap server "
+                             f"'{self.config['kafka_bootstrap_servers']}' with {len(metadata.brokers)} brokers "
+                             f"after {time.time() - started:.3f} s.")
+            if self.mapping["logging"]["kafka-topic"] not in metadata.topics:
+                self.logger.warning(f"init: The topic '{self.mapping['logging']['kafka-topic']}' doesn't exist in "
+                                    f"the Kafka cluster, is the system registered?")
+            with self.ready_lock:
+                self.ready_event.set()
+                callbacks, self.ready_callbacks = self.ready_callbacks, list()
+            for callback in callbacks:
+                callback()
+            return
+
+    @property
+    def ready(self):
+        """True if the broker metadata was received."""
+        return self.ready_event.is_set()
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until the broker metadata was received, which takes milliseconds if the cluster is healthy.
+        :param timeout: maximal duration in seconds to wait, wait until the client is ready if None
+        :return: True if the client is ready, False if the timeout elapsed
+        """
+        return self.ready_event.wait(timeout)
+
+    def on_ready(self, callback):
+        """
+        Register a callback that is called without arguments as soon as the broker metadata was received. It is called
+        from the metadata thread, or immediately if the client is already ready.
+        :param callback: function that is called once
+        :return:
+        """
+        with self.ready_lock:
+            if not self.ready_event.is_set():
+                self.ready_callbacks.append(callback)
+                return
+        callback()
+
     # def register_existing(self, mappings_file):
     #     """
     #     Create a mappings between internal and unique quantity ids
@@ -218,6 +445,10 @@ class DigitalTwinClient:
             with open(instance_file, "w") as f:
                 f.write(json.dumps(datastreams, indent=2))
 
+        # Fetch the ids of the datastreams and the wire format of the system, see compile_template
+        if self.wire_format != "json" and not self.registry.load():
+            self.logger.warning("register_new: The datastream ids are unavailable, producing in the JSON wire format.")
+
         # Check each entry of the instance file and store into mapping with the shortname as key
         for ds in datastreams["Datastreams"]:
             if not isinstance(ds, dict):
@@ -234,14 +465,62 @@ class DigitalTwinClient:
                 self.logger.error(msg)
                 raise Exception(msg)
 
+            if "deadband" in ds and "aggregation" in ds:
+                msg = (f"register_new: The datastream '{ds['shortname']}' in {instance_file} can't have both a "
+                       f"deadband and an aggregation.")
+                self.logger.error(msg)
+                raise Exception(msg)
+            try:
+                if "deadband" in ds:
+                    self.deadbands[ds["shortname"]] = Deadband.from_config(ds["deadband"])
+                if "aggregation" in ds:
+                    self.aggregators[ds["shortname"]] = WindowAggregator.from_config(ds["aggregation"])
+            except (ValueError, TypeError) as e:
+                msg = f"register_new: Invalid datastream '{ds['shortname']}' in {instance_file}: {e}"
+                self.logger.error(msg)
+                raise Exception(msg)
+
             self.mapping[ds["shortname"]] = ds
             self.mapping[ds["shortname"]]["kafka-topic"] = self.config["system_name"] + ".int"
+            self.compile_template(ds["shortname"])
 
         self.logger.debug(f"register_new: Successfully loaded mapping for {len(self.mapping)} datastreams.")
         msg = f'Registered datastreams for Digital Twin Client {self.config["client_name"]}: {self.mapping.keys()}'
         self.produce("logging", msg)
         self.logger.info(f"register_new: {msg}")
 
+    def compile_template(self, quantity):
+        """
+        Precompile the static parts of the messages of a datastream of the mapping, i.e., the topic, the encoded key,
+        the serialized datastream metadata and the set of additional attributes. In the binary wire format, the
+        datastream is referenced by its id instead, if the server assigned one. The sequence numbers of a recompiled
+        datastream are continued.
+        :param quantity: shortname of the datastream
+        :return: the DatastreamTemplate of the datastream
+        """
+        ds = self.mapping[quantity]
+        additional_attributes = list(ds.get("additional_attributes") or ())
+        if quantity in self.aggregators:
+            # the summaries of the windows are sent in the attributes, see WindowAggregator
+            additional_attributes.append("aggregation")
+        kwargs = dict(quantity=quantity, topic=ds["kafka-topic"], client_name=self.config["client_name"],
+                      system_name=self.config["system_name"], thing=ds.get("thing"),
+                      additional_attributes=additional_attributes, codec=self.codec,
+                      session=self.session_id)
+        if quantity in self.templates:
+            kwargs["sequence"] = self.templates[quantity].sequence
+        datastream_id = None
+        if self.wire_format == "binary" or (self.wire_format == "auto" and self.registry.wire_format == "binary"):
+            datastream_id = self.registry.lookup(self.config["system_name"], ds.get("thing"), quantity)
+            if datastream_id is None and quantity != "logging":
+                self.logger.warning(f"compile_template: The datastream '{quantity}' has no id on the server, "
+                                    f"producing it in the JSON wire format.")
+        if datastream_id is None:
+            self.templates[quantity] = DatastreamTemplate(**kwargs)
+        else:
+            self.templates[quantity] = EnvelopeTemplate(datastream_id, **kwargs)
+        return self.templates[quantity]
+
     def produce_via_kafka(self, quantity, result, timestamp=None, **kwargs):
         """
         Function that sends data of registered datastreams semantically annotated to the Digital Twin Messaging System
@@ -252,39 +531,115 @@ class DigitalTwinClient:
         :param kwargs: additional keyword arguments that hold tags or additional quantities to describe the datapoint
         :return:
         """
-        # check, if the quantity is registered
-        if quantity not in self.mapping.keys():
-            self.logger.error("send: Quantity is not registered: {}".format(quantity))
-            raise Exception("send: Quantity is not registered: {}".format(quantity))
+        if self.sender_thread is not None:
+            # only check the registration, the datapoint is serialized by the sender thread
+            if quantity not in self.templates:
+                msg = (f"The quantity with shortname {quantity} is not registered. "
+                       f"The following quantities are registered: {self.mapping.keys()}")
+                self.logger.error(msg)
+                raise Exception(msg)
+            self.enqueue(self.prepare_datapoint, (quantity, result, time.time() if timestamp is None else timestamp,
+                                                  kwargs))
+            return
+        self.send_many_to_kafka_bootstrap(self.prepare_datapoint(quantity, result, timestamp, kwargs))
+
+        # if self.config["kafka_bootstrap_servers"]:
+        #     self.send_to_kafka_bootstrap(kafka_topic, kafka_key, data)
+        # else:
+        #     self.send_to_kafka_rest(kafka_topic, kafka_key, data)
+
+    def prepare_datapoint(self, quantity, result, timestamp=None, attributes=None):
+        """
+        Applies the aggregation or the deadband of the datastream to a datapoint and serializes it.
+        :return: list of the serialized messages, empty if the datapoint is suppressed or added to the current window
+        """
+        if quantity in self.aggregators:
+            closed = self.aggregate(quantity, result, timestamps.to_iso8601(timestamp), attributes)
+            if closed is None:
+                return []
+            timestamp, result, attributes = closed
+        elif quantity in self.deadbands:
+            timestamp = timestamps.to_iso8601(timestamp)
+            if not self.check_deadband(quantity, result, timestamp):
+                return []
+        return [self.serialize(quantity, result, timestamp, attributes)]
 
-        # create data record with additional attributes
-        if quantity not in self.mapping.keys():
+    def check_deadband(self, quantity, result, phenomenon_time):
+        """
+        Checks a datapoint against the deadband of its datastream, if configured in the instance file.
+        :param quantity: Quantity of the Data
+        :param result: The actual value without units
+        :param phenomenon_time: ISO 8601 UTC timestamp in the form of to_iso8601
+        :return: True if the datapoint is sent, False if it is suppressed
+        """
+        deadband = self.deadbands.get(quantity)
+        if deadband is None or deadband.accept(result, timestamps.iso8601_to_us(phenomenon_time)):
+            return True
+        self.statistics.increment("suppressed")
+        return False
+
+    def aggregate(self, quantity, result, phenomenon_time, attributes=None):
+        """
+        Adds a datapoint to the current window of its datastream, if configured in the instance file.
+        :param quantity: Quantity of the Data
+        :param result: The actual value without units, must be numeric
+        :param phenomenon_time: ISO 8601 UTC timestamp in the form of to_iso8601
+        :param attributes: dict that holds tags or additional quantities to describe the datapoint
+        :return: tuple (phenomenon_time, mean, attributes) of the datapoint of a closed window, whose attributes hold
+            the summary of the window under the key "aggregation", None otherwise
+        """
+        try:
+            closed = self.aggregators[quantity].add(result, timestamps.iso8601_to_us(phenomenon_time), attributes)
+        except ValueError as e:
+            msg = f"aggregate: Can't aggregate the datastream '{quantity}': {e}"
+            self.logger.error(msg)
+            raise Exception(msg)
+        if closed is None:
+            return None
+        window_start, mean, attributes = closed
+        return timestamps.us_to_iso8601(window_start), mean, attributes
+
+    def flush_windows(self):
+        """
+        Sends the summaries of the current windows of all aggregated datastreams, called by disconnect().
+        :return: number of sent summaries, None in the "background" produce_mode
+        """
+        if self.sender_thread is not None:
+            # the windows are only accessed by the sender thread
+            self.enqueue(self.prepare_windows, ())
+            return None
+        messages = self.prepare_windows()
+        if messages:
+            self.send_many_to_kafka_bootstrap(messages)
+        return len(messages)
+
+    def prepare_windows(self):
+        """Closes the current windows of all aggregated datastreams and returns their serialized summaries."""
+        messages = list()
+        for quantity, aggregator in self.aggregators.items():
+            closed = aggregator.flush()
+            if closed is not None:
+                window_start, mean, attributes = closed
+                messages.append(self.serialize(quantity, mean, timestamps.us_to_iso8601(window_start), attributes))
+        return messages
+
+    def serialize(self, quantity, result, timestamp=None, attributes=None):
+        """
+        Function that serializes a datapoint of a registered datastream into a Kafka message.
+        :param quantity: Quantity of the Data
+        :param result: The actual value without units. Can be boolean, integer, float, category or an object
+        :param timestamp: either ISO 8601 or a 10,13,16 or 19 digit unix epoch format. If not given, it will be created.
+        :param attributes: dict that holds tags or additional quantities to describe the datapoint
+        :return: tuple (kafka_topic, key, value, headers) with the key and value encoded as bytes and the headers that
+            identify the datastream and hold its sequence number
+        """
+        # check, if the quantity is registered
+        template = self.templates.get(quantity)
+        if template is None:
             msg = (f"The quantity with shortname {quantity} is not registered. "
                    f"The following quantities are registered: {self.mapping.keys()}")
             self.logger.error(msg)
-            if self.break_on_errors:
-                raise Exception(msg)
-
-        data = dict({"phenomenonTime": self.get_iso8601_time(timestamp),
-                     "resultTime": datetime.utcnow().replace(tzinfo=pytz.UTC).isoformat(),
-                     "datastream": {
-                         "quantity": quantity,
-                         "client_app": self.config["client_name"],
-                         "system": self.config["system_name"]
-                     },
-                     "result": result
-                     })
-        dedicated_thing = self.mapping[quantity].get("thing")
-        if dedicated_thing:
-            data["datastream"]["thing"] = dedicated_thing
-
-        # append the additional attributes are a property of the datastream
-        add_attributes = self.mapping[quantity].get("additional_attributes")
-        if add_attributes:
-            data["attributes"] = dict()
-            for key, value in kwargs.items():
-                if key in add_attributes:
-                    data["attributes"][key] = value
+            raise Exception(msg)
 
         # # check, if the type of the result is correct
         # try:
@@ -295,18 +650,240 @@ class DigitalTwinClient:
         #                       "".format(result, type(result), self.mapping[quantity]["observationType"]))
         #     raise e
 
-        # Either send to kafka bootstrap, or to kafka rest endpoint
-        self.send_to_kafka_bootstrap(
-            # build the kafka-topic that is used
-            kafka_topic=self.mapping[quantity]["kafka-topic"],
-            # the key is either the name of the observed "thing" or the "client-name" (for logging)
-            kafka_key=self.mapping[quantity].get("thing", self.config["client_name"]),
-            data=data)  # the payload to send
+        # create data record with additional attributes by filling the precompiled template of the datastream
+        value = template.render(timestamps.to_iso8601(timestamp), timestamps.now_iso8601(), result, attributes)
+        return template.topic, template.key, value, template.stamp()
 
-        # if self.config["kafka_bootstrap_servers"]:
-        #     self.send_to_kafka_bootstrap(kafka_topic, kafka_key, data)
-        # else:
-        #     self.send_to_kafka_rest(kafka_topic, kafka_key, data)
+    def produce_many(self, records, **kwargs):
+        """
+        Function that sends a batch of datapoints of registered datastreams to the Digital Twin Messaging System.
+        Each distinct quantity is validated once and the whole batch is handed to the producer at once.
+        :param records: either an iterable of datapoints, each as tuple (quantity, result[, timestamp[, attributes]])
+            or as dict with the keys "quantity", "result" and optionally "timestamp" and "attributes",
+            or a columnar batch, i.e. a dict with the keys "quantity", "result" and optionally "timestamp", where each
+            value is a list or NumPy array of same length. A single quantity string is used for all results.
+        :param kwargs: additional keyword arguments that hold tags or additional quantities for all datapoints
+        :return: number of produced datapoints, None in the "background" produce_mode
+        """
+        if isinstance(records, dict):
+            # columnar batch, the timestamps are converted vectorized
+            results = self._to_list(records["result"])
+            quantities = records["quantity"]
+            quantities = [quantities] * len(results) if isinstance(quantities, str) else self._to_list(quantities)
+            phenomenon_times = records.get("timestamp")
+            if phenomenon_times is None:
+                phenomenon_times = [timestamps.now_iso8601()] * len(results)
+            else:
+                phenomenon_times = timestamps.epochs_to_iso8601(phenomenon_times)
+            if not len(quantities) == len(results) == len(phenomenon_times):
+                msg = (f"produce_many: The columns of the batch must have the same length, got {len(quantities)} "
+                       f"quantities, {len(results)} results and {len(phenomenon_times)} timestamps.")
+                self.logger.error(msg)
+                raise Exception(msg)
+            rows = ((quantity, result, phenomenon_time, kwargs)
+                    for quantity, result, phenomenon_time in zip(quantities, results, phenomenon_times))
+        else:
+            rows = self._normalize_records(records, kwargs)
+
+        if self.sender_thread is not None:
+            # the rows are normalized here, as the records may be modified after the call
+            rows = list(rows)
+            unregistered = {row[0] for row in rows if row[0] not in self.templates}
+            if unregistered:
+                msg = (f"produce_many: The quantities with shortnames {unregistered} are not registered. "
+                       f"The following quantities are registered: {self.mapping.keys()}")
+                self.logger.error(msg)
+                raise Exception(msg)
+            self.enqueue(self.prepare_rows, (rows,))
+            return None
+        messages = self.prepare_rows(rows)
+        self.send_many_to_kafka_bootstrap(messages)
+        return len(messages)
+
+    def prepare_rows(self, rows):
+        """
+        Applies the aggregations and deadbands to the normalized rows of produce_many and serializes them.
+        :param rows: iterable of tuples (quantity, result, phenomenonTime, attributes)
+        :return: list of the serialized messages
+        """
+        # validate each distinct quantity once, the static parts of its messages are precompiled in the template
+        templates = dict()
+        messages = list()
+        result_time = timestamps.now_iso8601()
+        for quantity, result, phenomenon_time, attributes in rows:
+            template = templates.get(quantity)
+            if template is None:
+                template = templates[quantity] = self.templates.get(quantity)
+                if template is None:
+                    msg = (f"produce_many: The quantity with shortname {quantity} is not registered. "
+                           f"The following quantities are registered: {self.mapping.keys()}")
+                    self.logger.error(msg)
+                    raise Exception(msg)
+            if quantity in self.aggregators:
+                closed = self.aggregate(quantity, result, phenomenon_time, attributes)
+                if closed is None:
+                    continue
+                phenomenon_time, result, attributes = closed
+            elif quantity in self.deadbands and not self.check_deadband(quantity, result, phenomenon_time):
+                continue
+
+            messages.append((template.topic, template.key,
+                             template.render(phenomenon_time, result_time, result, attributes), template.stamp()))
+        return messages
+
+    def produce_record(self, timestamp, results, **kwargs):
+        """
+        Function that sends the results of several datastreams with a shared timestamp and shared attributes. The
+        results of the datastreams of the same thing are sent as a single record message, which consumers expand
+        into a datapoint per datastream. The record carries the additional attributes of all its datastreams.
+        Only this client and the StreamHub read records. Use produce() as long as other consumers read the topics,
+        see the message format of the topics in the README.
+        :param timestamp: either ISO 8601 or a 10,13,16 or 19 digit unix epoch format. If None, it will be created.
+        :param results: dict of the shortnames of registered datastreams and their results, e.g.
+            {"temperature": 21.3, "acceleration": 0.2}
+        :param kwargs: additional keyword arguments that hold tags or additional quantities for all datapoints
+        :return: number of produced messages, None in the "background" produce_mode
+        """
+        if self.sender_thread is not None:
+            unregistered = [quantity for quantity in results if quantity not in self.templates]
+            if unregistered:
+                msg = (f"produce_record: The quantities with shortnames {unregistered} are not registered. "
+                       f"The following quantities are registered: {self.mapping.keys()}")
+                self.logger.error(msg)
+                raise Exception(msg)
+            self.enqueue(self.prepare_record, (time.time() if timestamp is None else timestamp, results, kwargs))
+            return None
+        messages = self.prepare_record(timestamp, results, kwargs)
+        self.send_many_to_kafka_bootstrap(messages)
+        return len(messages)
+
+    def prepare_record(self, timestamp, results, attributes=None):
+        """
+        Groups the results of several datastreams per thing and serializes them as records, see produce_record.
+        :return: list of the serialized messages
+        """
+        kwargs = attributes or dict()
+        phenomenon_time = timestamps.to_iso8601(timestamp)
+        result_time = timestamps.now_iso8601()
+        messages = list()
+        # results of the datastreams per (topic, thing)
+        records = dict()
+        for quantity, result in results.items():
+            template = self.templates.get(quantity)
+            if template is None:
+                msg = (f"produce_record: The quantity with shortname {quantity} is not registered. "
+                       f"The following quantities are registered: {self.mapping.keys()}")
+                self.logger.error(msg)
+                raise Exception(msg)
+            if quantity in self.aggregators:
+                # the summary of a closed window has its own timestamp and is sent as single datapoint
+                closed = self.aggregate(quantity, result, phenomenon_time, kwargs)
+                if closed is not None:
+                    window_start, mean, attributes = closed
+                    messages.append(self.serialize(quantity, mean, window_start, attributes))
+                continue
+            if quantity in self.deadbands and not self.check_deadband(quantity, result, phenomenon_time):
+                continue
+            records.setdefault((template.topic, self.mapping[quantity].get("thing")), dict())[quantity] = result
+
+        for (topic, thing), thing_results in records.items():
+            if len(thing_results) == 1:
+                # a single datastream of a thing is sent as regular datapoint
+                (quantity, result), = thing_results.items()
+                template = self.templates[quantity]
+                messages.append((template.topic, template.key,
+                                 template.render(phenomenon_time, result_time, result, kwargs), template.stamp()))
+                continue
+            record_template = self.record_templates.get((topic, thing))
+            if record_template is None:
+                record_template = self.record_templates[(topic, thing)] = RecordTemplate(
+                    topic=topic, client_name=self.config["client_name"], system_name=self.config["system_name"],
+                    thing=thing, codec=self.codec, session=self.session_id)
+            attribute_names = frozenset().union(*(self.templates[quantity].attributes for quantity in thing_results))
+            sequences = [self.templates[quantity].next_sequence() for quantity in thing_results] \
+                if self.session_id is not None else ()
+            value, headers = record_template.render(phenomenon_time, result_time, thing_results, kwargs,
+                                                    attribute_names, sequences)
+            messages.append((topic, record_template.key, value, headers))
+        return messages
+
+    def produce_block(self, quantity, results, timestamp=None, interval=None, sample_times=None, dtype="float64",
+                      encoding="base64", **kwargs):
+        """
+        Function that sends a block of samples of a high-frequency datastream as a single message. The numeric results
+        are packed into an array of the dtype, the sample times are either given by a fixed interval starting at the
+        timestamp, or delta-encoded from the sample_times. Consumers expand a block into a datapoint per sample,
+        columnar consumers receive the packed samples as they are. The deadband and the aggregation of a datastream
+        don't apply to blocks.
+        :param quantity: Quantity of the Data
+        :param results: list or NumPy array of the numeric results of the samples
+        :param timestamp: time of the block, either ISO 8601 or a 10,13,16 or 19 digit unix epoch format. If not
+            given, it will be created.
+        :param interval: fixed interval between the samples in seconds, e.g. 0.001 for 1 kHz
+        :param sample_times: alternatively to the interval, a list of the sample times in microseconds since the unix
+            epoch or a NumPy datetime64 array, which must not be before the timestamp
+        :param dtype: dtype of the packed results, "float64" (default), "float32" or "int64"
+        :param encoding: "base64" (default) packs the arrays into a JSON message, "binary" appends the raw arrays to
+            the JSON message, which is smaller but not readable by plain JSON consumers
+        :param kwargs: additional keyword arguments that hold tags or additional quantities to describe the block
+        :return:
+        """
+        template = self.templates.get(quantity)
+        if template is None:
+            msg = (f"produce_block: The quantity with shortname {quantity} is not registered. "
+                   f"The following quantities are registered: {self.mapping.keys()}")
+            self.logger.error(msg)
+            raise Exception(msg)
+        try:
+            value = render_block(self.codec, template, timestamps.to_iso8601(timestamp), timestamps.now_iso8601(),
+                                 results, dtype=dtype, interval=interval, sample_times=sample_times,
+                                 attributes=kwargs, encoding=encoding)
+        except (ValueError, TypeError, OverflowError) as e:
+            msg = f"produce_block: Invalid block of the datastream '{quantity}': {e}"
+            self.logger.error(msg)
+            raise Exception(msg)
+        if self.sender_thread is not None:
+            # the block is stamped and produced by the sender thread, in order with the queued datapoints
+            self.enqueue(self.prepare_block, (template, value, encoding))
+            return
+        self.send_many_to_kafka_bootstrap(self.prepare_block(template, value, encoding))
+
+    @staticmethod
+    def prepare_block(template, value, encoding):
+        """
+        Stamps a serialized block of samples with the identity headers, its encoding and its sequence number.
+        :param template: DatastreamTemplate of the datastream of the block
+        :param value: the serialized block, see render_block
+        :param encoding: "base64" or "binary"
+        :return: list of the message
+        """
+        headers = template.identity_headers + [("block", encoding.encode("utf-8"))]
+        if template.session is not None:
+            headers += [template.session, ("seq", template.next_sequence())]
+        return [(template.topic, template.key, value, headers)]
+
+    @staticmethod
+    def _normalize_records(records, kwargs):
+        """Yields the records of an iterable as tuples (quantity, result, phenomenonTime, attributes)."""
+        for record in records:
+            attributes = kwargs
+            if isinstance(record, dict):
+                quantity, result, timestamp = record["quantity"], record["result"], record.get("timestamp")
+                if record.get("attributes"):
+                    attributes = dict(kwargs, **record["attributes"])
+            else:
+                quantity, result = record[0], record[1]
+                timestamp = record[2] if len(record) > 2 else None
+                if len(record) > 3 and record[3]:
+                    attributes = dict(kwargs, **record[3])
+            yield quantity, result, timestamps.to_iso8601(timestamp), attributes
+
+    @staticmethod
+    def _to_list(values):
+        """Converts NumPy arrays and other iterables into lists of Python objects."""
+        if hasattr(values, "tolist"):
+            return values.tolist()
+        return list(values)
 
     @staticmethod
     def get_iso8601_time(timestamp):
@@ -316,26 +893,7 @@ class DigitalTwinClient:
         :param timestamp: either ISO 8601 or a 10,13,16 or 19 digit unix epoch format.
         :return: ISO 8601 format. e.g. 2018-12-03T15:55:39.054752+00:00
         """
-        if timestamp is None:
-            return datetime.utcnow().replace(tzinfo=pytz.UTC).isoformat()
-        if isinstance(timestamp, str):
-            if timestamp.endswith("Z"):  # Expects the timestamp in the form of 2018-11-06T13:57:55.088294Z
-                return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=pytz.UTC).isoformat()
-            else:  # Expects the timestamp in the form of  2018-11-06T13:57:55.088294+00:00
-                return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%f+00:00').replace(tzinfo=pytz.UTC).isoformat()
-
-        if isinstance(timestamp, float):  # Expects the timestamp in the form of 1541514377.497349 (s)
-            return datetime.utcfromtimestamp(timestamp).replace(tzinfo=pytz.UTC).isoformat()
-
-        if isinstance(timestamp, int):
-            if timestamp < 1e12:  # Expects the timestamp in the form of 1541514377 (s)
-                return datetime.utcfromtimestamp(timestamp).replace(tzinfo=pytz.UTC).isoformat()
-            elif timestamp < 1e15:  # Expects the timestamp in the form of 1541514377497 (ms)
-                return datetime.utcfromtimestamp(timestamp / 1e3).replace(tzinfo=pytz.UTC).isoformat()
-            elif timestamp < 1e15:  # Expects the timestamp in the form of 1541514377497 (us)
-                return datetime.utcfromtimestamp(timestamp / 1e6).replace(tzinfo=pytz.UTC).isoformat()
-            else:  # Expects the timestamp in the form of 1541514377497349 (ns)
-                return datetime.utcfromtimestamp(timestamp / 1e9).replace(tzinfo=pytz.UTC).isoformat()
+        return timestamps.to_iso8601(timestamp)
 
     # def delivery_report_connection_check(self, err, msg):
     #     """ Called only once to check the connection to kafka.
@@ -352,34 +910,269 @@ class DigitalTwinClient:
 
     def delivery_report(self, err, msg):
         """ Called once for each message produced to indicate delivery result.
-            Triggered by poll() or flush()."""
-        if err is not None:
-            self.logger.warning('delivery_report: Message delivery failed: {}'.format(err))
+            Triggered by poll() or flush() of any thread, the reports are serialized by the delivery_lock."""
+        with self.delivery_lock:
+            self.delivered += 1
+            if err is not None:
+                self.statistics.increment("delivery_failures")
+                self.delivery_errors.append(err)
+                if self.spool is not None and not self.spool.closed and err.code() in self.SPOOLED_ERRORS:
+                    # the message expired in the queue of librdkafka while the brokers were unreachable
+                    self.broker_down = True
+                    self.spool.append(msg.topic(), msg.key(), msg.value(), msg.headers())
+                    self.logger.debug("delivery_report: Spooled undelivered message: {}".format(err))
+                else:
+                    self.logger.warning('delivery_report: Message delivery failed: {}'.format(err))
+            else:
+                # the time from produce() until the delivery report
+                latency = msg.latency()
+                if latency is not None:
+                    self.statistics.observe("delivery_latency", latency)
+                self.logger.debug("delivery_report: Message delivered to topic: '{}', partitions: [{}]".format(
+                    msg.topic(), msg.partition()))
+
+    def error_report(self, err):
+        """ Called for global errors of the producer, e.g. if the brokers are unreachable. Triggered by poll()."""
+        if err.code() in (confluent_kafka.KafkaError._ALL_BROKERS_DOWN, confluent_kafka.KafkaError._TRANSPORT):
+            if not self.broker_down and self.spool is not None:
+                self.logger.warning(f"error_report: Kafka is unreachable, spooling messages: {err}")
+            self.broker_down = True
         else:
-            self.logger.debug("delivery_report: Message delivered to topic: '{}', partitions: [{}]".format(
-                msg.topic(), msg.partition()))
+            self.logger.warning(f"error_report: Kafka error: {err}")
+
+    def _replay_spool_loop(self):
+        """Replays the spooled messages in order at a rate of at most replay_rate messages per second, runs in a
+        dedicated thread. The replayed messages are only removed from the spool once they were delivered."""
+        interval = 0.1
+        batch_size = max(1, int(self.replay_rate * interval))
+        while not self.halt_event.is_set():
+            if self.broker_down:
+                # probe the connection before replaying
+                try:
+                    self.producer.list_topics(timeout=5)
+                except confluent_kafka.KafkaException:
+                    self.halt_event.wait(5)
+                    continue
+                self.broker_down = False
+                if self.spool:
+                    self.logger.info(f"_replay_spool_loop: Kafka is reachable, replaying {len(self.spool)} "
+                                     f"spooled messages.")
+
+            started = time.time()
+            records = self.spool.read(batch_size)
+            if not records:
+                self.spool.flush()
+                self.halt_event.wait(interval)
+                continue
+            reports = list()
+            for kafka_topic, key, value, headers in records:
+                while True:
+                    try:
+                        self.producer.produce(kafka_topic, value=value, key=key, headers=headers,
+                                              callback=lambda err, msg: reports.append(err))
+                        break
+                    except BufferError:
+                        self.producer.poll(interval)
+            # wait for the delivery reports of the batch, which arrive at the latest after the message.timeout.ms. The
+            # queue isn't purged, as the purge of librdkafka would drop the live messages of the producer, too
+            while len(reports) < len(records) and not self.halt_event.is_set():
+                self.producer.poll(interval)
+            if len(reports) < len(records):
+                # the batch is replayed by the next client, as the reads are not committed
+                break
+            failures = [err for err in reports if err is not None]
+            if failures:
+                # read the batch again once the connection is back, messages that were delivered are duplicated
+                self.logger.warning(f"_replay_spool_loop: Replay failed for {len(failures)} of {len(records)} "
+                                    f"messages: {failures[0]}")
+                self.spool.rewind()
+                self.broker_down = True
+                continue
+            self.spool.commit()
+            self.halt_event.wait(max(0.0, interval - (time.time() - started)))
 
     def send_to_kafka_bootstrap(self, kafka_topic, kafka_key, data):
         """
-        Function that sends data to the kafka_bootstrap_servers
+        Function that sends data to the kafka_bootstrap_servers. In "async" mode, the message is queued in librdkafka
+        and delivered in batches, in "sync" mode the producer is flushed after each message.
         :param kafka_topic: topic to which the data will sent
         :param kafka_key: key for the data
         :param data: data that is sent to the kafka bootstrap server
         :return:
         """
+        self.send_many_to_kafka_bootstrap([(kafka_topic, encode_key(kafka_key), self.codec.encode(data), None)])
+
+    def send_many_to_kafka_bootstrap(self, messages, callback=None):
+        """
+        Function that sends a batch of serialized messages to the kafka_bootstrap_servers. In "sync" mode, the producer
+        is flushed once after the whole batch.
+        :param messages: list of tuples (kafka_topic, key, value, headers) with the key and value already encoded as
+            bytes and the headers as list of tuples (name, bytes) or None
+        :param callback: optional function (err, msg) that is called after the delivery_report of each produced
+            message, e.g. by the AsyncDigitalTwinClient. Not supported in the "background" produce_mode
+        :return: number of produced messages, the others were spooled or handed over to the sender thread
+        """
+        # In the "background" produce_mode, messages of other threads are handed over to the sender thread
+        if self.sender_thread is not None and threading.current_thread() is not self.sender_thread:
+            if messages:
+                self.enqueue(None, messages)
+            return 0
+
+        on_delivery = self.delivery_report
+        if callback is not None:
+            def on_delivery(err, msg):
+                self.delivery_report(err, msg)
+                callback(err, msg)
+
         # Trigger any available delivery report callbacks from previous produce() calls
         self.producer.poll(0)
 
-        # Asynchronously produce a message, the delivery report callback
-        # will be triggered from poll() above, or flush() below, when the message has
-        # been successfully delivered or failed permanently.
-        self.producer.produce(kafka_topic,
-                              value=json.dumps(data, separators=(',', ':')).encode('utf-8'),
-                              key=json.dumps(kafka_key, separators=(',', ':')).encode('utf-8'),
-                              callback=self.delivery_report)
-        # Wait for any outstanding messages to be delivered and delivery report
-        # callbacks to be triggered.
-        self.producer.flush()
+        # Spool the messages while the brokers are unreachable or the queue is above the watermark, and as long as
+        # spooled messages are not yet replayed to keep the order
+        if self.spool is not None and (self.broker_down or self.spool or self.in_flight >= self.spool_watermark):
+            for kafka_topic, key, value, headers in messages:
+                self.spool.append(kafka_topic, key, value, headers)
+            return 0
+
+        for kafka_topic, key, value, headers in messages:
+            # Backpressure: wait for delivery reports while the window of in-flight messages is full
+            while self.in_flight >= self.max_in_flight:
+                self.producer.poll(0.1)
+
+            # Asynchronously produce a message, the delivery report callback
+            # will be triggered from poll() above, or flush() below, when the message has
+            # been successfully delivered or failed permanently.
+            while True:
+                try:
+                    self.producer.produce(kafka_topic, value=value, key=key, headers=headers, callback=on_delivery)
+                    break
+                except BufferError:
+                    # the local queue of librdkafka is full, serve delivery reports and retry
+                    self.producer.poll(0.1)
+            self.produced += 1
+
+        if self.produce_mode == "sync":
+            # Wait for any outstanding messages to be delivered and delivery report
+            # callbacks to be triggered.
+            self.producer.flush()
+        return len(messages)
+
+    def enqueue(self, prepare, args):
+        """
+        Hands a datapoint or a batch of messages over to the sender thread of the "background" produce_mode. Blocks
+        while sender_queue_size entries are queued.
+        :param prepare: method that returns the list of serialized messages of the args, or None if the args are the
+            serialized messages
+        :param args: tuple of the arguments of prepare, or the list of serialized messages
+        """
+        while len(self.sender_queue) >= self.sender_queue_size:
+            if not self.sender_thread.is_alive():
+                msg = "enqueue: The sender thread is stopped, the client is disconnected."
+                self.logger.error(msg)
+                raise Exception(msg)
+            time.sleep(0.001)
+        self.sender_queue.append((prepare, args))
+        if not self.sender_wakeup.is_set():
+            self.sender_wakeup.set()
+
+    def _sender_loop(self):
+        """Serializes the queued datapoints and produces them in batches, and serves the delivery reports. Runs in a
+        dedicated thread in the "background" produce_mode until the client is disconnected and the queue is empty."""
+        batch_size = 1000
+        while True:
+            messages = list()
+            while self.sender_queue and len(messages) < batch_size:
+                # flush() waits while a popped entry isn't produced yet
+                self.sender_active = True
+                prepare, args = self.sender_queue.popleft()
+                if prepare is None:
+                    messages.extend(args)
+                    continue
+                try:
+                    messages.extend(prepare(*args))
+                except Exception as e:
+                    # the caller can't be notified anymore, e.g. of an invalid result of an aggregated datastream
+                    self.statistics.increment("send_errors")
+                    self.logger.error(f"_sender_loop: Dropping a datapoint that can't be serialized: {e}")
+            if messages:
+                self.send_many_to_kafka_bootstrap(messages)
+                continue
+            self.sender_active = False
+            if self.halt_event.is_set() and not self.sender_queue:
+                break
+            if self.in_flight > 0:
+                # serve delivery reports while waiting for new datapoints
+                self.producer.poll(0.005)
+            else:
+                self.sender_wakeup.wait(0.1)
+            self.sender_wakeup.clear()
+
+    @property
+    def in_flight(self):
+        """Number of produced messages whose delivery report was not yet triggered."""
+        return self.produced - self.delivered
+
+    def flush(self, timeout=None):
+        """
+        Wait until all queued messages are delivered and the delivery reports were triggered.
+        :param timeout: maximal duration in seconds to wait, wait until all messages are delivered if None
+        :return: number of messages that are still in the queue
+        """
+        if self.producer is None:
+            return 0
+        if self.sender_thread is not None and threading.current_thread() is not self.sender_thread:
+            # the sender thread serves the delivery reports, wait until it sent the queue and the reports arrived
+            deadline = None if timeout is None else time.time() + timeout
+            while (self.sender_queue or self.sender_active or self.in_flight > 0) and self.sender_thread.is_alive():
+                if deadline is not None and time.time() >= deadline:
+                    break
+                time.sleep(0.001)
+            if self.sender_thread.is_alive():
+                return len(self.sender_queue) + self.in_flight
+        if timeout is None:
+            return self.producer.flush()
+        return self.producer.flush(timeout)
+
+    def metrics(self):
+        """
+        Returns a snapshot of the client-side metrics and the latest statistics reported by librdkafka.
+        :return: dictionary with the keys "counters" (produced, delivered, suppressed, consumed, polls, filtered,
+            decoded, matched, invalid, delivery_failures, send_errors, sequence_gaps, sequence_duplicates and
+            sequence_reordered), "gauges" (in_flight, sender_queue, consume_batch_target and sequence_streams),
+            "histograms"
+            (delivery_latency, poll_latency, decode_latency and match_latency in seconds, consume_batch_messages in
+            messages) and "librdkafka" (summaries of the producer and consumer statistics, incl. queue depth and
+            consumer lag)
+        """
+        snapshot = self.statistics.snapshot()
+        snapshot["counters"].update({"produced": self.produced, "delivered": self.delivered,
+                                     "filtered": self.decoder.filtered, "decoded": self.decoder.decoded,
+                                     "matched": self.decoder.matched})
+        snapshot["gauges"] = {"in_flight": self.in_flight, "sender_queue": len(self.sender_queue),
+                              "consume_batch_target": self.batch_sizer.size if self.batch_sizer
+                              else self.consume_batch_size}
+        if self.sequence_tracker is not None:
+            # skipped sequence numbers count as gaps, and as reordered if they arrive late, see SequenceTracker
+            snapshot["counters"].update({"sequence_gaps": self.sequence_tracker.gaps,
+                                         "sequence_duplicates": self.sequence_tracker.duplicates,
+                                         "sequence_reordered": self.sequence_tracker.reordered})
+            snapshot["gauges"]["sequence_streams"] = len(self.sequence_tracker)
+        return snapshot
+
+    def prometheus_metrics(self):
+        """Returns the metrics() in the Prometheus text exposition format."""
+        return to_prometheus_text(self.metrics(), labels={"client": self.config["client_name"],
+                                                          "system": self.config["system_name"]})
+
+    def start_metrics_server(self, port=9100, address=""):
+        """
+        Serves the Prometheus metrics on http://address:port/metrics in a background thread.
+        :param port: port of the HTTP server, default is 9100
+        :param address: address the HTTP server binds to, all interfaces by default
+        :return: the HTTPServer, call its shutdown() method to stop it
+        """
+        self.logger.info(f"start_metrics_server: Serving metrics on port {port}.")
+        return serve_prometheus(self.prometheus_metrics, port=port, address=address)
 
     # def send_to_kafka_rest(self, kafka_topic, kafka_key, data):
     #     """
@@ -449,15 +1242,20 @@ class DigitalTwinClient:
                                 f"Invalid number of hierarchy levels."
                                 f"There must be 2 for internal and 5 for external topics!")
 
+        # compile the subscriptions into an index that resolves each datastream in near-constant time
+        for can in self.subscriptions:
+            self.subscription_index.add(can)
+
         # check what topics have to be subscribed
         self.logger.info("subscribe: Subscribing to datastreams with names: {}".format(self.subscriptions))
-        topic_subs = set()
+        # the subscribed things per topic
+        topic_subs = dict()
         domain, company, workcenter, station = self.config["system_name"].split(".")
         for can in self.subscriptions:
             c_domain, c_company, c_workcenter, c_station, c_thing, c_quantity = can.split(".")
             # only the internal topic is possible
             if c_domain == domain and c_company == company and c_workcenter == workcenter and c_station == station:
-                topic_subs.add(self.config["system_name"] + ".int")
+                topic_subs.setdefault(self.config["system_name"] + ".int", set()).add(c_thing)
             # internal and external topics are possible (internal only is already handled)
             elif (
                     (c_domain == domain or c_domain == "*") and
@@ -465,17 +1263,26 @@ class DigitalTwinClient:
                     (c_workcenter == workcenter or c_workcenter == "*") and
                     (c_station == station or c_station == "*")
             ):
-                topic_subs.add(self.config["system_name"] + ".int")
-                topic_subs.add(self.config["system_name"] + ".ext")
+                topic_subs.setdefault(self.config["system_name"] + ".int", set()).add(c_thing)
+                topic_subs.setdefault(self.config["system_name"] + ".ext", set()).add(c_thing)
             # internal is not possible, external only
             else:
-                topic_subs.add(self.config["system_name"] + ".ext")
+                topic_subs.setdefault(self.config["system_name"] + ".ext", set()).add(c_thing)
 
         # Either consume from kafka bootstrap, or to kafka rest endpoint
         if self.config["kafka_bootstrap_servers"]:
-            # Subscribe to topics that are needed to get the data
-            self.logger.info(f"subscribe: Subscribing to Kafka topics: {topic_subs}.")
-            self.consumer.subscribe(list(topic_subs))
+            # Assign the partitions of the subscribed things, or subscribe to topics that are needed to get the data
+            assignment = self.targeted_partitions(topic_subs) if self.partition_targeting else None
+            if assignment is not None:
+                self.logger.info(f"subscribe: Assigning the partitions of the subscribed things: "
+                                 f"{[(tp.topic, tp.partition) for tp in assignment]}.")
+                self.consumer.assign(assignment)
+            elif self.commit_mode == "manual":
+                self.consumer.subscribe(list(topic_subs), on_revoke=self.on_revoke)
+            else:
+                self.consumer.subscribe(list(topic_subs))
+            if assignment is None:
+                self.logger.info(f"subscribe: Subscribed to Kafka topics: {list(topic_subs)}.")
 
         else:
             # Create consumer
@@ -534,7 +1341,8 @@ class DigitalTwinClient:
         and returns the message augmented with datastream metadata.
         :param timeout: duration how long to wait to receive data
         :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
-        :return: either None or data augmented with metadata for each received and subscribed datastream, e.g.:
+        :return: list of a Datapoint for each received and subscribed datastream, which is a read-only mapping of
+            the datapoint augmented with metadata, e.g.:
             {'phenomenonTime': '2018-12-03T16:08:03.366855+00:00', '
              resultTime': '2018-12-03T16:08:03.367045+00:00',
              'result': 5.44982168968592,
@@ -543,67 +1351,232 @@ class DigitalTwinClient:
              'partition': 0
             }
         """
-        # Waits up to 'session.timeout.ms' for a message, batches of maximal 100 messages are consumed at once
-        msgs = self.consumer.consume(num_messages=100, timeout=timeout)
+        msgs = self.fetch_messages(timeout=timeout)
         received_quantities = list()
 
         for msg in msgs:
-            try:
-                data = json.loads(msg.value().decode('utf-8', errors='ignore'))
-            except json.decoder.JSONDecodeError as e:
-                if on_error == "ignore":
-                    continue
-                elif on_error == "warn":
-                    self.logger.warning(e)
+            received_quantities.extend(self.decode_message(msg, on_error=on_error))
+
+        return received_quantities
+
+    def consume_batch(self, timeout=1.0, on_error="ignore", columns=True):
+        """
+        Receives a micro-batch of data from the Kafka topics, like consume_via_bootstrap. With columns=True, the
+        subscribed datapoints are returned as ColumnarBatch of NumPy arrays, which allows vectorized aggregations.
+        The samples of blocks are added to the columns as they are, without a datapoint per sample. Datapoints
+        without a phenomenonTime are invalid and handled according to on_error.
+        :param timeout: duration how long to wait to receive data
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param columns: return a ColumnarBatch if True (default), else a list of datapoints like consume()
+        :return: ColumnarBatch with the columns phenomenon_time (int64 ns), result (float64, NaN if not numeric),
+            the dictionary-encoded system_codes, thing_codes and quantity_codes and the side list non_numeric
+        """
+        if not columns:
+            return self.consume_via_bootstrap(timeout=timeout, on_error=on_error)
+
+        msgs = self.fetch_messages(timeout=timeout)
+        builder = ColumnarBatchBuilder()
+        for msg in msgs:
+            for data in self.decode_message(msg, on_error=on_error, expand_blocks=False):
+                if isinstance(data, Block):
+                    builder.append_block(data)
+                elif not builder.append(data):
+                    self.decoder.invalid(Exception(f"consume_batch: Invalid datapoint without phenomenonTime of "
+                                                   f"the datastream '{data.quantity}' in topic '{data.topic}'."),
+                                         on_error)
+        return builder.build()
+
+    def stream(self, max_batch=100, max_wait=1.0, batches=False, on_error="ignore", stop_event=None):
+        """
+        Generator that lazily yields the subscribed datapoints, either one by one or as micro-batches. If the
+        downstream needs longer than max_wait to process a batch, the assigned partitions are paused while the
+        downstream holds the control, such that librdkafka doesn't prefetch further messages into memory.
+        Fetching is resumed automatically when the generator is resumed.
+        :param max_batch: maximal number of datapoints of a micro-batch
+        :param max_wait: maximal duration in seconds to wait for a micro-batch to become full
+        :param batches: yield lists of datapoints if True, single datapoints otherwise (default)
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param stop_event: optional threading.Event, the generator returns as soon as it is set
+        :return: generator of datapoints or lists of datapoints, see consume_via_bootstrap
+        """
+        paused = list()
+        slow = False
+        try:
+            while stop_event is None or not stop_event.is_set():
+                if paused:
+                    self.consumer.resume(paused)
+                    paused = list()
+
+                # collect a micro-batch until it is full or max_wait is elapsed
+                batch = list()
+                deadline = time.time() + max_wait
+                while len(batch) < max_batch:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    for msg in self.fetch_messages(timeout=remaining, max_messages=max_batch - len(batch)):
+                        batch.extend(self.decode_message(msg, on_error=on_error))
+                if not batch:
                     continue
+
+                # the downstream fell behind with the previous batch, pause the partitions while it processes
+                if slow:
+                    self.logger.debug("stream: Downstream falls behind, pausing the partitions.")
+                    paused = self.consumer.assignment()
+                    self.consumer.pause(paused)
+
+                # hand over the batch, and measure how long the downstream holds the control
+                started = time.time()
+                if batches:
+                    yield batch
                 else:
-                    raise e
-
-            data["partition"] = msg.partition()
-            data["topic"] = msg.topic()
-            if data["topic"].count(".") != 4:
-                raise Exception(f"Invalid topic / system name: '{data['topic']}'.")
-
-            quantity = data.get("datastream", dict()).get("quantity", None)
-            thing = data.get("datastream", dict()).get("thing", None)
-            # print(f"quantity: {quantity}, \tmessage: {data}")
-
-            if msg.topic().endswith(".int"):
-                if not data["datastream"].get("system"):
-                    data["datastream"]["system"] = data["topic"].replace(".int", "")
-
-                for can in self.subscriptions:
-                    if can.startswith(data["datastream"]["system"]):
-                        c_domain, c_company, c_workcenter, c_station, c_thing, c_quantity = can.split(".")
-                        if (
-                                (c_thing == thing or c_thing == "*") and
-                                (c_quantity == quantity or c_quantity == "*")
-                        ):
-                            received_quantities.append(data)
-                            break
-
-                received_quantities.append(data)
-                # print(f"found '{thing}.{quantity}' in internal topics")
-
-            elif msg.topic().endswith(".ext"):  # check for matches in subscribed datastreams
-                if not data["datastream"].get("system"):
-                    data["datastream"]["system"] = data["topic"].replace(".ext", "")
-
-                domain, company, workcenter, station, topic_type = data["topic"].split(".")
-                for can in self.subscriptions:
-                    c_domain, c_company, c_workcenter, c_station, c_thing, c_quantity = can.split(".")
-                    if (
-                            (c_domain == domain or c_domain == "*") and
-                            (c_company == company or c_company == "*") and
-                            (c_workcenter == workcenter or c_workcenter == "*") and
-                            (c_station == station or c_station == "*") and
-                            (c_thing == thing or c_thing == "*") and
-                            (c_quantity == quantity or c_quantity == "*")
-                    ):
-                        received_quantities.append(data)
-                        break
+                    for data in batch:
+                        yield data
+                        if not paused and time.time() - started > max_wait:
+                            paused = self.consumer.assignment()
+                            self.consumer.pause(paused)
+                slow = time.time() - started > max_wait
+        finally:
+            if paused:
+                self.consumer.resume(paused)
 
-        return received_quantities
+    def consume_parallel(self, callback, workers=4, worker_type="thread", timeout=1.0, on_error="ignore",
+                         max_batch=1000, max_backlog=10000, stop_event=None):
+        """
+        Consumes the subscribed datapoints and processes them in parallel in a pool of workers. Messages of the same
+        partition are processed in order, one batch at a time, such that the order per datastream is kept. The
+        offsets of a partition are committed after its worker has processed the batch, requires the commit_mode
+        "manual". Exceptions raised by the callback are re-raised after the running batches are finished.
+        :param callback: function that is called with a list of subscribed datapoints of a single partition. For the
+            worker_type "process", it must be picklable, i.e., a function that is defined on module level
+        :param workers: number of workers
+        :param worker_type: "thread" (default), or "process" for CPU-bound callbacks
+        :param timeout: maximal duration in seconds to wait for messages
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param max_batch: maximal number of messages of a partition that are processed by a worker at once
+        :param max_backlog: number of queued messages of a partition above which fetching the partition is paused
+        :param stop_event: optional threading.Event to stop consuming, runs forever if None
+        :return:
+        """
+        if self.commit_mode != "manual":
+            raise Exception("consume_parallel: The commit_mode 'manual' is required to commit processed offsets.")
+        pool = PartitionWorkerPool(self, callback, workers=workers, worker_type=worker_type, on_error=on_error,
+                                   max_batch=max_batch, max_backlog=max_backlog)
+        pool.run(timeout=timeout, stop_event=stop_event)
+
+    def fetch_messages(self, timeout=1.0, max_messages=None):
+        """
+        Consumes a batch of raw messages, the batch size is either consume_batch_size or adapted to the observed
+        throughput and poll latency.
+        :param timeout: duration how long to wait to receive messages
+        :param max_messages: optional upper limit of the batch size
+        :return: list of confluent_kafka Messages
+        """
+        num_messages = self.batch_sizer.size if self.batch_sizer else self.consume_batch_size
+        if max_messages is not None:
+            num_messages = min(num_messages, max_messages)
+        started = time.time()
+        msgs = self.consumer.consume(num_messages=num_messages, timeout=timeout)
+        latency = time.time() - started
+        if self.batch_sizer is not None:
+            self.batch_sizer.update(len(msgs), num_messages, latency)
+        with self.statistics.lock:
+            self.statistics.counters["polls"] += 1
+            self.statistics.counters["consumed"] += len(msgs)
+            if msgs:
+                # polls that wait for the timeout without messages would distort the latency
+                self.statistics.histograms["poll_latency"].observe(latency)
+                self.statistics.histograms["consume_batch_messages"].observe(len(msgs))
+
+        if self.commit_mode == "manual":
+            # track the next offset of each partition, including messages that are not subscribed
+            for msg in msgs:
+                if not msg.error():
+                    self.consumed_offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+            self.commit_offsets()
+        return msgs
+
+    def ack(self):
+        """
+        Acknowledge that all datapoints that were consumed so far are processed, in the "manual" commit_mode.
+        The offsets are committed asynchronously in coalesced batches per partition, at most every commit_interval.
+        :return:
+        """
+        if self.commit_mode != "manual":
+            return
+        self.acked_offsets.update(self.consumed_offsets)
+        self.consumed_offsets = dict()
+        self.commit_offsets()
+
+    def commit_offsets(self, force=False, asynchronous=True):
+        """
+        Commit the acknowledged offsets if the commit_interval is elapsed.
+        :param force: commit regardless of the commit_interval
+        :param asynchronous: commit asynchronously (default), or wait for the commit to complete
+        :return:
+        """
+        if not self.acked_offsets or not (force or time.time() - self.last_commit >= self.commit_interval):
+            return
+        offsets = [confluent_kafka.TopicPartition(topic, partition, offset)
+                   for (topic, partition), offset in self.acked_offsets.items()]
+        self.acked_offsets = dict()
+        self.last_commit = time.time()
+        try:
+            self.consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        except confluent_kafka.KafkaException as e:
+            self.logger.warning(f"commit_offsets: Couldn't commit offsets {offsets}: {e}")
+
+    def commit_report(self, err, partitions):
+        """ Called for each commit of offsets, triggered by consume() or close()."""
+        if err is not None:
+            self.logger.warning(f"commit_report: Commit of offsets failed: {err}")
+        else:
+            self.logger.debug(f"commit_report: Committed offsets: {partitions}")
+
+    def targeted_partitions(self, topic_subs):
+        """
+        Computes the partitions that hold the subscribed things, with the partitioners that keyed them: the producers
+        of the clients use librdkafka's "consistent_random" (CRC32) and the StreamHub apps forward to the external
+        topics with the murmur2 partitioner of the Java client. The number of partitions is taken from the metadata.
+        :param topic_subs: dict of the subscribed topics and the set of subscribed things of each
+        :return: list of TopicPartitions, or None if a thing is a wildcard or the metadata isn't available
+        """
+        assignment = list()
+        for topic, things in topic_subs.items():
+            if "*" in things:
+                self.logger.info(f"subscribe: Subscribed to all things of '{topic}', falling back to the group subscription.")
+                return None
+            try:
+                metadata = self.consumer.list_topics(topic, timeout=self.connect_timeout).topics.get(topic)
+            except confluent_kafka.KafkaException as e:
+                self.logger.warning(f"subscribe: Couldn't get the partitions of '{topic}': {e}")
+                return None
+            if metadata is None or metadata.error is not None or not metadata.partitions:
+                self.logger.warning(f"subscribe: Couldn't get the partitions of '{topic}'.")
+                return None
+            partitioner = murmur2_partition if topic.endswith(".ext") else crc32_partition
+            partitions = {partitioner(encode_key(thing), len(metadata.partitions)) for thing in things}
+            assignment.extend(confluent_kafka.TopicPartition(topic, p) for p in sorted(partitions))
+        return assignment
+
+    def on_revoke(self, consumer, partitions):
+        """ Called on a rebalance before the partitions are revoked, commits the acknowledged offsets and drops the
+        unacknowledged ones, as these messages are delivered to the new owner of the partitions."""
+        self.commit_offsets(force=True, asynchronous=False)
+        revoked = {(p.topic, p.partition) for p in partitions}
+        self.consumed_offsets = {tp: o for tp, o in self.consumed_offsets.items() if tp not in revoked}
+
+    def decode_message(self, msg, on_error="ignore", expand_blocks=True):
+        """
+        Decodes a consumed Kafka message and checks if its datastream is subscribed.
+        :param msg: the consumed confluent_kafka Message
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param expand_blocks: expand blocks of samples into a Datapoint per sample if True (default), else return
+            the Block
+        :return: list of the subscribed Datapoints of the message, see MessageDecoder.decode
+        """
+        return self.decoder.decode(msg.value(), msg.topic(), msg.partition(), on_error=on_error, headers=msg.headers(),
+                                   key=msg.key(), expand_blocks=expand_blocks)
 
     # def consume_wrapper(self, timeout=1, on_error="ignore"):
     #     """
@@ -652,12 +1625,31 @@ class DigitalTwinClient:
         Disconnect and close Kafka Connections
         :return:
         """
+        if self.producer is not None:
+            self.flush_windows()
+        self.halt_event.set()
+        if self.sender_thread is not None:
+            # the sender thread sends the queued datapoints before it stops
+            self.sender_wakeup.set()
+            self.sender_thread.join()
         if self.config["kafka_bootstrap_servers"]:
+            if self.spool is not None:
+                self.spool_thread.join()
+                # spool the undelivered messages instead of waiting for them, they are replayed by the next client
+                if self.flush(10) > 0:
+                    self.producer.purge()
+                    self.producer.poll(0)
+                self.logger.info(f"disconnect: {len(self.spool)} messages remain spooled.")
+                self.spool.close()
             try:
-                self.producer.flush()
+                remaining = self.flush()
+                if remaining > 0:
+                    self.logger.warning(f"disconnect: {remaining} messages were not delivered.")
             except AttributeError:
                 pass
             try:
+                if self.commit_mode == "manual":
+                    self.commit_offsets(force=True, asynchronous=False)
                 self.consumer.close()
             except AttributeError:
                 pass
@@ -0,0 +1,214 @@
+import sys
+import time
+import struct
+import numbers
+
+try:
+    from . import timestamps
+    from .message_template import DatastreamTemplate
+except ImportError:
+    from client import timestamps
+    from client.message_template import DatastreamTemplate
+
+# the binary wire format starts with a zero byte, which is invalid in JSON, followed by the type of the message
+MAGIC = b"\x00DTE"
+# magic, datastream id, phenomenonTime and resultTime in microseconds since the unix epoch, type of the result
+HEADER = struct.Struct("<4sIqqB")
+FLOAT, INT, FALSE, TRUE, NULL, JSON = range(6)
+NUMBER = {FLOAT: struct.Struct("<d"), INT: struct.Struct("<q")}
+LENGTH = struct.Struct("<I")
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def render_envelope(codec, datastream_id, phenomenon_time, result_time, result, attributes=None):
+    """
+    Serializes a datapoint into the binary wire format, in which the datastream is referenced by its id:
+    the MAGIC, the uint32 datastream id, the int64 phenomenonTime and resultTime in microseconds, the type of the
+    result and the result itself, i.e. a float64 or int64, nothing for booleans and null, or the uint32 length and
+    the JSON of other results. The remaining bytes hold the JSON of the attributes, if any.
+    :param codec: codec of the wire format for results and attributes that aren't packed, see client.codec
+    :param datastream_id: id of the datastream assigned by the server
+    :param phenomenon_time: microseconds since the unix epoch of the phenomenonTime
+    :param result_time: microseconds since the unix epoch of the resultTime
+    :param result: the actual value, can be boolean, integer, float, category or an object
+    :param attributes: dict of the sent attributes or None
+    :return: the message as bytes
+    """
+    if result is None:
+        parts = [HEADER.pack(MAGIC, datastream_id, phenomenon_time, result_time, NULL)]
+    elif isinstance(result, bool):
+        parts = [HEADER.pack(MAGIC, datastream_id, phenomenon_time, result_time, TRUE if result else FALSE)]
+    elif isinstance(result, numbers.Integral) and INT64_MIN <= result <= INT64_MAX:
+        parts = [HEADER.pack(MAGIC, datastream_id, phenomenon_time, result_time, INT), NUMBER[INT].pack(result)]
+    elif isinstance(result, numbers.Real) and not isinstance(result, numbers.Integral):
+        parts = [HEADER.pack(MAGIC, datastream_id, phenomenon_time, result_time, FLOAT), NUMBER[FLOAT].pack(result)]
+    else:
+        encoded = codec.encode(result)
+        parts = [HEADER.pack(MAGIC, datastream_id, phenomenon_time, result_time, JSON), LENGTH.pack(len(encoded)),
+                 encoded]
+    if attributes is not None:
+        parts.append(codec.encode(attributes))
+    return b"".join(parts)
+
+
+def datastream_id(value):
+    """Returns the datastream id of a message of the binary wire format, raises a struct.error if it's too short."""
+    return HEADER.unpack_from(value, 0)[1]
+
+
+def validate_envelope(value):
+    """Checks the header, the type of the result and the length of a message of the binary wire format without
+    decoding it, raises a ValueError if it's invalid."""
+    if len(value) < HEADER.size:
+        raise ValueError(f"Invalid binary message of {len(value)} bytes.")
+    result_type = value[HEADER.size - 1]
+    if result_type in NUMBER:
+        size = HEADER.size + 8
+    elif result_type == JSON:
+        size = HEADER.size + LENGTH.size
+        if len(value) >= size:
+            size += LENGTH.unpack_from(value, HEADER.size)[0]
+    elif result_type in (FALSE, TRUE, NULL):
+        size = HEADER.size
+    else:
+        raise ValueError(f"Unknown type {result_type} of the result.")
+    if len(value) < size:
+        raise ValueError("The result exceeds the binary message.")
+
+
+def decode_envelope(codec, value):
+    """Decodes a message of the binary wire format into a dict of the phenomenonTime, resultTime, result and
+    attributes as in the JSON wire format. Raises a ValueError on invalid content."""
+    try:
+        _, _, phenomenon_time, result_time, result_type = HEADER.unpack_from(value, 0)
+        start = HEADER.size
+        if result_type in NUMBER:
+            result, = NUMBER[result_type].unpack_from(value, start)
+            start += 8
+        elif result_type == JSON:
+            length, = LENGTH.unpack_from(value, start)
+            start += LENGTH.size
+            if len(value) < start + length:
+                raise ValueError("The result exceeds the message.")
+            result = codec.decode(value[start:start + length])
+            start += length
+        elif result_type in (FALSE, TRUE, NULL):
+            result = None if result_type == NULL else result_type == TRUE
+        else:
+            raise ValueError(f"Unknown type {result_type} of the result.")
+    except struct.error as e:
+        raise ValueError(f"Invalid binary message: {e}")
+    data = {"phenomenonTime": timestamps.us_to_iso8601(phenomenon_time),
+            "resultTime": timestamps.us_to_iso8601(result_time), "result": result}
+    if start < len(value):
+        data["attributes"] = codec.decode(value[start:])
+    return data
+
+
+class EnvelopeTemplate(DatastreamTemplate):
+    """Message template of a datastream with a server-assigned id, that is produced in the binary wire format.
+
+    The messages reference the datastream by its id instead of the datastream metadata and lack the identity
+    headers, except for the session and the sequence number. Consumers resolve the id with their DatastreamRegistry.
+    Blocks of the datastream are still sent with the datastream metadata.
+    """
+    __slots__ = ("datastream_id",)
+
+    def __init__(self, datastream_id, *args, **kwargs):
+        """
+        :param datastream_id: id of the datastream assigned by the server
+        further parameters, see DatastreamTemplate
+        """
+        super().__init__(*args, **kwargs)
+        self.datastream_id = datastream_id
+        self.headers = None
+
+    def render(self, phenomenon_time, result_time, result, attributes=None):
+        """Serializes a datapoint of the datastream, see DatastreamTemplate.render."""
+        if self.attributes:
+            attributes = {k: v for k, v in attributes.items() if k in self.attributes} if attributes else dict()
+        else:
+            attributes = None
+        return render_envelope(self.codec, self.datastream_id, timestamps.iso8601_to_us(phenomenon_time),
+                               timestamps.iso8601_to_us(result_time), result, attributes)
+
+
+class EnvelopeCodec:
+    """Decodes the payload of a binary message of a datastream for the lazy decoding of a Datapoint."""
+    __slots__ = ("codec", "client_app")
+
+    def __init__(self, codec, client_app):
+        self.codec = codec
+        self.client_app = client_app
+
+    def decode(self, value):
+        data = decode_envelope(self.codec, value)
+        data["datastream"] = {"client_app": self.client_app}
+        return data
+
+
+class DatastreamRegistry:
+    """Cached mapping of the server-assigned datastream ids of a system to the identities of the datastreams.
+
+    The mapping is fetched by the loader, which returns the response of the server's datastream_ids endpoint, i.e.
+    the wire format of the system and its datastreams. Unknown ids of consumed messages reload the mapping, at most
+    once per refresh_interval. The loader is not pickled, e.g. if the MessageDecoder is sent to a worker process.
+    """
+
+    def __init__(self, codec, loader=None, refresh_interval=10.0):
+        """
+        :param codec: codec of the wire format, see client.codec
+        :param loader: callable without arguments that returns the dict {"wire_format": ..., "datastreams": [...]},
+            or None if the mapping is unavailable
+        :param refresh_interval: minimal interval in seconds between two loads, default is 10.0
+        """
+        self.codec = codec
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.last_load = None
+        self.wire_format = None
+        # id -> (system, thing, quantity, EnvelopeCodec) and (system, thing, quantity) -> id
+        self.entries = dict()
+        self.ids = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["loader"] = None
+        return state
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        """Loads the mapping with the loader, returns True if the mapping was loaded."""
+        self.last_load = time.time()
+        response = self.loader() if self.loader is not None else None
+        if response is None:
+            return False
+        self.update(response)
+        return True
+
+    def update(self, response):
+        """Adds the datastreams of a response of the server's datastream_ids endpoint to the mapping."""
+        self.wire_format = response.get("wire_format", self.wire_format)
+        entries = dict(self.entries)
+        ids = dict(self.ids)
+        for ds in response.get("datastreams", list()):
+            identity = tuple(None if ds.get(level) is None else sys.intern(ds[level])
+                             for level in ("system_name", "thing_name", "shortname"))
+            entries[ds["id"]] = identity + (EnvelopeCodec(self.codec, ds.get("client_name")),)
+            ids[identity] = ds["id"]
+        # replaced as a whole, such that lookups of other threads never see a partial mapping
+        self.entries, self.ids = entries, ids
+
+    def resolve(self, datastream_id):
+        """Returns the tuple (system, thing, quantity, EnvelopeCodec) of a datastream id, None if it's unknown."""
+        entry = self.entries.get(datastream_id)
+        if entry is None and (self.last_load is None or time.time() - self.last_load >= self.refresh_interval):
+            if self.load():
+                entry = self.entries.get(datastream_id)
+        return entry
+
+    def lookup(self, system, thing, quantity):
+        """Returns the id of a datastream, None if it's unknown."""
+        return self.ids.get((system, thing, quantity))
@@ -0,0 +1,376 @@
+import sys
+import time
+import struct
+import logging
+
+try:
+    from .datapoint import Datapoint
+    from . import blocks
+    from . import envelope
+except ImportError:
+    from client.datapoint import Datapoint
+    from client import blocks
+    from client import envelope
+
+
+class MessageDecoder:
+    """Decodes consumed Kafka messages and filters them for subscribed datastreams.
+
+    The decoder doesn't depend on the Kafka consumer and is picklable, such that messages can also be decoded in
+    worker threads or processes. Messages are prefiltered by their headers, or by their key as fallback for messages
+    without headers, such that only messages that may be subscribed are decoded. Messages that are identified by
+    their headers are returned as Datapoint whose payload is decoded only on access. Records of several datastreams
+    are expanded into a Datapoint per subscribed datastream, blocks of samples into a Datapoint per sample.
+    Messages of the binary wire format are detected by their magic and identified by their datastream id.
+    The sequence numbers of the subscribed datastreams are checked by the SequenceTracker, if one is given.
+    """
+
+    def __init__(self, subscription_index, codec, logger_name="PR Client Logger", metrics=None, registry=None,
+                 tracker=None):
+        """
+        :param subscription_index: SubscriptionIndex of the subscribed datastreams
+        :param codec: codec of the wire format, see client.codec
+        :param logger_name: name of the logger for warnings on invalid messages
+        :param metrics: optional ClientMetrics that sample the decode and match latencies
+        :param registry: DatastreamRegistry that resolves the datastream ids of the binary wire format, messages of
+            the binary wire format are invalid without it
+        :param tracker: optional SequenceTracker that checks the sequence numbers of the message headers
+        """
+        self.subscription_index = subscription_index
+        self.codec = codec
+        self.registry = registry
+        self.tracker = tracker
+        self.logger_name = logger_name
+        self.metrics = metrics
+        self.decoded = 0
+        self.matched = 0
+        self.filtered = 0
+        self.invalid_count = 0
+        # decoded message keys, i.e. names of things, and decoded datastream identities of the message headers
+        self.keys = dict()
+        self.identities = dict()
+
+    def __getstate__(self):
+        # the metrics hold a lock and the sequences are tracked by the client only, e.g. if the decoder is sent to a
+        # worker process
+        state = self.__dict__.copy()
+        state["metrics"] = None
+        state["tracker"] = None
+        return state
+
+    def spec(self):
+        """Returns the keyword arguments of a decoder of the same subscriptions without caches and counters, e.g. to
+        create the decoders of worker processes once, see PartitionWorkerPool."""
+        return {"subscription_index": self.subscription_index, "codec": self.codec, "logger_name": self.logger_name,
+                "registry": self.registry}
+
+    def counters(self):
+        """Returns the counters of the decoded, matched, filtered and invalid messages."""
+        return {"decoded": self.decoded, "matched": self.matched, "filtered": self.filtered,
+                "invalid": self.invalid_count}
+
+    @property
+    def logger(self):
+        return logging.getLogger(self.logger_name)
+
+    def decode(self, value, topic, partition, on_error="ignore", headers=None, key=None, expand_blocks=True):
+        """
+        Decodes the value of a consumed Kafka message and checks if its datastream is subscribed.
+        :param value: the value of the message as bytes
+        :param topic: the topic of the message
+        :param partition: the partition of the message
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param headers: optional headers of the message as list of tuples (name, bytes), see prefilter
+        :param key: optional key of the message as bytes, see prefilter
+        :param expand_blocks: expand blocks of samples into a Datapoint per sample if True (default), else return
+            the Block, e.g. for columnar consuming
+        :return: list of the subscribed Datapoints, a record of several datastreams is expanded into a Datapoint per
+            datastream, other messages result in at most one Datapoint or Block
+        """
+        if value is not None and value[:len(envelope.MAGIC)] == envelope.MAGIC:
+            return self.decode_envelope(value, topic, partition, on_error, headers)
+        identity = self.identify(topic, headers) if headers and value is not None else None
+        # producer session, quantities and sequence numbers of the headers of a message that is decoded at once
+        stamps = None
+        if identity is not None:
+            system, thing, quantities, block, session, sequences = identity
+            if len(quantities) == 1 and not block:
+                # the headers identify the datastream, the payload is decoded lazily by the Datapoint
+                if not self.subscription_index.match_encoded(system, thing, quantities[0]):
+                    self.filtered += 1
+                    return []
+                decoded = self.decode_identity((system, thing, quantities[0]))
+                if sequences and self.tracker is not None:
+                    self.track_sequence(session, decoded, sequences[0])
+                if not self.valid_payload(value):
+                    self.invalid(Exception(f"consume: Invalid message of the datastream '{decoded[2]}', the payload "
+                                           f"isn't an object with a phenomenonTime and a result: {value[:100]}"),
+                                 on_error)
+                    return []
+                self.matched += 1
+                return [Datapoint(*decoded, topic, partition, value, self.codec)]
+            # records and blocks are decoded at once and expanded
+            if not any(self.subscription_index.match_encoded(system, thing, quantity) for quantity in quantities):
+                self.filtered += 1
+                return []
+            if sequences and self.tracker is not None:
+                stamps = (session, quantities, sequences)
+        else:
+            if key is not None and not self.prefilter(topic, None, key):
+                self.filtered += 1
+                return []
+            if headers and self.tracker is not None:
+                stamps = self.read_stamps(headers)
+        self.decoded += 1
+        sampled = self.metrics is not None and self.decoded % self.metrics.sample_interval == 0
+        if sampled:
+            started = time.perf_counter()
+        data = self.parse(value, topic, partition, on_error)
+        if stamps is not None and data is not None:
+            self.track_payload(data, *stamps)
+        if sampled:
+            parsed = time.perf_counter()
+            datapoints = self.expand(data, on_error, expand_blocks)
+            self.metrics.observe("decode_latency", parsed - started)
+            self.metrics.observe("match_latency", time.perf_counter() - parsed)
+        else:
+            datapoints = self.expand(data, on_error, expand_blocks)
+        self.matched += len(datapoints)
+        return datapoints
+
+    def decode_envelope(self, value, topic, partition, on_error="ignore", headers=None):
+        """
+        Resolves the datastream id of a message of the binary wire format and checks if it's subscribed, the payload
+        is decoded lazily by the Datapoint. The headers hold the session and the sequence number only.
+        :return: list of at most one Datapoint
+        """
+        try:
+            datastream_id = envelope.datastream_id(value)
+        except struct.error as e:
+            self.invalid(e, on_error)
+            return []
+        entry = self.registry.resolve(datastream_id) if self.registry is not None else None
+        if entry is None:
+            self.invalid(Exception(f"consume: Unknown datastream id {datastream_id} of a binary message."), on_error)
+            return []
+        system, thing, quantity, codec = entry
+        if not self.subscription_index.match(system, thing, quantity):
+            self.filtered += 1
+            return []
+        if headers and self.tracker is not None:
+            self.track_envelope(entry, headers)
+        try:
+            envelope.validate_envelope(value)
+        except ValueError as e:
+            self.invalid(e, on_error)
+            return []
+        self.matched += 1
+        return [Datapoint(system, thing, quantity, topic, partition, value, codec)]
+
+    def track_payload(self, data, session, quantities, sequences):
+        """
+        Checks the sequence numbers of the subscribed datastreams of a parsed message, i.e. a record, block or
+        datapoint that isn't identified by its headers alone. Only the datastreams of the payload are checked, as a
+        datapoint that the StreamHub expanded from a record keeps the headers of the whole record, and a datapoint
+        that it converted from the binary wire format has the session and sequence number but no identity headers.
+        :param data: the parsed message, see parse
+        :param session: producer session of the headers
+        :param quantities: encoded quantities of the headers, records have a header "seq" per header "quantity"
+        :param sequences: sequence numbers of the headers
+        :return:
+        """
+        datastream = data["datastream"]
+        results = data.get("results")
+        payload_quantities = list(results) if isinstance(results, dict) else [datastream.get("quantity")]
+        if quantities:
+            sequence_of = {quantity.decode("utf-8", "replace"): sequence
+                           for quantity, sequence in zip(quantities, sequences)}
+        elif len(sequences) == 1 and len(payload_quantities) == 1:
+            sequence_of = {payload_quantities[0]: sequences[0]}
+        else:
+            return
+        system = datastream["system"]
+        thing = datastream.get("thing")
+        for quantity in payload_quantities:
+            sequence = sequence_of.get(quantity)
+            if sequence is not None and self.subscription_index.match(system, thing, quantity):
+                self.track_sequence(session, (system, thing, quantity), sequence)
+
+    def track_envelope(self, entry, headers):
+        """Checks the sequence number of a message of the binary wire format, whose datastream is resolved to the
+        entry of the registry. The datastream shares its sequence with its blocks, which are identified by headers."""
+        stamps = self.read_stamps(headers)
+        if stamps is not None and len(stamps[2]) == 1:
+            self.track_sequence(stamps[0], entry[:3], stamps[2][0])
+
+    @staticmethod
+    def valid_payload(value):
+        """
+        Cheaply checks the shape of a payload that is decoded lazily by the Datapoint, such that invalid messages are
+        handled according to on_error when decoding. The payload must be a JSON object with the keys phenomenonTime
+        and result, it isn't parsed, i.e. malformed JSON within such an object still raises a ValueError on access.
+        """
+        value = value.strip()
+        return value[:1] == b"{" and value[-1:] == b"}" and b'"phenomenonTime"' in value and b'"result"' in value
+
+    @staticmethod
+    def read_stamps(headers):
+        """Returns the tuple (session, (), sequences) of the producer session and the sequence numbers of message
+        headers without identity headers, see track_payload, or None if the message isn't stamped."""
+        session = None
+        sequences = list()
+        for name, header in headers:
+            if name == "seq":
+                sequences.append(header)
+            elif name == "session":
+                session = header
+        return (session, (), sequences) if session is not None and sequences else None
+
+    def track_sequence(self, session, identity, sequence):
+        """Checks the sequence number of a decoded datastream identity within a producer session."""
+        try:
+            self.tracker.observe((session,) + identity, int(sequence))
+        except ValueError:
+            # invalid sequence numbers are ignored, the message itself may be valid
+            return
+
+    @staticmethod
+    def identify(topic, headers):
+        """
+        Returns the encoded system, thing, the tuple of quantities of the message headers, whether the message is
+        a block of samples, and the producer session and list of sequence numbers, if stamped. Records of several
+        datastreams have a header "quantity" and "seq" per datastream, blocks have the header "block". Returns None if
+        the headers lack the quantity.
+        """
+        system = thing = session = None
+        quantities = list()
+        sequences = list()
+        block = False
+        for name, header in headers:
+            if name == "quantity":
+                quantities.append(header)
+            elif name == "seq":
+                sequences.append(header)
+            elif name == "thing":
+                thing = header
+            elif name == "system":
+                system = header
+            elif name == "block":
+                block = True
+            elif name == "session":
+                session = header
+        if not quantities:
+            return None
+        return system or topic[:-4].encode("utf-8"), thing, tuple(quantities), block, session, sequences
+
+    def decode_identity(self, identity):
+        """Returns the decoded, interned system, thing and quantity of an encoded identity."""
+        decoded = self.identities.get(identity)
+        if decoded is None:
+            if len(self.identities) >= self.subscription_index.MAX_CACHE_SIZE:
+                self.identities.clear()
+            decoded = self.identities[identity] = tuple(
+                None if level is None else sys.intern(level.decode("utf-8")) for level in identity)
+        return decoded
+
+    def prefilter(self, topic, headers, key):
+        """
+        Checks if a message may be subscribed without decoding its value. The datastream is identified by the headers
+        "system", "thing" and "quantity". For messages without these headers, the key, i.e. the name of the thing,
+        is checked.
+        :param topic: the topic of the message
+        :param headers: headers of the message as list of tuples (name, bytes), or None
+        :param key: key of the message as bytes, or None
+        :return: False if the message is not subscribed, True if it may be subscribed
+        """
+        if headers:
+            identity = self.identify(topic, headers)
+            if identity is not None:
+                system, thing, quantities = identity[:3]
+                return any(self.subscription_index.match_encoded(system, thing, quantity) for quantity in quantities)
+        if key is not None:
+            thing = self.keys.get(key)
+            if thing is None:
+                try:
+                    thing = self.codec.decode(key)
+                except (ValueError, TypeError):
+                    return True
+                if len(self.keys) >= self.subscription_index.MAX_CACHE_SIZE:
+                    self.keys.clear()
+                self.keys[key] = thing
+            return not isinstance(thing, str) or self.subscription_index.match_thing(thing)
+        return True
+
+    def parse(self, value, topic, partition, on_error="ignore"):
+        """
+        Decodes the value of a consumed Kafka message and augments it with metadata.
+        :return: the datapoint augmented with metadata, None if the message is invalid
+        """
+        try:
+            # decode straight from the message buffer, blocks of the "binary" encoding start with their magic
+            if value[:len(blocks.MAGIC)] == blocks.MAGIC:
+                data = blocks.decode_binary(self.codec, value)
+            else:
+                data = self.codec.decode(value)
+        except (ValueError, TypeError, KeyError, struct.error) as e:
+            return self.invalid(e, on_error)
+
+        if topic.count(".") != 4:
+            raise Exception(f"Invalid topic / system name: '{topic}'.")
+        datastream = data.get("datastream") if isinstance(data, dict) else None
+        if not isinstance(datastream, dict):
+            return self.invalid(Exception(f"consume: Invalid message without datastream: {data}"), on_error)
+        data["partition"] = partition
+        data["topic"] = topic
+
+        # set the system of the datastream if not given, the topic is of the form 'system.int' or 'system.ext'
+        if not datastream.get("system"):
+            datastream["system"] = topic[:-4]
+        return data
+
+    def invalid(self, error, on_error):
+        """Counts an invalid message and handles the error according to on_error, returns None."""
+        self.invalid_count += 1
+        if self.metrics is not None:
+            self.metrics.increment("invalid")
+        if on_error == "break":
+            raise error
+        if on_error == "warn":
+            self.logger.warning(error)
+        return None
+
+    def expand(self, data, on_error="ignore", expand_blocks=True):
+        """
+        Returns the subscribed Datapoints of a parsed message, a record with the "results" of several datastreams
+        is expanded into a datapoint per datastream and a "block" of samples into a datapoint per sample, or is
+        returned as Block if expand_blocks is False.
+        """
+        if data is None:
+            return []
+        block = data.pop("block", None)
+        if block is not None:
+            if not self.match(data):
+                return []
+            try:
+                block = blocks.Block(data, block)
+            except (ValueError, TypeError, KeyError) as e:
+                self.invalid(e, on_error)
+                return []
+            return block.datapoints() if expand_blocks else [block]
+        results = data.pop("results", None)
+        if not isinstance(results, dict):
+            return [Datapoint.from_data(data)] if self.match(data) else []
+        datapoints = list()
+        datastream = data["datastream"]
+        for quantity, result in results.items():
+            # the Datapoints copy the message, such that it can be reused for the next datastream
+            datastream["quantity"] = quantity
+            data["result"] = result
+            if self.match(data):
+                datapoints.append(Datapoint.from_data(data))
+        return datapoints
+
+    def match(self, data):
+        """Checks for matches of the datastream of a parsed datapoint in the subscribed datastreams."""
+        datastream = data["datastream"]
+        return self.subscription_index.match(datastream["system"], datastream.get("thing"), datastream.get("quantity"))
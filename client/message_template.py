@@ -0,0 +1,143 @@
+import itertools
+
+try:
+    from .codec import encode_key
+except ImportError:
+    from client.codec import encode_key
+
+
+class DatastreamTemplate:
+    """Precompiled static parts of the messages of a registered datastream.
+
+    The kafka key and the JSON fragment of the datastream metadata are serialized once at registration, such that
+    producing a datapoint only serializes the timestamps, the result and the attributes. The resulting message is
+    identical to the serialized dict:
+    {"phenomenonTime": ..., "resultTime": ..., "datastream": {...}, "result": ..., "attributes": {...}}
+    The identity of the datastream is also sent as Kafka message headers "system", "thing" and "quantity", such that
+    consumers can filter the messages without decoding them. If a producer session is given, each message is stamped
+    with the headers "session" and "seq", the monotonic sequence number of the datastream within the session.
+    """
+    __slots__ = ("quantity", "topic", "key", "headers", "identity_headers", "datastream", "header", "attributes",
+                 "codec", "session", "sequence")
+
+    def __init__(self, quantity, topic, client_name, system_name, thing=None, additional_attributes=None,
+                 codec=None, session=None, sequence=None):
+        """
+        :param quantity: shortname of the datastream
+        :param topic: kafka topic the datastream is produced to
+        :param client_name: name of the client application that produces the datastream
+        :param system_name: name of the system the datastream belongs to
+        :param thing: name of the thing the datastream belongs to, the client_name is used as key if not given
+        :param additional_attributes: list of names of the attributes that are sent with each datapoint
+        :param codec: codec of the wire format, see client.codec
+        :param session: id of the producer session, the messages aren't stamped with sequence numbers if None
+        :param sequence: iterator of the sequence numbers, e.g. of a previous template of the datastream, a new
+            sequence starting at 1 is used if None
+        """
+        self.quantity = quantity
+        self.topic = topic
+        self.codec = codec
+        self.datastream = {"quantity": quantity, "client_app": client_name, "system": system_name}
+        if thing:
+            self.datastream["thing"] = thing
+        # the key is either the name of the observed "thing" or the "client-name" (for logging)
+        self.key = encode_key(thing or client_name)
+        self.identity_headers = [("system", system_name.encode("utf-8")), ("quantity", quantity.encode("utf-8"))]
+        if thing:
+            self.identity_headers.append(("thing", thing.encode("utf-8")))
+        # headers of the rendered messages
+        self.headers = self.identity_headers
+        self.header = b'","datastream":' + codec.encode(self.datastream) + b',"result":'
+        self.attributes = frozenset(additional_attributes or ())
+        self.session = ("session", session.encode("utf-8")) if session else None
+        self.sequence = sequence or itertools.count(1)
+
+    def next_sequence(self):
+        """Returns the next sequence number of the datastream as value of the header "seq"."""
+        return b"%d" % next(self.sequence)
+
+    def stamp(self):
+        """Returns the headers of the next message, i.e. the headers stamped with the session and the next sequence
+        number if a session is given."""
+        if self.session is None:
+            return self.headers
+        stamp = [self.session, ("seq", self.next_sequence())]
+        return self.headers + stamp if self.headers else stamp
+
+    def render(self, phenomenon_time, result_time, result, attributes=None):
+        """
+        Serializes a datapoint of the datastream.
+        :param phenomenon_time: ISO 8601 string of the phenomenonTime
+        :param result_time: ISO 8601 string of the resultTime
+        :param result: the actual value, can be boolean, integer, float, category or an object
+        :param attributes: dict of attributes, only the additional_attributes of the datastream are sent
+        :return: the message as bytes
+        """
+        parts = [b'{"phenomenonTime":"', phenomenon_time.encode(), b'","resultTime":"', result_time.encode(),
+                 self.header, self.codec.encode(result)]
+        if self.attributes:
+            parts.append(b',"attributes":')
+            parts.append(self.codec.encode(
+                {k: v for k, v in attributes.items() if k in self.attributes} if attributes else dict()))
+        parts.append(b'}')
+        return b"".join(parts)
+
+
+class RecordTemplate:
+    """Precompiled static parts of the record messages of a thing.
+
+    A record holds the results of several datastreams of the thing with a shared timestamp and shared attributes,
+    such that these are serialized and sent once:
+    {"phenomenonTime": ..., "resultTime": ..., "datastream": {...}, "results": {quantity: result, ...},
+     "attributes": {...}}
+    The datastream metadata lacks the quantity, the quantities are sent as repeated Kafka message headers "quantity".
+    Consumers expand a record into a datapoint per datastream. The sequence numbers of the datastreams are sent as
+    repeated headers "seq" in the same order.
+    """
+    __slots__ = ("topic", "key", "headers", "header", "codec", "session")
+
+    def __init__(self, topic, client_name, system_name, thing=None, codec=None, session=None):
+        """
+        :param topic: kafka topic the datastreams are produced to
+        :param client_name: name of the client application that produces the datastreams
+        :param system_name: name of the system the datastreams belong to
+        :param thing: name of the thing the datastreams belong to, the client_name is used as key if not given
+        :param codec: codec of the wire format, see client.codec
+        :param session: id of the producer session, the records aren't stamped with sequence numbers if None
+        """
+        self.topic = topic
+        self.codec = codec
+        datastream = {"client_app": client_name, "system": system_name}
+        if thing:
+            datastream["thing"] = thing
+        self.key = encode_key(thing or client_name)
+        self.headers = [("system", system_name.encode("utf-8"))]
+        if thing:
+            self.headers.append(("thing", thing.encode("utf-8")))
+        self.header = b'","datastream":' + codec.encode(datastream) + b',"results":'
+        self.session = ("session", session.encode("utf-8")) if session else None
+
+    def render(self, phenomenon_time, result_time, results, attributes=None, attribute_names=(), sequences=()):
+        """
+        Serializes a record of the thing.
+        :param phenomenon_time: ISO 8601 string of the phenomenonTime
+        :param result_time: ISO 8601 string of the resultTime
+        :param results: dict of the shortnames of the datastreams and their results
+        :param attributes: dict of attributes, only the attribute_names are sent
+        :param attribute_names: set of the additional_attributes of the datastreams of the record
+        :param sequences: sequence numbers of the datastreams in the order of the results, see
+            DatastreamTemplate.next_sequence
+        :return: tuple (value, headers) of the message with the value as bytes
+        """
+        parts = [b'{"phenomenonTime":"', phenomenon_time.encode(), b'","resultTime":"', result_time.encode(),
+                 self.header, self.codec.encode(results)]
+        if attribute_names:
+            parts.append(b',"attributes":')
+            parts.append(self.codec.encode(
+                {k: v for k, v in attributes.items() if k in attribute_names} if attributes else dict()))
+        parts.append(b'}')
+        headers = self.headers + [("quantity", quantity.encode("utf-8")) for quantity in results]
+        if self.session is not None and sequences:
+            headers.append(self.session)
+            headers.extend(("seq", sequence) for sequence in sequences)
+        return b"".join(parts), headers
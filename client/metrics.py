@@ -0,0 +1,224 @@
+import json
+import bisect
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# upper bounds of the latency buckets in seconds and of the batch size buckets in messages
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """Histogram with fixed buckets, like the Prometheus histogram type. Observing is a bisection on the bucket
+    bounds, such that it can be called for each message."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last bucket counts observations above all bounds
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket that contains the q-quantile, None if there are no observations."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = list()
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {"count": self.count,
+                "sum": self.sum,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99),
+                "buckets": buckets}
+
+
+class ClientMetrics:
+    """Counters and histograms of the Digital Twin Client, and the latest statistics reported by librdkafka.
+
+    The latencies of consume are measured per stage: polling a batch from librdkafka, decoding a message and
+    matching it against the subscriptions. Decoding and matching are timed for every sample_interval-th message
+    only, which keeps the overhead per message negligible.
+    """
+
+    def __init__(self, sample_interval=64):
+        """
+        :param sample_interval: the decode and match latencies are measured for each sample_interval-th message
+        """
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.counters = {"consumed": 0, "polls": 0, "invalid": 0, "delivery_failures": 0, "suppressed": 0,
+                         "send_errors": 0}
+        self.histograms = {"delivery_latency": Histogram(),
+                           "poll_latency": Histogram(),
+                           "decode_latency": Histogram(),
+                           "match_latency": Histogram(),
+                           "consume_batch_messages": Histogram(SIZE_BUCKETS)}
+        self.librdkafka = {"producer": None, "consumer": None}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def stats_callback(self, role):
+        """
+        Returns a callback for the librdkafka property stats_cb that keeps a summary of the statistics.
+        :param role: "producer" or "consumer"
+        :return: function that parses the JSON statistics of librdkafka
+        """
+        def stats_cb(stats_json):
+            try:
+                summary = self.summarize_stats(json.loads(stats_json))
+            except (ValueError, TypeError, KeyError, AttributeError):
+                return
+            with self.lock:
+                self.librdkafka[role] = summary
+        return stats_cb
+
+    @staticmethod
+    def summarize_stats(stats):
+        """
+        Extracts queue depths, round-trip times, batch sizes and consumer lag from the librdkafka statistics, see
+        https://github.com/edenhill/librdkafka/blob/master/STATISTICS.md
+        :param stats: the parsed statistics of librdkafka
+        :return: dictionary with the summarized statistics
+        """
+        summary = {"queued_messages": stats.get("msg_cnt", 0),
+                   "queued_bytes": stats.get("msg_size", 0),
+                   "tx_messages": stats.get("txmsgs", 0),
+                   "rx_messages": stats.get("rxmsgs", 0),
+                   "tx_bytes": stats.get("tx_bytes", 0),
+                   "rx_bytes": stats.get("rx_bytes", 0),
+                   "broker_rtt": dict(),
+                   "batch_size": dict(),
+                   "consumer_lag": dict()}
+        for broker in stats.get("brokers", dict()).values():
+            rtt = broker.get("rtt", dict())
+            if rtt.get("cnt"):
+                # librdkafka reports the round-trip times in microseconds
+                summary["broker_rtt"][broker["name"]] = {"avg": rtt["avg"] / 1e6, "p99": rtt.get("p99", 0) / 1e6}
+        for topic, topic_stats in stats.get("topics", dict()).items():
+            batchsize = topic_stats.get("batchsize", dict())
+            if batchsize.get("cnt"):
+                summary["batch_size"][topic] = batchsize["avg"]
+            for partition, partition_stats in topic_stats.get("partitions", dict()).items():
+                lag = partition_stats.get("consumer_lag", -1)
+                # the internal partition -1 and partitions without committed offsets don't report a lag
+                if partition != "-1" and lag >= 0:
+                    summary["consumer_lag"][f"{topic}/{partition}"] = lag
+        return summary
+
+    def snapshot(self):
+        """Returns a consistent copy of the counters, histograms and librdkafka statistics."""
+        with self.lock:
+            return {"counters": dict(self.counters),
+                    "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+                    "librdkafka": dict(self.librdkafka)}
+
+
+def to_prometheus_text(metrics, prefix="digital_twin_client", labels=None):
+    """
+    Formats a snapshot of DigitalTwinClient.metrics() in the Prometheus text exposition format.
+    :param metrics: the snapshot of DigitalTwinClient.metrics()
+    :param prefix: prefix of the metric names
+    :param labels: optional dictionary of labels added to each sample, e.g. the client and system name
+    :return: the metrics as string
+    """
+    def fmt(extra=None):
+        items = dict(labels or dict())
+        items.update(extra or dict())
+        if not items:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items.items()) + "}"
+
+    # each metric family has a single TYPE line followed by all of its samples, see
+    # https://prometheus.io/docs/instrumenting/exposition_formats/
+    lines = list()
+    for name, value in metrics["counters"].items():
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total{fmt()} {value}")
+    for name, value in metrics["gauges"].items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name}{fmt()} {value}")
+    for name, histogram in metrics["histograms"].items():
+        lines.append(f"# TYPE {prefix}_{name} histogram")
+        for bound, count in histogram["buckets"]:
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{prefix}_{name}_bucket{fmt({'le': le})} {count}")
+        lines.append(f"{prefix}_{name}_sum{fmt()} {histogram['sum']}")
+        lines.append(f"{prefix}_{name}_count{fmt()} {histogram['count']}")
+    # the samples of the producer and the consumer statistics are grouped into gauge families
+    families = dict()
+    for role, summary in metrics["librdkafka"].items():
+        if not summary:
+            continue
+        for name in ("queued_messages", "queued_bytes", "tx_messages", "rx_messages", "tx_bytes", "rx_bytes"):
+            families.setdefault(f"{prefix}_librdkafka_{name}", list()).append(
+                f"{prefix}_librdkafka_{name}{fmt({'role': role})} {summary[name]}")
+        for broker, rtt in summary["broker_rtt"].items():
+            families.setdefault(f"{prefix}_librdkafka_broker_rtt_seconds", list()).append(
+                f"{prefix}_librdkafka_broker_rtt_seconds{fmt({'role': role, 'broker': broker})} {rtt['avg']}")
+        for topic, size in summary["batch_size"].items():
+            families.setdefault(f"{prefix}_librdkafka_batch_size", list()).append(
+                f"{prefix}_librdkafka_batch_size{fmt({'role': role, 'topic': topic})} {size}")
+        for topic_partition, lag in summary["consumer_lag"].items():
+            topic, partition = topic_partition.rsplit("/", 1)
+            families.setdefault(f"{prefix}_consumer_lag", list()).append(
+                f"{prefix}_consumer_lag{fmt({'topic': topic, 'partition': partition})} {lag}")
+    for name, samples in families.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_prometheus(render, port=9100, address=""):
+    """
+    Serves the Prometheus metrics on http://address:port/metrics in a daemon thread.
+    :param render: function without arguments that returns the metrics in the Prometheus text format
+    :param port: port of the HTTP server
+    :param address: address the HTTP server binds to, all interfaces by default
+    :return: the HTTPServer, call its shutdown() method to stop it
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
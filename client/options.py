@@ -0,0 +1,115 @@
+class ProducerOptions:
+    """Options of the producer of a DigitalTwinClient, e.g.:
+
+        DigitalTwinClient(**CONFIG, producer_options=ProducerOptions(produce_mode="background", linger_ms=20))
+    """
+
+    def __init__(self, produce_mode="async", linger_ms=5, batch_num_messages=10000, max_in_flight=100000,
+                 sender_queue_size=100000, wire_format="json"):
+        """
+        :param produce_mode: "async" (default) queues messages in librdkafka and collects delivery reports
+            asynchronously, "sync" flushes the producer after each message and waits for its delivery report,
+            "background" hands datapoints over to a dedicated sender thread that serializes and batches them into the
+            producer and collects the delivery reports, such that producing is cheap and safe from any thread
+        :param linger_ms: time in ms librdkafka waits to batch messages before sending, default is 5
+        :param batch_num_messages: maximal number of messages batched in one request, default is 10000
+        :param max_in_flight: maximal number of produced but not yet delivered messages. If reached, produce blocks
+            until delivery reports were received, default is 100000
+        :param sender_queue_size: maximal number of datapoints and batches queued for the sender thread of the
+            "background" produce_mode. If reached, producing blocks until the sender thread caught up, default is
+            100000
+        :param wire_format: wire format of the produced datapoints, "json" (default), "binary" references the
+            datastreams by the ids assigned by the server in compact binary messages, and "auto" uses the wire format
+            of the system on the server. Datastreams without an id on the server are sent as JSON. The wire format of
+            consumed messages is detected automatically
+        """
+        if produce_mode not in ("async", "sync", "background"):
+            raise Exception(f"init: Invalid produce_mode '{produce_mode}', must be one of 'async', 'sync' or "
+                            f"'background'.")
+        if wire_format not in ("json", "binary", "auto"):
+            raise Exception(f"init: Invalid wire_format '{wire_format}', must be one of 'json', 'binary' or 'auto'.")
+        self.produce_mode = produce_mode
+        self.linger_ms = linger_ms
+        self.batch_num_messages = batch_num_messages
+        self.max_in_flight = max_in_flight
+        self.sender_queue_size = sender_queue_size
+        self.wire_format = wire_format
+
+
+class ConsumerOptions:
+    """Options of the consumer of a DigitalTwinClient, e.g.:
+
+        DigitalTwinClient(**CONFIG, consumer_options=ConsumerOptions(commit_mode="manual", adaptive_batching=True))
+
+    The fetch and queue options are passed to librdkafka, None uses the librdkafka default.
+    """
+
+    def __init__(self, consume_batch_size=100, adaptive_batching=False, commit_mode="auto", commit_interval=5.0,
+                 partition_targeting=False, fetch_min_bytes=None, fetch_wait_max_ms=None, queued_min_messages=None,
+                 queued_max_messages_kbytes=None):
+        """
+        :param consume_batch_size: maximal number of messages that are consumed at once, default is 100
+        :param adaptive_batching: grow or shrink the consume batch size from the observed throughput and poll
+            latency, starting at consume_batch_size, default is False
+        :param commit_mode: "auto" (default) commits the consumed offsets automatically, "manual" commits only
+            offsets that were acknowledged by the application via ack(), which gives at-least-once delivery
+        :param commit_interval: minimal interval in seconds between two asynchronous commits of the acknowledged
+            offsets in the "manual" commit_mode, default is 5.0
+        :param partition_targeting: consume only the partitions that hold the subscribed things, which are assigned
+            to this client instead of being balanced within its consumer group. Falls back to the group subscription
+            if a subscription has a wildcard thing, default is False
+        :param fetch_min_bytes: minimal number of bytes the broker responds with, see fetch.min.bytes
+        :param fetch_wait_max_ms: maximal time in ms the broker waits to fill fetch_min_bytes, see fetch.wait.max.ms
+        :param queued_min_messages: minimal number of messages per partition prefetched by librdkafka, see
+            queued.min.messages
+        :param queued_max_messages_kbytes: maximal size in kB of the prefetched messages, see
+            queued.max.messages.kbytes
+        """
+        if commit_mode not in ("auto", "manual"):
+            raise Exception(f"init: Invalid commit_mode '{commit_mode}', must be one of 'auto' or 'manual'.")
+        self.consume_batch_size = consume_batch_size
+        self.adaptive_batching = adaptive_batching
+        self.commit_mode = commit_mode
+        self.commit_interval = commit_interval
+        self.partition_targeting = partition_targeting
+        self.fetch_min_bytes = fetch_min_bytes
+        self.fetch_wait_max_ms = fetch_wait_max_ms
+        self.queued_min_messages = queued_min_messages
+        self.queued_max_messages_kbytes = queued_max_messages_kbytes
+
+    def librdkafka_config(self):
+        """Returns the librdkafka properties of the options that are set."""
+        conf = dict()
+        for key, value in (('fetch.min.bytes', self.fetch_min_bytes), ('fetch.wait.max.ms', self.fetch_wait_max_ms),
+                           ('queued.min.messages', self.queued_min_messages),
+                           ('queued.max.messages.kbytes', self.queued_max_messages_kbytes)):
+            if value is not None:
+                conf[key] = value
+        return conf
+
+
+class SpoolOptions:
+    """Options of the disk-backed spool of a DigitalTwinClient, e.g.:
+
+        DigitalTwinClient(**CONFIG, spool_options=SpoolOptions("/var/spool/machine_1"))
+
+    Messages are spooled while the brokers are unreachable or the in-flight window is above the watermark, and
+    replayed in order once the connection is back. Spooled messages survive restarts of the client.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20, segment_bytes=16 * 2 ** 20, watermark=None,
+                 replay_rate=1000):
+        """
+        :param directory: directory of the spool
+        :param max_bytes: maximal size of the spool, the oldest messages are evicted first if exceeded, default is
+            256 MiB
+        :param segment_bytes: size of a memory-mapped segment file of the spool, default is 16 MiB
+        :param watermark: number of in-flight messages above which further messages are spooled, default: None uses
+            the half of the max_in_flight of the ProducerOptions
+        :param replay_rate: maximal number of spooled messages that are replayed per second, default is 1000
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.watermark = watermark
+        self.replay_rate = replay_rate
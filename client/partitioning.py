@@ -0,0 +1,50 @@
+import zlib
+
+MASK = 0xffffffff
+
+
+def crc32_partition(key, num_partitions):
+    """
+    Partition of a key with the librdkafka partitioner "consistent_random", that is used by the producer.
+    :param key: key of the message as bytes
+    :param num_partitions: number of partitions of the topic
+    :return: partition of the key
+    """
+    return zlib.crc32(key) % num_partitions
+
+
+def murmur2(data):
+    """The 32-bit murmur2 hash of the Java Kafka client, as unsigned integer."""
+    m = 0x5bd1e995
+    length = len(data)
+    h = (0x9747b28c ^ length) & MASK
+    tail = length & ~3
+    for i in range(0, tail, 4):
+        k = int.from_bytes(data[i:i + 4], "little")
+        k = (k * m) & MASK
+        k ^= k >> 24
+        k = (k * m) & MASK
+        h = ((h * m) & MASK) ^ k
+    remaining = length & 3
+    if remaining == 3:
+        h ^= data[tail + 2] << 16
+    if remaining >= 2:
+        h ^= data[tail + 1] << 8
+    if remaining >= 1:
+        h ^= data[tail]
+        h = (h * m) & MASK
+    h ^= h >> 13
+    h = (h * m) & MASK
+    h ^= h >> 15
+    return h
+
+
+def murmur2_partition(key, num_partitions):
+    """
+    Partition of a key with the default partitioner of the Java Kafka client, that is used by the StreamHub apps
+    to forward messages into the external topics.
+    :param key: key of the message as bytes
+    :param num_partitions: number of partitions of the topic
+    :return: partition of the key
+    """
+    return (murmur2(key) & 0x7fffffff) % num_partitions
@@ -0,0 +1,86 @@
+class SequenceTracker:
+    """Detects lost, duplicated and reordered messages by the sequence numbers of their datastreams.
+
+    Producers stamp each message of a datastream with a monotonic sequence number starting at 1 and the id of their
+    session, see DatastreamTemplate.stamp, such that a restarted producer starts a new sequence. Per session and
+    datastream, the tracker keeps the highest sequence number and a bitmask of the missing sequence numbers within a
+    window below it, i.e. a few hundred bytes per datastream. Skipped sequence numbers are counted as gaps, and as
+    reordered if they arrive later within the window. Thus, gaps - reordered is the number of lost messages. A
+    sequence number that was already received is counted as duplicate, one further below the highest than the window
+    as reordered. The first sequence number of a datastream isn't checked, as consumers may start within a sequence.
+    """
+
+    def __init__(self, window=1024, max_streams=100000):
+        """
+        :param window: number of sequence numbers below the highest one whose reception is remembered
+        :param max_streams: maximal number of tracked sessions and datastreams, the tracker is reset if exceeded
+        """
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.max_streams = max_streams
+        # (session, datastream) -> [highest sequence number, bitmask of the missing ones below it], where bit k
+        # stands for the sequence number highest - 1 - k
+        self.streams = dict()
+        self.gaps = 0
+        self.duplicates = 0
+        self.reordered = 0
+
+    def __len__(self):
+        return len(self.streams)
+
+    def observe(self, key, sequence):
+        """
+        Checks the sequence number of a consumed message.
+        :param key: hashable identity of the producer session and the datastream
+        :param sequence: sequence number of the message
+        :return:
+        """
+        state = self.streams.get(key)
+        if state is None:
+            if len(self.streams) >= self.max_streams:
+                self.streams.clear()
+            self.streams[key] = [sequence, 0]
+            return
+        highest, missing = state
+        distance = sequence - highest
+        if distance == 1:
+            if missing:
+                state[1] = (missing << 1) & self.mask
+            state[0] = sequence
+        elif distance > 1:
+            self.gaps += distance - 1
+            if distance > self.window:
+                state[1] = self.mask
+            else:
+                state[1] = ((missing << distance) | ((1 << (distance - 1)) - 1)) & self.mask
+            state[0] = sequence
+        elif distance == 0:
+            self.duplicates += 1
+        elif -distance > self.window:
+            self.reordered += 1
+        else:
+            bit = 1 << (-distance - 1)
+            if missing & bit:
+                state[1] = missing ^ bit
+                self.reordered += 1
+            else:
+                self.duplicates += 1
+
+
+class SequenceRecorder:
+    """Records the sequence numbers observed by the decoder of a worker of the PartitionWorkerPool.
+
+    The recorded sequence numbers are checked by the SequenceTracker of the client, such that a single tracker sees
+    the sequences of all workers.
+    """
+
+    def __init__(self):
+        self.observed = list()
+
+    def observe(self, key, sequence):
+        self.observed.append((key, sequence))
+
+    def drain(self):
+        """Returns and clears the list of the recorded tuples (key, sequence)."""
+        observed, self.observed = self.observed, list()
+        return observed
@@ -0,0 +1,270 @@
+import os
+import mmap
+import zlib
+import struct
+import logging
+import threading
+
+
+class Segment:
+    """A memory-mapped, append-only segment file of the spool.
+
+    The file starts with a header of a magic number and the offset of the first frame that was not yet replayed.
+    Each frame consists of the payload length and its CRC32, followed by the payload. The pre-allocated file is
+    zero-filled, so a zero length marks the end of the written frames. Frames are written payload first, such that a
+    torn write leaves either no frame or a frame with an invalid CRC, which ends the segment on recovery.
+    """
+
+    MAGIC = b"DTS1"
+    HEADER = struct.Struct("<4sI")  # magic, read offset
+    FRAME = struct.Struct("<II")  # payload length, crc32 of the payload
+
+    def __init__(self, path, size=None):
+        """
+        :param path: path of the segment file
+        :param size: size of a new segment in bytes, an existing segment is opened and recovered if None
+        """
+        self.path = path
+        if size is not None:
+            with open(path, "wb") as f:
+                f.truncate(size)
+        self.file = open(path, "r+b")
+        self.size = os.path.getsize(path)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+        if size is not None:
+            self.mm[:self.HEADER.size] = self.HEADER.pack(self.MAGIC, self.HEADER.size)
+
+        magic, self.read_pos = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"Invalid spool segment '{path}'.")
+        # find the end of the written frames and count the frames that were not yet replayed
+        self.count = 0
+        self.write_pos = self.HEADER.size
+        while True:
+            frame_end = self.frame_end(self.write_pos)
+            if frame_end is None:
+                break
+            if self.write_pos >= self.read_pos:
+                self.count += 1
+            self.write_pos = frame_end
+        self.read_pos = min(self.read_pos, self.write_pos)
+
+    def frame_end(self, pos):
+        """Returns the position after the valid frame at pos, None if there is no valid frame."""
+        if pos + self.FRAME.size > self.size:
+            return None
+        length, crc = self.FRAME.unpack_from(self.mm, pos)
+        end = pos + self.FRAME.size + length
+        if length == 0 or end > self.size or zlib.crc32(self.mm[pos + self.FRAME.size:end]) != crc:
+            return None
+        return end
+
+    def append(self, payload):
+        """Appends a frame, returns False if the segment is full."""
+        end = self.write_pos + self.FRAME.size + len(payload)
+        if end > self.size:
+            return False
+        self.mm[self.write_pos + self.FRAME.size:end] = payload
+        self.mm[self.write_pos:self.write_pos + self.FRAME.size] = self.FRAME.pack(len(payload), zlib.crc32(payload))
+        self.write_pos = end
+        self.count += 1
+        return True
+
+    def read(self, pos):
+        """Returns the payload of the frame at pos and the position of the next frame."""
+        length, _ = self.FRAME.unpack_from(self.mm, pos)
+        start = pos + self.FRAME.size
+        return self.mm[start:start + length], start + length
+
+    def commit(self, pos, count):
+        """Persists that the frames before pos were replayed."""
+        self.read_pos = pos
+        self.count -= count
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, pos)
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class Spool:
+    """Durable store-and-forward spool for messages that can't be produced to Kafka.
+
+    The messages are appended to a log of memory-mapped segment files in the spool directory and replayed in order.
+    Replaying is two-phased: read() returns the next messages and commit() persists that they were delivered, such
+    that messages of a failed replay are read again by the next read(). If the total size exceeds max_bytes, the
+    oldest segment is evicted. Spooled messages survive restarts of the process.
+    """
+
+    RECORD = struct.Struct("<HiIH")  # length of the topic, the key (-1 for None) and the value, number of headers
+    HEADER = struct.Struct("<Hi")  # length of the name and the value (-1 for None) of a header
+
+    def __init__(self, directory, segment_bytes=16 * 2 ** 20, max_bytes=256 * 2 ** 20,
+                 logger_name="PR Client Logger"):
+        """
+        :param directory: directory of the segment files, is created if it doesn't exist
+        :param segment_bytes: size of a segment file in bytes, default is 16 MiB
+        :param max_bytes: maximal total size of the segment files, default is 256 MiB
+        :param logger_name: name of the logger for warnings on evicted messages
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max(max_bytes, segment_bytes)
+        self.logger = logging.getLogger(logger_name)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.closed = False
+        # cursor of the uncommitted reads in the oldest segment as (position, number of frames)
+        self.pending = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = list()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".spool"):
+                try:
+                    self.segments.append(Segment(os.path.join(directory, name)))
+                except ValueError as e:
+                    self.logger.warning(f"Spool: Skipping segment: {e}")
+        # replayed segments are only deleted once a newer one exists, remove them now
+        while self.segments and self.segments[0].count == 0:
+            self.remove_oldest()
+        if self.segments:
+            self.logger.info(f"Spool: Recovered {len(self)} spooled messages from '{directory}'.")
+
+    def __len__(self):
+        """Number of spooled messages that were not yet replayed."""
+        return sum(segment.count for segment in self.segments)
+
+    def __bool__(self):
+        return any(segment.count for segment in self.segments)
+
+    @property
+    def size(self):
+        return sum(segment.size for segment in self.segments)
+
+    def new_segment(self, min_size):
+        number = int(os.path.basename(self.segments[-1].path)[:-6]) + 1 if self.segments else 0
+        size = max(self.segment_bytes, min_size)
+        # evict the oldest segments to stay within max_bytes
+        while self.segments and self.size + size > self.max_bytes:
+            self.dropped += self.segments[0].count
+            self.logger.warning(f"Spool: Size limit exceeded, dropping {self.segments[0].count} oldest messages.")
+            self.remove_oldest()
+        self.segments.append(Segment(os.path.join(self.directory, "%012d.spool" % number), size))
+
+    def remove_oldest(self):
+        segment = self.segments.pop(0)
+        segment.close()
+        os.remove(segment.path)
+        # the uncommitted reads of an evicted segment are void
+        self.pending = None
+
+    def append(self, topic, key, value, headers=None):
+        """
+        Appends a message to the spool.
+        :param topic: Kafka topic of the message
+        :param key: key of the message as bytes or None
+        :param value: value of the message as bytes
+        :param headers: headers of the message as list of tuples (name, bytes) or None
+        :return:
+        """
+        topic = topic.encode("utf-8")
+        parts = [self.RECORD.pack(len(topic), -1 if key is None else len(key), len(value), len(headers or ())),
+                 topic, key or b"", value]
+        for name, header in headers or ():
+            name = name.encode("utf-8")
+            parts.extend((self.HEADER.pack(len(name), -1 if header is None else len(header)), name, header or b""))
+        payload = b"".join(parts)
+        with self.lock:
+            if self.closed:
+                # a new segment would overwrite the first one, as the closed segments aren't listed anymore
+                raise ValueError(f"Spool: Can't append to the closed spool '{self.directory}'.")
+            if not self.segments or not self.segments[-1].append(payload):
+                self.new_segment(Segment.HEADER.size + Segment.FRAME.size + len(payload))
+                self.segments[-1].append(payload)
+
+    def read(self, max_messages):
+        """
+        Reads the next messages in the order they were spooled, continuing after the previous uncommitted read.
+        :param max_messages: maximal number of messages
+        :return: list of tuples (topic, key, value, headers)
+        """
+        records = list()
+        with self.lock:
+            if self.pending is None:
+                while len(self.segments) > 1 and self.segments[0].count == 0:
+                    self.remove_oldest()
+            if not self.segments:
+                return records
+            # the uncommitted reads span only the oldest segment, such that commit() can delete it
+            segment = self.segments[0]
+            pos, count = self.pending or (segment.read_pos, 0)
+            while len(records) < max_messages and pos < segment.write_pos:
+                payload, pos = segment.read(pos)
+                records.append(self.unpack(payload))
+                count += 1
+            self.pending = (pos, count)
+        return records
+
+    def unpack(self, payload):
+        topic_length, key_length, value_length, num_headers = self.RECORD.unpack_from(payload, 0)
+        pos = self.RECORD.size
+        topic = payload[pos:pos + topic_length].decode("utf-8")
+        pos += topic_length
+        key = None
+        if key_length >= 0:
+            key = payload[pos:pos + key_length]
+            pos += key_length
+        value = payload[pos:pos + value_length]
+        pos += value_length
+        headers = None
+        if num_headers:
+            headers = list()
+            for _ in range(num_headers):
+                name_length, header_length = self.HEADER.unpack_from(payload, pos)
+                pos += self.HEADER.size
+                name = payload[pos:pos + name_length].decode("utf-8")
+                pos += name_length
+                header = None
+                if header_length >= 0:
+                    header = payload[pos:pos + header_length]
+                    pos += header_length
+                headers.append((name, header))
+        return topic, key, value, headers
+
+    def commit(self):
+        """Persists that the messages of the uncommitted reads were delivered, deletes replayed segments."""
+        with self.lock:
+            if self.pending is None:
+                return
+            pos, count = self.pending
+            self.pending = None
+            segment = self.segments[0]
+            segment.commit(pos, count)
+            # a fully replayed segment is deleted, the last one is kept to append further messages
+            if segment.count == 0 and pos >= segment.write_pos and len(self.segments) > 1:
+                self.remove_oldest()
+
+    def rewind(self):
+        """Discards the uncommitted reads, such that the messages are read again."""
+        with self.lock:
+            self.pending = None
+
+    def flush(self):
+        """Writes the memory-mapped segments to disk."""
+        with self.lock:
+            for segment in self.segments:
+                segment.flush()
+
+    def close(self):
+        """Closes the segment files, further messages can't be appended."""
+        with self.lock:
+            for segment in self.segments:
+                segment.flush()
+                segment.close()
+            self.segments = list()
+            self.closed = True
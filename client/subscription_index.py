@@ -0,0 +1,125 @@
+class SubscriptionIndex:
+    """Wildcard-aware index of the subscribed datastreams of a Digital Twin Client.
+
+    Each subscription is a global datastream identifier of the form
+    "domain.enterprise.work-center.station.thing.quantity" with "*" as optional placeholder for each level.
+    Subscriptions without placeholder are stored in a hash set, the others in a trie with one level per hierarchy
+    level. The results of the lookups are cached, such that each datastream is resolved only once. Lookups can also
+    be done with the encoded system, thing and quantity of the message headers, and with the thing only as prefilter.
+    """
+
+    LEVELS = 6
+    MAX_CACHE_SIZE = 100000
+
+    def __init__(self):
+        self.exact = set()
+        self.trie = dict()
+        self.things = set()
+        self.cache = dict()
+        self.encoded_cache = dict()
+
+    def __len__(self):
+        return len(self.exact) + self.count_wildcards()
+
+    def __getstate__(self):
+        # the cache is rebuilt lazily, e.g. after being sent to a worker process
+        state = self.__dict__.copy()
+        state["cache"] = dict()
+        state["encoded_cache"] = dict()
+        return state
+
+    def add(self, subscription):
+        """
+        Add a global datastream identifier to the index.
+        :param subscription: identifier of the form "domain.enterprise.work-center.station.thing.quantity"
+        :return:
+        """
+        levels = tuple(subscription.split("."))
+        if len(levels) != self.LEVELS:
+            raise ValueError(f"Invalid subscription '{subscription}': there must be {self.LEVELS} hierarchy levels.")
+        if "*" in levels:
+            node = self.trie
+            for level in levels:
+                node = node.setdefault(level, dict())
+        else:
+            self.exact.add(levels)
+        self.things.add(levels[4])
+        # previously resolved datastreams may be matched by the new subscription
+        self.cache.clear()
+        self.encoded_cache.clear()
+
+    def count_wildcards(self):
+        """Returns the number of subscriptions with placeholders."""
+        nodes = [self.trie]
+        for _ in range(self.LEVELS):
+            nodes = [child for node in nodes for child in node.values()]
+        return len(nodes)
+
+    def match(self, system, thing, quantity):
+        """
+        Check whether a datastream is subscribed.
+        :param system: name of the system the datastream belongs to, e.g. "at.srfg.MachineFleet.Machine1"
+        :param thing: name of the thing of the datastream
+        :param quantity: shortname of the datastream
+        :return: True if at least one subscription matches the datastream, False otherwise
+        """
+        key = (system, thing, quantity)
+        matched = self.cache.get(key)
+        if matched is None:
+            if len(self.cache) >= self.MAX_CACHE_SIZE:
+                self.cache.clear()
+            matched = self.cache[key] = self._match(key)
+        return matched
+
+    def match_encoded(self, system, thing, quantity):
+        """
+        Check whether a datastream is subscribed, like match but with the UTF-8 encoded names of the message headers.
+        :param system: encoded name of the system the datastream belongs to
+        :param thing: encoded name of the thing of the datastream, or None
+        :param quantity: encoded shortname of the datastream
+        :return: True if at least one subscription matches the datastream, False otherwise
+        """
+        key = (system, thing, quantity)
+        matched = self.encoded_cache.get(key)
+        if matched is None:
+            if len(self.encoded_cache) >= self.MAX_CACHE_SIZE:
+                self.encoded_cache.clear()
+            try:
+                matched = self.match(system.decode("utf-8"), thing.decode("utf-8") if thing is not None else None,
+                                     quantity.decode("utf-8"))
+            except UnicodeDecodeError:
+                matched = False
+            self.encoded_cache[key] = matched
+        return matched
+
+    def match_thing(self, thing):
+        """Check whether at least one subscription may match a datastream of the thing, regardless of the system
+        and quantity."""
+        return thing in self.things or "*" in self.things
+
+    def _match(self, key):
+        system, thing, quantity = key
+        if not isinstance(system, str):
+            return False
+        levels = tuple(system.split(".")) + (thing, quantity)
+        if len(levels) != self.LEVELS:
+            return False
+        if levels in self.exact:
+            return True
+
+        # walk through the trie, following both the exact level and the placeholder
+        nodes = [self.trie]
+        for level in levels:
+            next_nodes = list()
+            for node in nodes:
+                child = node.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                if level != "*":
+                    child = node.get("*")
+                    if child is not None:
+                        next_nodes.append(child)
+            if not next_nodes:
+                return False
+            nodes = next_nodes
+        return True
@@ -0,0 +1,37 @@
+try:
+    from .adaptive_batching import AdaptiveBatchSizer
+except ImportError:
+    from client.adaptive_batching import AdaptiveBatchSizer
+
+
+def test_full_batches_within_target_latency_grow():
+    sizer = AdaptiveBatchSizer(initial=100, maximum=1000, target_latency=0.05)
+    assert sizer.update(100, 100, 0.01) == 200
+    assert sizer.update(200, 200, 0.01) == 400
+    for _ in range(5):
+        sizer.update(sizer.size, sizer.size, 0.01)
+    assert sizer.size == 1000
+
+
+def test_full_batch_above_target_latency_shrinks():
+    sizer = AdaptiveBatchSizer(initial=1000, target_latency=0.05, smoothing=1.0)
+    # 1000 messages in 0.1 s, i.e. 500 messages fit into the target latency
+    assert sizer.update(1000, 1000, 0.1) == 500
+    assert sizer.throughput == 10000
+
+
+def test_partial_batch_shrinks():
+    sizer = AdaptiveBatchSizer(initial=1000, minimum=10)
+    assert sizer.update(100, 1000, 1.0) == 600
+    assert sizer.update(0, 600, 1.0) == 300
+    for _ in range(10):
+        sizer.update(0, sizer.size, 1.0)
+    assert sizer.size == 10
+
+
+def test_capped_request_does_not_grow():
+    sizer = AdaptiveBatchSizer(initial=100, maximum=10000)
+    for _ in range(10):
+        assert sizer.update(5, 5, 0.001) == 100
+    # a capped request that isn't filled still shows that the queue is drained
+    assert sizer.update(2, 5, 1.0) == 52
@@ -0,0 +1,64 @@
+import pytest
+
+try:
+    from .aggregation import WindowAggregator
+except ImportError:
+    from client.aggregation import WindowAggregator
+
+S = 1000000  # microseconds of a second
+START = 1600000000 * S
+
+
+def test_windows_are_closed_by_a_later_sample():
+    aggregator = WindowAggregator(window=10, percentiles=[50, 99.9])
+    for i in range(10):
+        assert aggregator.add(float(i), START + i * S, {"unit": "C"}) is None
+    window_start, mean, attributes = aggregator.add(100.0, START + 25 * S)
+    assert window_start == START
+    assert mean == 4.5
+    assert attributes == {"unit": "C", "aggregation": {"count": 10, "min": 0.0, "max": 9.0, "mean": 4.5,
+                                                       "last": 9.0, "p50": 4.5, "p99.9": pytest.approx(8.991)}}
+    window_start, mean, attributes = aggregator.flush()
+    assert window_start == START + 20 * S
+    assert mean == 100.0
+    assert attributes == {"aggregation": {"count": 1, "min": 100.0, "max": 100.0, "mean": 100.0, "last": 100.0,
+                                          "p50": 100.0, "p99.9": 100.0}}
+    assert aggregator.flush() is None
+
+
+def test_windows_are_aligned_to_the_epoch():
+    aggregator = WindowAggregator(window=0.5)
+    aggregator.add(1, START + S // 4)
+    window_start, _, _ = aggregator.add(2, START + S // 2)
+    assert window_start == START
+    assert aggregator.flush()[0] == START + S // 2
+
+
+def test_late_samples_are_added_to_the_current_window():
+    aggregator = WindowAggregator(window=10)
+    aggregator.add(1, START + 10 * S)
+    assert aggregator.add(3, START) is None
+    window_start, mean, attributes = aggregator.flush()
+    assert window_start == START + 10 * S
+    assert mean == 2
+    assert attributes["aggregation"]["last"] == 3
+
+
+def test_percentile():
+    ordered = [1.0, 2.0, 3.0, 4.0]
+    assert WindowAggregator.percentile(ordered, 0) == 1.0
+    assert WindowAggregator.percentile(ordered, 50) == 2.5
+    assert WindowAggregator.percentile(ordered, 100) == 4.0
+    assert WindowAggregator.percentile([5.0], 95) == 5.0
+
+
+def test_invalid_configs_and_results():
+    assert WindowAggregator.from_config({"window": 10, "percentiles": [95]}).window_us == 10 * S
+    for config in ({"percentiles": [95]}, {"window": 0}, {"window": 10, "percentiles": [101]},
+                   {"window": 10, "size": 1}, 10):
+        with pytest.raises(ValueError):
+            WindowAggregator.from_config(config)
+    with pytest.raises(ValueError):
+        WindowAggregator(window=10).add(True, START)
+    with pytest.raises(ValueError):
+        WindowAggregator(window=10).add("1", START)
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+try:
+    from .blocks import MAGIC, Block, decode_binary, pack_array, render_block, unpack_array
+    from .codec import JsonCodec
+    from .message_decoder import MessageDecoder
+    from .message_template import DatastreamTemplate
+    from .subscription_index import SubscriptionIndex
+except ImportError:
+    from client.blocks import MAGIC, Block, decode_binary, pack_array, render_block, unpack_array
+    from client.codec import JsonCodec
+    from client.message_decoder import MessageDecoder
+    from client.message_template import DatastreamTemplate
+    from client.subscription_index import SubscriptionIndex
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+TOPIC = SYSTEM + ".int"
+TIME = "2020-09-13T12:26:40.000000+00:00"
+TIME_US = 1600000000000000
+
+
+def make_template(additional_attributes=None):
+    return DatastreamTemplate("vibration", TOPIC, "machine_1", SYSTEM, thing="machine",
+                              additional_attributes=additional_attributes, codec=JsonCodec)
+
+
+def decode(value):
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.vibration")
+    return MessageDecoder(index, JsonCodec).decode(value, TOPIC, 0, on_error="break", expand_blocks=False)
+
+
+@pytest.mark.parametrize("encoding", ["base64", "binary"])
+@pytest.mark.parametrize("dtype", ["float64", "float32", "int64"])
+def test_round_trip_of_a_fixed_interval(encoding, dtype):
+    value = render_block(JsonCodec, make_template(), TIME, TIME, [1, 2, 3, 4], dtype=dtype, interval=0.001,
+                         encoding=encoding)
+    assert value.startswith(MAGIC) == (encoding == "binary")
+    block, = decode(value)
+    assert isinstance(block, Block)
+    assert (block.system, block.thing, block.quantity, block.dtype) == (SYSTEM, "machine", "vibration", dtype)
+    assert list(block.results) == [1, 2, 3, 4]
+    assert list(block.times_us) == [TIME_US, TIME_US + 1000, TIME_US + 2000, TIME_US + 3000]
+
+
+@pytest.mark.parametrize("encoding", ["base64", "binary"])
+def test_round_trip_of_irregular_sample_times(encoding):
+    sample_times = [TIME_US + 5, TIME_US + 10, TIME_US + 1000000]
+    value = render_block(JsonCodec, make_template(["unit"]), TIME, TIME, [0.5, -1.5, 2.25],
+                         sample_times=sample_times, attributes={"unit": "g", "other": 1}, encoding=encoding)
+    block, = decode(value)
+    assert list(block.times_us) == sample_times
+    assert list(block.results) == [0.5, -1.5, 2.25]
+    assert block.attributes == {"unit": "g"}
+
+    datapoints = block.datapoints()
+    assert [datapoint["result"] for datapoint in datapoints] == [0.5, -1.5, 2.25]
+    assert datapoints[2]["phenomenonTime"] == "2020-09-13T12:26:41.000000+00:00"
+    assert datapoints[0]["datastream"] == {"quantity": "vibration", "system": SYSTEM, "client_app": "machine_1",
+                                           "thing": "machine"}
+    assert datapoints[0]["attributes"] == {"unit": "g"}
+
+
+def test_base64_block_is_json():
+    value = render_block(JsonCodec, make_template(), TIME, TIME, [1.0], interval=1)
+    message = json.loads(value)
+    assert message["block"] == {"count": 1, "dtype": "float64", "interval": 1e6, "results": "AAAAAAAA8D8="}
+    assert "attributes" not in message
+
+
+def test_binary_header_is_json_without_the_arrays():
+    value = render_block(JsonCodec, make_template(), TIME, TIME, [1.0, 2.0], sample_times=[TIME_US, TIME_US + 1],
+                         encoding="binary")
+    data = decode_binary(JsonCodec, value)
+    assert data["block"]["results"] == pack_array([1.0, 2.0], "float64")
+    assert list(unpack_array(data["block"]["deltas"], "int64")) == [0, 1]
+
+
+def test_numpy_arrays():
+    np = pytest.importorskip("numpy")
+    sample_times = np.array([TIME_US, TIME_US + 250], dtype="datetime64[us]")
+    value = render_block(JsonCodec, make_template(), TIME, TIME, np.array([1.5, 2.5], dtype="float32"),
+                         dtype="float32", sample_times=sample_times, encoding="binary")
+    block, = decode(value)
+    assert list(block.times_us) == [TIME_US, TIME_US + 250]
+    assert list(block.results) == [1.5, 2.5]
+
+
+def test_invalid_blocks():
+    template = make_template()
+    for kwargs in ({"interval": 1, "dtype": "int8"}, {"interval": 1, "encoding": "hex"}, {},
+                   {"interval": 1, "sample_times": [TIME_US]}, {"interval": 0}, {"sample_times": []}):
+        with pytest.raises(ValueError):
+            render_block(JsonCodec, template, TIME, TIME, [1.0], **kwargs)
+    message = json.loads(render_block(JsonCodec, template, TIME, TIME, [1.0, 2.0], interval=1))
+    message["block"]["count"] = 3
+    with pytest.raises(ValueError):
+        decode(json.dumps(message).encode("utf-8"))
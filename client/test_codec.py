@@ -0,0 +1,38 @@
+import json
+import math
+
+import pytest
+
+try:
+    from .codec import JsonCodec, OrjsonCodec, encode_key, get_codec
+    from .message_template import DatastreamTemplate
+except ImportError:
+    from client.codec import JsonCodec, OrjsonCodec, encode_key, get_codec
+    from client.message_template import DatastreamTemplate
+
+
+def test_keys_are_encoded_like_the_json_module():
+    for key in ("machine", "Maschine_Größe", "車両_1"):
+        assert encode_key(key) == json.dumps(key, separators=(',', ':')).encode("utf-8")
+    assert encode_key("Größe") == b'"Gr\\u00f6\\u00dfe"'
+
+
+@pytest.mark.parametrize("codec", [JsonCodec, OrjsonCodec])
+def test_template_key_does_not_depend_on_the_codec(codec):
+    if codec is OrjsonCodec and get_codec() is not OrjsonCodec:
+        pytest.skip("orjson is not installed")
+    template = DatastreamTemplate("temperature", "at.srfg.Fleet.Car1.int", "car_1", "at.srfg.Fleet.Car1",
+                                  thing="Größe", codec=codec)
+    assert template.key == encode_key("Größe")
+
+
+def test_round_trip():
+    data = {"phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": 1.5, "thing": "Größe"}
+    for codec in (JsonCodec, get_codec()):
+        assert codec.decode(codec.encode(data)) == data
+
+
+def test_orjson_writes_nan_as_null():
+    if get_codec() is not OrjsonCodec:
+        pytest.skip("orjson is not installed")
+    assert OrjsonCodec.decode(OrjsonCodec.encode({"result": math.nan})) == {"result": None}
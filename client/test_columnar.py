@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+try:
+    from .blocks import Block
+    from .columnar import ColumnarBatchBuilder
+    from .datapoint import Datapoint
+except ImportError:
+    from client.blocks import Block
+    from client.columnar import ColumnarBatchBuilder
+    from client.datapoint import Datapoint
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+TIME = "2020-09-13T12:26:40.000000+00:00"
+TIME_US = 1600000000000000
+
+
+def make_datapoint(quantity, result, phenomenon_time=TIME, thing="machine"):
+    return Datapoint.from_data({"phenomenonTime": phenomenon_time, "resultTime": TIME, "result": result,
+                                "datastream": {"system": SYSTEM, "thing": thing, "quantity": quantity},
+                                "topic": SYSTEM + ".int", "partition": 0})
+
+
+def test_rows_are_stored_in_columns():
+    builder = ColumnarBatchBuilder()
+    assert builder.append(make_datapoint("temperature", 20.5))
+    assert builder.append(make_datapoint("temperature", 21, "2020-09-13T12:26:41.000000+00:00"))
+    assert builder.append(make_datapoint("state", "on", thing="robot"))
+    assert builder.append(make_datapoint("state", True, thing="robot"))
+    assert not builder.append(make_datapoint("temperature", 22.0, None))
+    assert len(builder) == 4
+
+    batch = builder.build()
+    assert len(batch) == 4
+    assert batch.phenomenon_time.dtype == np.int64
+    assert batch.phenomenon_time.tolist() == [TIME_US * 1000, (TIME_US + 1000000) * 1000, TIME_US * 1000,
+                                              TIME_US * 1000]
+    assert batch.result[:2].tolist() == [20.5, 21.0]
+    assert np.isnan(batch.result[2:]).all()
+    assert batch.is_numeric.tolist() == [True, True, False, False]
+    assert batch.non_numeric == [(2, "on"), (3, True)]
+    assert batch.systems == [SYSTEM]
+    assert batch.things == ["machine", "robot"]
+    assert batch.quantities == ["temperature", "state"]
+    assert batch.thing_codes.tolist() == [0, 0, 1, 1]
+    assert batch.quantity_codes.tolist() == [0, 0, 1, 1]
+
+
+def test_select():
+    builder = ColumnarBatchBuilder()
+    for quantity, result in (("temperature", 20.0), ("state", 1), ("temperature", 21.0)):
+        builder.append(make_datapoint(quantity, result))
+    batch = builder.build()
+    assert batch.result[batch.select(quantity="temperature")].tolist() == [20.0, 21.0]
+    assert batch.select(system=SYSTEM, thing="machine").all()
+    assert not batch.select(quantity="unknown").any()
+
+
+def test_rows_and_blocks_keep_their_order():
+    block = Block({"phenomenonTime": TIME, "datastream": {"system": SYSTEM, "thing": "robot", "quantity": "angle"},
+                   "topic": SYSTEM + ".int", "partition": 0},
+                  {"count": 3, "dtype": "float64", "interval": 1000, "results": np.arange(3.0).tobytes()})
+    builder = ColumnarBatchBuilder()
+    builder.append(make_datapoint("temperature", 20.0))
+    builder.append_block(block)
+    builder.append(make_datapoint("temperature", 21.0))
+    batch = builder.build()
+    assert batch.result.tolist() == [20.0, 0.0, 1.0, 2.0, 21.0]
+    assert batch.phenomenon_time.tolist() == [TIME_US * 1000, TIME_US * 1000, (TIME_US + 1000) * 1000,
+                                              (TIME_US + 2000) * 1000, TIME_US * 1000]
+    assert batch.quantity_codes.tolist() == [0, 1, 1, 1, 0]
+    assert batch.is_numeric.all()
+
+
+def test_empty_batch():
+    batch = ColumnarBatchBuilder().build()
+    assert len(batch) == 0
+    assert batch.phenomenon_time.dtype == np.int64
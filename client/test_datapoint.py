@@ -0,0 +1,56 @@
+import pickle
+
+try:
+    from .codec import JsonCodec
+    from .datapoint import Datapoint
+except ImportError:
+    from client.codec import JsonCodec
+    from client.datapoint import Datapoint
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+VALUE = (b'{"phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": 1.5, '
+         b'"datastream": {"quantity": "temperature", "client_app": "machine_1", "system": "' + SYSTEM.encode() +
+         b'", "thing": "machine"}, "attributes": {"longitude": 1}}')
+
+
+def make_datapoint():
+    return Datapoint(SYSTEM, "machine", "temperature", SYSTEM + ".ext", 0, VALUE, JsonCodec)
+
+
+def test_lazy_datapoint_is_a_datapoint_dict():
+    datapoint = make_datapoint()
+    assert datapoint.to_dict() == {
+        "phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": 1.5, "attributes": {"longitude": 1},
+        "datastream": {"quantity": "temperature", "client_app": "machine_1", "system": SYSTEM, "thing": "machine"},
+        "partition": 0, "topic": SYSTEM + ".ext"}
+    assert datapoint.client_app == "machine_1"
+
+
+def test_datastream_modifications_are_kept():
+    datapoint = make_datapoint()
+    datapoint["datastream"]["unit"] = "degC"
+    assert datapoint["datastream"]["unit"] == "degC"
+    assert datapoint.to_dict()["datastream"]["unit"] == "degC"
+    # to_dict returns a copy
+    datapoint.to_dict()["datastream"]["unit"] = "K"
+    assert datapoint.datastream["unit"] == "degC"
+
+
+def test_assignment_and_deletion():
+    datapoint = make_datapoint()
+    datapoint["result"] = 2.5
+    datapoint["processed"] = True
+    del datapoint["attributes"]
+    assert datapoint.result == 2.5
+    assert datapoint["processed"] is True
+    assert "attributes" not in datapoint and datapoint.attributes is None
+    assert datapoint.quantity == "temperature"
+    assert pickle.loads(pickle.dumps(datapoint)).to_dict() == datapoint.to_dict()
+
+
+def test_from_data_and_pickle():
+    datapoint = Datapoint.from_data({"phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": "on",
+                                     "datastream": {"quantity": "state", "system": SYSTEM},
+                                     "partition": 1, "topic": SYSTEM + ".ext"})
+    assert datapoint.thing is None and "thing" not in datapoint.datastream
+    assert pickle.loads(pickle.dumps(datapoint)) == datapoint
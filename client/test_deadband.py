@@ -0,0 +1,49 @@
+import pytest
+
+try:
+    from .deadband import Deadband
+except ImportError:
+    from client.deadband import Deadband
+
+S = 1000000  # microseconds of a second
+
+
+def accepted(deadband, datapoints):
+    return [result for result, time_us in datapoints if deadband.accept(result, time_us)]
+
+
+def test_absolute_threshold():
+    deadband = Deadband(absolute=0.5)
+    assert accepted(deadband, [(20.0, 0), (20.4, S), (20.6, 2 * S), (20.2, 3 * S), (20.0, 4 * S)]) == [20.0, 20.6, 20.0]
+
+
+def test_relative_threshold():
+    deadband = Deadband(relative=0.1)
+    assert accepted(deadband, [(100, 0), (109, S), (111, 2 * S), (-1, 3 * S), (-1.05, 4 * S)]) == [100, 111, -1]
+
+
+def test_changes_without_thresholds_and_of_other_results():
+    assert accepted(Deadband(), [(1, 0), (1, S), (2, 2 * S), (2, 3 * S)]) == [1, 2]
+    assert accepted(Deadband(absolute=1), [("on", 0), ("on", S), ("off", 2 * S), (True, 3 * S), (True, 4 * S),
+                                           (1.5, 5 * S)]) == ["on", "off", True, 1.5]
+    nan = float("nan")
+    assert len(accepted(Deadband(absolute=1), [(1.0, 0), (nan, S), (nan, 2 * S), (1.0, 3 * S)])) == 3
+
+
+def test_heartbeat_and_min_interval():
+    deadband = Deadband(absolute=10, heartbeat=60, min_interval=1)
+    assert accepted(deadband, [(0, 0), (0, 30 * S), (0, 60 * S), (50, 60 * S + S // 2), (50, 120 * S),
+                               (100, 121 * S)]) == [0, 0, 50, 100]
+
+
+def test_out_of_order_datapoints_are_passed_through():
+    deadband = Deadband(absolute=1)
+    assert accepted(deadband, [(0, 10 * S), (0, 5 * S), (0, 6 * S)]) == [0, 0]
+
+
+def test_from_config():
+    deadband = Deadband.from_config({"absolute": 0.5, "heartbeat": 60})
+    assert deadband.absolute == 0.5 and deadband.heartbeat_us == 60 * S
+    for config in ({"absolut": 0.5}, [0.5], {"absolute": -1}, {"heartbeat": "60"}):
+        with pytest.raises(ValueError):
+            Deadband.from_config(config)
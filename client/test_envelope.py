@@ -0,0 +1,93 @@
+import pickle
+
+import pytest
+
+try:
+    from . import envelope
+    from .codec import JsonCodec
+    from .envelope import DatastreamRegistry, EnvelopeTemplate, decode_envelope, render_envelope, validate_envelope
+    from .message_decoder import MessageDecoder
+    from .subscription_index import SubscriptionIndex
+except ImportError:
+    from client import envelope
+    from client.codec import JsonCodec
+    from client.envelope import DatastreamRegistry, EnvelopeTemplate, decode_envelope, render_envelope, \
+        validate_envelope
+    from client.message_decoder import MessageDecoder
+    from client.subscription_index import SubscriptionIndex
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+TOPIC = SYSTEM + ".int"
+TIME = "2020-09-13T12:26:40.000000+00:00"
+TIME_US = 1600000000000000
+RESPONSE = {"wire_format": "binary", "datastreams": [
+    {"id": 7, "system_name": SYSTEM, "thing_name": "machine", "shortname": "temperature", "client_name": "machine_1"},
+    {"id": 8, "system_name": SYSTEM, "thing_name": None, "shortname": "state", "client_name": "machine_1"}]}
+
+
+@pytest.mark.parametrize("result", [20.5, -3, 0, 2 ** 63 - 1, 2 ** 63, True, False, None, "on", [1, 2],
+                                    {"x": 1.5}])
+@pytest.mark.parametrize("attributes", [None, {"unit": "C"}])
+def test_round_trip(result, attributes):
+    value = render_envelope(JsonCodec, 7, TIME_US, TIME_US + 1, result, attributes)
+    assert value.startswith(envelope.MAGIC)
+    assert envelope.datastream_id(value) == 7
+    validate_envelope(value)
+    data = decode_envelope(JsonCodec, value)
+    assert data.pop("attributes", None) == attributes
+    assert data == {"phenomenonTime": TIME, "resultTime": "2020-09-13T12:26:40.000001+00:00", "result": result}
+    assert type(data["result"]) is type(result)
+
+
+def test_invalid_envelopes():
+    value = render_envelope(JsonCodec, 7, TIME_US, TIME_US, "on")
+    for invalid in (value[:10], value[:-1], value[:envelope.HEADER.size - 1] + b"\x09"):
+        with pytest.raises(ValueError):
+            validate_envelope(invalid)
+        with pytest.raises(ValueError):
+            decode_envelope(JsonCodec, invalid)
+    with pytest.raises(ValueError):
+        validate_envelope(render_envelope(JsonCodec, 7, TIME_US, TIME_US, 1.5)[:-1])
+
+
+def test_template_sends_the_additional_attributes_only():
+    template = EnvelopeTemplate(7, "temperature", TOPIC, "machine_1", SYSTEM, thing="machine",
+                                additional_attributes=["unit"], codec=JsonCodec)
+    assert template.headers is None
+    value = template.render(TIME, TIME, 20.5, {"unit": "C", "other": 1})
+    assert decode_envelope(JsonCodec, value) == {"phenomenonTime": TIME, "resultTime": TIME, "result": 20.5,
+                                                 "attributes": {"unit": "C"}}
+
+
+def test_registry():
+    loads = list()
+
+    def loader():
+        loads.append(1)
+        return RESPONSE
+
+    registry = DatastreamRegistry(JsonCodec, loader, refresh_interval=3600)
+    assert registry.resolve(7)[:3] == (SYSTEM, "machine", "temperature")
+    assert registry.resolve(8)[:3] == (SYSTEM, None, "state")
+    assert registry.lookup(SYSTEM, "machine", "temperature") == 7
+    assert registry.wire_format == "binary"
+    # unknown ids reload the mapping at most once per refresh interval
+    assert registry.resolve(9) is None
+    assert len(loads) == 1
+    assert len(pickle.loads(pickle.dumps(registry))) == 2
+
+
+def test_decoded_datapoint():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.temperature")
+    registry = DatastreamRegistry(JsonCodec)
+    registry.update(RESPONSE)
+    decoder = MessageDecoder(index, JsonCodec, registry=registry)
+    datapoint, = decoder.decode(render_envelope(JsonCodec, 7, TIME_US, TIME_US, 20.5, {"unit": "C"}), TOPIC, 3)
+    assert datapoint.to_dict() == {
+        "phenomenonTime": TIME, "resultTime": TIME, "result": 20.5, "attributes": {"unit": "C"}, "partition": 3,
+        "topic": TOPIC, "datastream": {"system": SYSTEM, "thing": "machine", "quantity": "temperature",
+                                       "client_app": "machine_1"}}
+    assert decoder.decode(render_envelope(JsonCodec, 8, TIME_US, TIME_US, "on"), TOPIC, 3) == []
+    assert decoder.decode(render_envelope(JsonCodec, 9, TIME_US, TIME_US, "on"), TOPIC, 3) == []
+    assert decoder.invalid_count == 1
@@ -0,0 +1,74 @@
+import json
+
+try:
+    from .codec import JsonCodec
+    from .message_decoder import MessageDecoder
+    from .message_template import RecordTemplate
+    from .sequence_tracker import SequenceTracker
+    from .subscription_index import SubscriptionIndex
+except ImportError:
+    from client.codec import JsonCodec
+    from client.message_decoder import MessageDecoder
+    from client.message_template import RecordTemplate
+    from client.sequence_tracker import SequenceTracker
+    from client.subscription_index import SubscriptionIndex
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+TOPIC = SYSTEM + ".ext"
+SESSION = "0123456789abcdef"
+
+
+def make_decoder():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.temperature")
+    index.add(SYSTEM + ".machine.acceleration")
+    return MessageDecoder(index, JsonCodec, tracker=SequenceTracker())
+
+
+def expand_like_streamhub(value):
+    """Expands a record into a datapoint per datastream like the StreamHub, see Semantics.expandRecord."""
+    record = json.loads(value)
+    results = record.pop("results")
+    for quantity, result in results.items():
+        datapoint = json.loads(json.dumps(record))
+        datapoint["datastream"]["quantity"] = quantity
+        datapoint["result"] = result
+        yield json.dumps(datapoint).encode("utf-8")
+
+
+def test_expanded_record_with_copied_headers():
+    decoder = make_decoder()
+    template = RecordTemplate(SYSTEM + ".int", "machine_1", SYSTEM, thing="machine", codec=JsonCodec,
+                              session=SESSION)
+    for sequence in range(1, 4):
+        value, headers = template.render("2020-09-13T12:26:40.000000+00:00", "2020-09-13T12:26:40.000000+00:00",
+                                         {"temperature": 20.0 + sequence, "acceleration": sequence}, None, (),
+                                         [b"%d" % sequence, b"%d" % sequence])
+        # Kafka Streams copies the headers of the record onto each expanded datapoint
+        for datapoint in expand_like_streamhub(value):
+            assert len(decoder.decode(datapoint, TOPIC, 0, on_error="break", headers=headers)) == 1
+    tracker = decoder.tracker
+    assert (tracker.gaps, tracker.duplicates, tracker.reordered) == (0, 0, 0)
+    assert sorted(state[0] for state in tracker.streams.values()) == [3, 3]
+
+
+def test_converted_envelope_without_identity_headers():
+    decoder = make_decoder()
+    for sequence in (1, 2, 4):
+        value = json.dumps({"phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": 1.0,
+                            "datastream": {"quantity": "temperature", "system": SYSTEM, "thing": "machine"}})
+        headers = [("session", SESSION.encode("utf-8")), ("seq", b"%d" % sequence)]
+        assert len(decoder.decode(value.encode("utf-8"), TOPIC, 0, on_error="break", headers=headers)) == 1
+    tracker = decoder.tracker
+    assert (tracker.gaps, tracker.duplicates, tracker.reordered) == (1, 0, 0)
+
+
+def test_invalid_payload_with_identity_headers_is_ignored():
+    decoder = make_decoder()
+    headers = [("system", SYSTEM.encode("utf-8")), ("quantity", b"temperature"), ("thing", b"machine")]
+    for value in (b'{"phenomenonTime": "2020-09-13T12:26:40', b"[1, 2]", b"not json"):
+        assert decoder.decode(value, TOPIC, 0, on_error="ignore", headers=headers) == []
+    assert decoder.invalid_count == 3
+    value = b'{"phenomenonTime": "2020-09-13T12:26:40.000000+00:00", "result": 1.5}'
+    datapoints = decoder.decode(value, TOPIC, 0, on_error="ignore", headers=headers)
+    assert [datapoint.result for datapoint in datapoints] == [1.5]
@@ -0,0 +1,58 @@
+import json
+
+try:
+    from .metrics import ClientMetrics, to_prometheus_text
+except ImportError:
+    from client.metrics import ClientMetrics, to_prometheus_text
+
+STATS = {"msg_cnt": 3, "msg_size": 300, "txmsgs": 10, "rxmsgs": 0, "tx_bytes": 1000, "rx_bytes": 0,
+         "brokers": {"localhost:9092/1": {"name": "localhost:9092/1", "rtt": {"cnt": 2, "avg": 1500, "p99": 3000}}},
+         "topics": {"at.srfg.MachineFleet.Machine1.int": {
+             "batchsize": {"cnt": 1, "avg": 120},
+             "partitions": {"0": {"consumer_lag": 5}, "-1": {"consumer_lag": -1}}}}}
+
+
+def make_snapshot():
+    """Returns a snapshot with the counters, gauges and histograms of DigitalTwinClient.metrics()."""
+    statistics = ClientMetrics()
+    statistics.observe("poll_latency", 0.002)
+    statistics.observe("consume_batch_messages", 100)
+    statistics.stats_callback("producer")(json.dumps(STATS))
+    statistics.stats_callback("consumer")(json.dumps(STATS))
+    snapshot = statistics.snapshot()
+    snapshot["counters"].update({"produced": 10, "delivered": 9, "filtered": 0, "decoded": 5, "matched": 5})
+    snapshot["gauges"] = {"in_flight": 1, "sender_queue": 0, "consume_batch_target": 100, "sequence_streams": 2}
+    return snapshot
+
+
+def parse_families(text):
+    """Returns the metric families of a Prometheus text as list of (name, type, sample names)."""
+    families = list()
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            families.append((name, kind, list()))
+        elif line:
+            assert families, f"Sample without TYPE line: {line}"
+            families[-1][2].append(line.split("{")[0].split(" ")[0])
+    return families
+
+
+def test_metric_families_are_unique():
+    families = parse_families(to_prometheus_text(make_snapshot(), labels={"client": "machine_1"}))
+    names = [name for name, _, _ in families]
+    assert len(names) == len(set(names))
+    for name, kind, samples in families:
+        assert samples, f"Metric family {name} has no samples"
+        suffixes = ("_bucket", "_sum", "_count") if kind == "histogram" else ("",)
+        for sample in samples:
+            assert any(sample == name + suffix for suffix in suffixes), f"Sample {sample} isn't of family {name}"
+
+
+def test_librdkafka_samples_have_types():
+    families = {name: kind for name, kind, _ in parse_families(to_prometheus_text(make_snapshot()))}
+    assert families["digital_twin_client_librdkafka_queued_messages"] == "gauge"
+    assert families["digital_twin_client_librdkafka_broker_rtt_seconds"] == "gauge"
+    assert families["digital_twin_client_consumer_lag"] == "gauge"
+    assert families["digital_twin_client_consume_batch_target"] == "gauge"
+    assert families["digital_twin_client_consume_batch_messages"] == "histogram"
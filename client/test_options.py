@@ -0,0 +1,31 @@
+import pytest
+
+try:
+    from .options import ConsumerOptions, ProducerOptions, SpoolOptions
+except ImportError:
+    from client.options import ConsumerOptions, ProducerOptions, SpoolOptions
+
+
+def test_defaults():
+    producer_options = ProducerOptions()
+    assert (producer_options.produce_mode, producer_options.wire_format) == ("async", "json")
+    consumer_options = ConsumerOptions()
+    assert (consumer_options.consume_batch_size, consumer_options.commit_mode) == (100, "auto")
+    assert consumer_options.librdkafka_config() == {}
+    spool_options = SpoolOptions("/tmp/spool")
+    assert spool_options.watermark is None
+
+
+def test_librdkafka_config_of_the_set_options():
+    assert ConsumerOptions(fetch_min_bytes=65536, queued_max_messages_kbytes=0).librdkafka_config() == {
+        "fetch.min.bytes": 65536, "queued.max.messages.kbytes": 0}
+
+
+@pytest.mark.parametrize("options, kwargs", [
+    (ProducerOptions, {"produce_mode": "batch"}),
+    (ProducerOptions, {"wire_format": "avro"}),
+    (ConsumerOptions, {"commit_mode": "sync"}),
+])
+def test_invalid_options(options, kwargs):
+    with pytest.raises(Exception):
+        options(**kwargs)
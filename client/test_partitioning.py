@@ -0,0 +1,42 @@
+import zlib
+
+import pytest
+
+try:
+    from .codec import encode_key
+    from .partitioning import crc32_partition, murmur2, murmur2_partition
+except ImportError:
+    from client.codec import encode_key
+    from client.partitioning import crc32_partition, murmur2, murmur2_partition
+
+
+# signed hashes of the murmur2 test of the Java Kafka client
+@pytest.mark.parametrize("key, expected", [
+    (b"21", -973932308),
+    (b"foobar", -790332482),
+    (b"a-little-bit-long-string", -985981536),
+    (b"a-little-bit-longer-string", -1486304829),
+    (b"lkjh234lh9fiuh90y23oiuhsafujhadof229phr9h19h89h8", -58897971),
+    (b"abc", 479470107),
+])
+def test_murmur2_equals_the_java_client(key, expected):
+    assert murmur2(key) == expected & 0xffffffff
+
+
+def test_murmur2_partition():
+    for key in (b"", b"21", b"foobar", encode_key("machine"), encode_key("at.srfg.MachineFleet.Machine1")):
+        for num_partitions in (1, 3, 12):
+            partition = murmur2_partition(key, num_partitions)
+            assert partition == (murmur2(key) & 0x7fffffff) % num_partitions
+            assert 0 <= partition < num_partitions
+    # the sign bit of the hash is masked, not taken as absolute value
+    assert murmur2(b"21") >= 2 ** 31
+    assert murmur2_partition(b"21", 1000) == (-973932308 & 0x7fffffff) % 1000
+
+
+def test_crc32_partition():
+    for key in (b"", encode_key("machine"), encode_key("robot")):
+        for num_partitions in (1, 3, 12):
+            assert crc32_partition(key, num_partitions) == zlib.crc32(key) % num_partitions
+    # check value of CRC-32/ISO-HDLC, which librdkafka uses as well
+    assert crc32_partition(b"123456789", 1000) == 0xcbf43926 % 1000
@@ -0,0 +1,70 @@
+try:
+    from .sequence_tracker import SequenceRecorder, SequenceTracker
+except ImportError:
+    from client.sequence_tracker import SequenceRecorder, SequenceTracker
+
+KEY = ("0123456789abcdef", ("at.srfg.MachineFleet.Machine1", "machine", "temperature"))
+
+
+def observe(tracker, sequences, key=KEY):
+    for sequence in sequences:
+        tracker.observe(key, sequence)
+    return tracker.gaps, tracker.duplicates, tracker.reordered
+
+
+def test_consecutive_sequence():
+    tracker = SequenceTracker()
+    # the first sequence number isn't checked, as consumers may start within a sequence
+    assert observe(tracker, range(42, 100)) == (0, 0, 0)
+    assert tracker.streams[KEY] == [99, 0]
+
+
+def test_lost_messages_are_gaps():
+    tracker = SequenceTracker()
+    assert observe(tracker, [1, 2, 5, 6, 10]) == (5, 0, 0)
+
+
+def test_reordered_messages():
+    tracker = SequenceTracker()
+    assert observe(tracker, [1, 3, 2, 6, 4, 7, 5]) == (3, 0, 3)
+    assert tracker.streams[KEY] == [7, 0]
+    # gaps - reordered is the number of lost messages
+    assert observe(tracker, [9, 10, 12]) == (5, 0, 3)
+
+
+def test_duplicated_messages():
+    tracker = SequenceTracker()
+    assert observe(tracker, [1, 2, 2, 3, 1, 5, 4, 4]) == (1, 3, 1)
+
+
+def test_window():
+    tracker = SequenceTracker(window=8)
+    assert observe(tracker, [1, 20]) == (18, 0, 0)
+    # within the window only the missing ones are reordered
+    assert observe(tracker, [19, 19, 12]) == (18, 1, 2)
+    # below the window, messages are assumed to be reordered
+    assert observe(tracker, [11, 2]) == (18, 1, 4)
+    assert observe(tracker, [21] + list(range(30, 39))) == (26, 1, 4)
+    # even duplicates, as their reception isn't remembered
+    assert observe(tracker, [29, 22, 21]) == (26, 1, 7)
+
+
+def test_streams_are_tracked_separately():
+    tracker = SequenceTracker(max_streams=2)
+    other = ("fedcba9876543210", KEY[1])
+    observe(tracker, [1, 2])
+    observe(tracker, [7, 8], other)
+    assert len(tracker) == 2
+    assert (tracker.gaps, tracker.duplicates, tracker.reordered) == (0, 0, 0)
+    # exceeding max_streams resets the tracker
+    tracker.observe(("session", KEY[1]), 1)
+    assert len(tracker) == 1
+    assert observe(tracker, [5]) == (0, 0, 0)
+
+
+def test_recorder():
+    recorder = SequenceRecorder()
+    recorder.observe(KEY, 1)
+    recorder.observe(KEY, 3)
+    assert recorder.drain() == [(KEY, 1), (KEY, 3)]
+    assert recorder.drain() == []
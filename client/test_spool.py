@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+try:
+    from .spool import Segment, Spool
+except ImportError:
+    from client.spool import Segment, Spool
+
+TOPIC = "at.srfg.MachineFleet.Machine1.int"
+
+
+def message(i):
+    return TOPIC, b'"machine"', b'{"result": %d}' % i, [("quantity", b"temperature"), ("empty", None)]
+
+
+def test_read_commit_and_rewind(tmp_path):
+    spool = Spool(str(tmp_path))
+    assert not spool
+    for i in range(5):
+        spool.append(*message(i))
+    spool.append(TOPIC, None, b"{}")
+    assert len(spool) == 6
+
+    assert spool.read(2) == [message(0), message(1)]
+    assert spool.read(2) == [message(2), message(3)]
+    spool.rewind()
+    assert spool.read(3) == [message(0), message(1), message(2)]
+    spool.commit()
+    assert len(spool) == 3
+    assert spool.read(10) == [message(3), message(4), (TOPIC, None, b"{}", None)]
+    spool.commit()
+    assert not spool
+    assert spool.read(10) == []
+    spool.close()
+
+
+def test_recovery_after_restart(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(5):
+        spool.append(*message(i))
+    spool.read(2)
+    spool.commit()
+    spool.read(2)  # uncommitted reads are replayed again after a restart
+    spool.close()
+    with pytest.raises(ValueError):
+        spool.append(*message(5))
+
+    spool = Spool(str(tmp_path))
+    assert len(spool) == 3
+    assert spool.read(10) == [message(2), message(3), message(4)]
+    spool.close()
+
+
+def test_recovery_of_a_torn_write(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append(*message(i))
+    segment = spool.segments[0]
+    # invalidate the payload of the last frame as if the process crashed while writing it
+    segment.mm[segment.write_pos - 1:segment.write_pos] = b"\xff"
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert len(spool) == 2
+    assert spool.read(10) == [message(0), message(1)]
+    spool.append(*message(3))
+    assert spool.read(10) == [message(3)]
+    spool.close()
+
+
+def test_eviction_of_the_oldest_segment(tmp_path):
+    segment_bytes = Segment.HEADER.size + 4 * (Segment.FRAME.size + 200)
+    spool = Spool(str(tmp_path), segment_bytes=segment_bytes, max_bytes=2 * segment_bytes)
+    for i in range(20):
+        spool.append(*message(i))
+    assert spool.dropped > 0
+    assert len(spool) + spool.dropped == 20
+    assert spool.size <= 2 * segment_bytes
+    assert len(os.listdir(str(tmp_path))) == 2
+    records = spool.read(100)
+    spool.commit()
+    records += spool.read(100)
+    assert records == [message(i) for i in range(spool.dropped, 20)]
+    spool.close()
+
+
+def test_replayed_segments_are_deleted(tmp_path):
+    segment_bytes = Segment.HEADER.size + 2 * (Segment.FRAME.size + 200)
+    spool = Spool(str(tmp_path), segment_bytes=segment_bytes)
+    for i in range(6):
+        spool.append(*message(i))
+    assert len(os.listdir(str(tmp_path))) > 1
+    replayed = list()
+    while spool:
+        replayed += spool.read(100)
+        spool.commit()
+    assert replayed == [message(i) for i in range(6)]
+    assert spool.dropped == 0
+    assert len(os.listdir(str(tmp_path))) == 1
+    spool.close()
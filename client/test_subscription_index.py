@@ -0,0 +1,67 @@
+import pickle
+
+import pytest
+
+try:
+    from .subscription_index import SubscriptionIndex
+except ImportError:
+    from client.subscription_index import SubscriptionIndex
+
+SYSTEM = "at.srfg.MachineFleet.Machine1"
+
+
+def test_exact_subscription():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.temperature")
+    assert index.match(SYSTEM, "machine", "temperature")
+    assert not index.match(SYSTEM, "machine", "acceleration")
+    assert not index.match("at.srfg.MachineFleet.Machine2", "machine", "temperature")
+    assert len(index) == 1 and index.count_wildcards() == 0
+
+
+def test_wildcards():
+    index = SubscriptionIndex()
+    index.add("at.srfg.MachineFleet.*.machine.temperature")
+    index.add("at.srfg.WeatherService.Stations.*.*")
+    assert index.match("at.srfg.MachineFleet.Machine2", "machine", "temperature")
+    assert not index.match("at.srfg.MachineFleet.Machine2", "machine", "acceleration")
+    assert index.match("at.srfg.WeatherService.Stations", "station_1", "humidity")
+    assert not index.match("at.srfg.WeatherService.Forecasts", "station_1", "humidity")
+    assert len(index) == 2 and index.count_wildcards() == 2
+
+
+def test_malformed_datastreams_are_not_matched():
+    index = SubscriptionIndex()
+    index.add("*.*.*.*.*.*")
+    assert index.match(SYSTEM, "machine", "temperature")
+    assert not index.match("at.srfg.MachineFleet", "machine", "temperature")
+    assert not index.match(None, "machine", "temperature")
+    with pytest.raises(ValueError):
+        index.add("at.srfg.machine.temperature")
+
+
+def test_new_subscription_invalidates_the_cache():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.temperature")
+    assert not index.match(SYSTEM, "machine", "acceleration")
+    index.add(SYSTEM + ".machine.*")
+    assert index.match(SYSTEM, "machine", "acceleration")
+
+
+def test_encoded_and_thing_lookups():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".machine.temperature")
+    assert index.match_encoded(SYSTEM.encode(), b"machine", b"temperature")
+    assert not index.match_encoded(SYSTEM.encode(), None, b"temperature")
+    assert not index.match_encoded(SYSTEM.encode(), b"\xff", b"temperature")
+    assert index.match_thing("machine") and not index.match_thing("car")
+    index.add("at.srfg.MachineFleet.*.*.temperature")
+    assert index.match_thing("car")
+
+
+def test_pickled_index_drops_its_cache():
+    index = SubscriptionIndex()
+    index.add(SYSTEM + ".*.temperature")
+    assert index.match(SYSTEM, "machine", "temperature")
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.cache == dict() and copy.match(SYSTEM, "car", "temperature")
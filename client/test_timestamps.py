@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+try:
+    from . import timestamps
+except ImportError:
+    from client import timestamps
+
+ISO = "2018-11-06T14:26:17.497349+00:00"
+US = 1541514377497349
+
+
+@pytest.mark.parametrize("epoch, expected", [
+    (1541514377, 1541514377000000),
+    (1541514377497, 1541514377497000),
+    (US, US),
+    (1541514377497349123, US),
+])
+def test_epoch_to_us(epoch, expected):
+    assert timestamps.epoch_to_us(epoch) == expected
+
+
+@pytest.mark.parametrize("timestamp", [
+    ISO, "2018-11-06T14:26:17.497349Z", "2018-11-06T14:26:17.497349123Z", "2018-11-06T15:26:17.497349+01:00",
+    US, str(US), 1541514377497349000, 1541514377.497349,
+    datetime(2018, 11, 6, 14, 26, 17, 497349), datetime(2018, 11, 6, 15, 26, 17, 497349, timezone(timedelta(hours=1))),
+])
+def test_to_iso8601(timestamp):
+    assert timestamps.to_iso8601(timestamp) == ISO
+
+
+def test_to_iso8601_pads_fractions():
+    assert timestamps.to_iso8601("2018-11-06T14:26:17Z") == "2018-11-06T14:26:17.000000+00:00"
+    assert timestamps.to_iso8601("2018-11-06T14:26:17.4Z") == "2018-11-06T14:26:17.400000+00:00"
+    assert timestamps.to_iso8601(1541514377) == "2018-11-06T14:26:17.000000+00:00"
+
+
+def test_invalid_timestamps():
+    with pytest.raises(ValueError):
+        timestamps.to_iso8601("yesterday")
+    with pytest.raises(ValueError):
+        timestamps.to_iso8601([1541514377])
+
+
+def test_round_trip_over_cached_seconds():
+    for us in (US, US + 1, US + 1000000, US - 1000000, 0):
+        assert timestamps.iso8601_to_us(timestamps.us_to_iso8601(us)) == us
+
+
+def test_now():
+    now = timestamps.now_iso8601()
+    assert len(now) == 32 and now.endswith("+00:00")
+    assert timestamps.to_iso8601() >= now
+
+
+def test_vectorized_conversions():
+    np = pytest.importorskip("numpy")
+    assert timestamps.epochs_to_iso8601(np.array([1541514377, US, 1541514377497349000])) == [
+        "2018-11-06T14:26:17.000000+00:00", ISO, ISO]
+    assert timestamps.epochs_to_iso8601(np.array([1541514377.497349])) == [ISO]
+    assert timestamps.epochs_to_iso8601(np.array([US], dtype="datetime64[us]")) == [ISO]
+    assert timestamps.epochs_to_iso8601([ISO, US]) == [ISO, ISO]
+    assert timestamps.iso8601_to_ns_array([ISO, "2018-11-06T15:26:17.497349+01:00"]).tolist() == [US * 1000] * 2
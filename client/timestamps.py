@@ -0,0 +1,166 @@
+"""
+Fast normalization of timestamps to ISO 8601 UTC strings of the form 2018-12-03T15:55:39.054752+00:00.
+
+Supported inputs are ISO 8601 strings, unix epochs with 10 (s), 13 (ms), 16 (us) or 19 (ns) digits as integers or
+digit strings, float epochs in seconds and datetime objects. The formatted prefix up to the seconds is cached, as
+consecutive timestamps mostly fall into the same second.
+"""
+import re
+import time
+import calendar
+import numbers
+from datetime import datetime, timezone
+
+# NumPy is optional and only used for the vectorized conversion of arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+UTC_SUFFIX = "+00:00"
+# ISO 8601 strings in UTC, e.g. 2018-11-06T13:57:55.088294Z or 2018-11-06T13:57:55.088294+00:00
+ISO_UTC_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{1,9}))?(?:Z|\+00:00)$")
+
+# cached (second, prefix) tuples, replaced as a whole to be thread-safe
+_now_cache = (None, "")
+_epoch_cache = (None, "")
+_parse_cache = ("", 0)
+
+
+def _now_prefix(second):
+    global _now_cache
+    cached_second, prefix = _now_cache
+    if second != cached_second:
+        prefix = time.strftime(ISO_FORMAT, time.gmtime(second))
+        _now_cache = (second, prefix)
+    return prefix
+
+
+def _epoch_prefix(second):
+    global _epoch_cache
+    cached_second, prefix = _epoch_cache
+    if second != cached_second:
+        prefix = time.strftime(ISO_FORMAT, time.gmtime(second))
+        _epoch_cache = (second, prefix)
+    return prefix
+
+
+def now_iso8601():
+    """Returns the current time as ISO 8601 UTC string, e.g. 2018-12-03T15:55:39.054752+00:00"""
+    now = time.time()
+    second = int(now)
+    return f"{_now_prefix(second)}.{int((now - second) * 1e6):06d}{UTC_SUFFIX}"
+
+
+def epoch_to_us(epoch):
+    """Converts an integer unix epoch with 10 (s), 13 (ms), 16 (us) or 19 (ns) digits into microseconds."""
+    if epoch < 1e12:  # Expects the timestamp in the form of 1541514377 (s)
+        return epoch * 1000000
+    elif epoch < 1e15:  # Expects the timestamp in the form of 1541514377497 (ms)
+        return epoch * 1000
+    elif epoch < 1e18:  # Expects the timestamp in the form of 1541514377497349 (us)
+        return epoch
+    else:  # Expects the timestamp in the form of 1541514377497349000 (ns)
+        return epoch // 1000
+
+
+def us_to_iso8601(us):
+    """Formats microseconds since the unix epoch as ISO 8601 UTC string."""
+    second, micro = divmod(us, 1000000)
+    return f"{_epoch_prefix(second)}.{micro:06d}{UTC_SUFFIX}"
+
+
+def iso8601_to_us(timestamp):
+    """Converts an ISO 8601 UTC string in the canonical form of to_iso8601 into microseconds since the unix epoch."""
+    global _parse_cache
+    prefix = timestamp[:19]
+    cached_prefix, second = _parse_cache
+    if prefix != cached_prefix:
+        second = calendar.timegm(time.strptime(prefix, ISO_FORMAT))
+        _parse_cache = (prefix, second)
+    return second * 1000000 + int(timestamp[20:26])
+
+
+def to_iso8601(timestamp=None):
+    """
+    Converts multiple standard timestamps to ISO 8601 UTC datetime.
+    The output is strictly in the following style: 2018-12-03T15:55:39.054752+00:00
+    :param timestamp: either ISO 8601 or a 10,13,16 or 19 digit unix epoch format, the current time if None.
+    :return: ISO 8601 format. e.g. 2018-12-03T15:55:39.054752+00:00
+    """
+    if timestamp is None:
+        return now_iso8601()
+    if isinstance(timestamp, str):
+        match = ISO_UTC_PATTERN.match(timestamp)
+        if match:
+            prefix, fraction = match.groups()
+            return f"{prefix}.{(fraction or '')[:6].ljust(6, '0')}{UTC_SUFFIX}"
+        if timestamp.isdigit():
+            return us_to_iso8601(epoch_to_us(int(timestamp)))
+        return _parse_iso8601(timestamp)
+    if isinstance(timestamp, int):
+        return us_to_iso8601(epoch_to_us(timestamp))
+    if isinstance(timestamp, float):  # Expects the timestamp in the form of 1541514377.497349 (s)
+        return us_to_iso8601(int(round(timestamp * 1e6)))
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return timestamp.strftime(ISO_FORMAT + ".%f") + UTC_SUFFIX
+    # other numeric types, e.g. numpy.int64 or numpy.float64
+    if isinstance(timestamp, numbers.Integral):
+        return to_iso8601(int(timestamp))
+    if isinstance(timestamp, numbers.Real):
+        return to_iso8601(float(timestamp))
+    raise ValueError(f"Invalid timestamp '{timestamp}' of type {type(timestamp)}.")
+
+
+def _parse_iso8601(timestamp):
+    """Slow path for ISO 8601 strings with a timezone offset other than UTC, e.g. 2018-11-06T14:57:55.088+01:00"""
+    if len(timestamp) > 6 and timestamp[-3] == ":" and timestamp[-6] in "+-":
+        timestamp = timestamp[:-3] + timestamp[-2:]  # strptime of Python 3.6 doesn't support colons in %z
+    fmt = ISO_FORMAT + (".%f%z" if "." in timestamp else "%z")
+    try:
+        parsed = datetime.strptime(timestamp, fmt)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{timestamp}', expected ISO 8601 or a unix epoch.")
+    return to_iso8601(parsed)
+
+
+def epochs_to_iso8601(timestamps):
+    """
+    Vectorized conversion of an array of timestamps to ISO 8601 UTC strings, used for bulk producing.
+    Integer arrays are interpreted as 10, 13, 16 or 19 digit unix epochs, float arrays as epochs in seconds.
+    :param timestamps: NumPy array or list of timestamps, other types are converted element-wise
+    :return: list of ISO 8601 strings
+    """
+    if np is not None:
+        values = timestamps if isinstance(timestamps, np.ndarray) else np.asarray(timestamps)
+        if values.dtype.kind in "iuf" and values.ndim == 1:
+            if values.dtype.kind == "f":
+                us = np.round(values * 1e6).astype("int64")
+            else:
+                values = values.astype("int64")
+                us = np.where(values < 1e12, values * 1000000,
+                              np.where(values < 1e15, values * 1000,
+                                       np.where(values < 1e18, values, values // 1000)))
+            strings = np.datetime_as_string(us.astype("datetime64[us]"), unit="us")
+            return [string + UTC_SUFFIX for string in strings.tolist()]
+        if values.dtype.kind == "M" and values.ndim == 1:
+            strings = np.datetime_as_string(values.astype("datetime64[us]"), unit="us")
+            return [string + UTC_SUFFIX for string in strings.tolist()]
+    return [to_iso8601(timestamp) for timestamp in timestamps]
+
+
+def iso8601_to_ns_array(timestamps):
+    """
+    Vectorized conversion of ISO 8601 strings into nanoseconds since the unix epoch, used for columnar consuming.
+    :param timestamps: list of timestamps, see to_iso8601
+    :return: NumPy int64 array of nanoseconds since the unix epoch
+    """
+    if np is None:
+        raise ImportError("The conversion into arrays requires NumPy, install it via 'pip install numpy'.")
+    # the canonical form 2018-12-03T15:55:39.054752+00:00 is passed to NumPy without the UTC suffix
+    normalized = [timestamp[:26] if isinstance(timestamp, str) and len(timestamp) == 32 and
+                  timestamp.endswith(UTC_SUFFIX) else to_iso8601(timestamp)[:26] for timestamp in timestamps]
+    return np.array(normalized, dtype="datetime64[us]").astype("int64") * 1000
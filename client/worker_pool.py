@@ -0,0 +1,177 @@
+import threading
+import multiprocessing.pool
+from collections import deque
+
+import confluent_kafka
+
+try:
+    from .message_decoder import MessageDecoder
+    from .sequence_tracker import SequenceRecorder
+except ImportError:
+    from client.message_decoder import MessageDecoder
+    from client.sequence_tracker import SequenceRecorder
+
+# MessageDecoder of each worker thread or process, see init_worker
+_worker = threading.local()
+
+
+def init_worker(spec, track_sequences):
+    """
+    Creates the MessageDecoder of a worker once, from the spec of the client's decoder. Each worker keeps its own
+    caches and counters, which are merged into the client's decoder per batch, see PartitionWorkerPool.collect.
+    :param spec: keyword arguments of the MessageDecoder, see MessageDecoder.spec
+    :param track_sequences: record the sequence numbers of the messages, which are checked by the client
+    :return:
+    """
+    _worker.decoder = MessageDecoder(tracker=SequenceRecorder() if track_sequences else None, **spec)
+
+
+def process_partition_batch(callback, topic, partition, messages, on_error="ignore"):
+    """
+    Decodes, filters and processes a batch of messages of a single partition, runs within a worker.
+    :param callback: function that is called with the list of subscribed datapoints of the batch
+    :param topic: topic of the messages
+    :param partition: partition of the messages
+    :param messages: list of tuples (value, headers, key) of the messages in the order of their offsets
+    :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+    :return: tuple (number of subscribed datapoints, dict of the decoder counters of the batch, list of the
+        recorded sequence numbers)
+    """
+    decoder = _worker.decoder
+    before = decoder.counters()
+    datapoints = list()
+    for value, headers, key in messages:
+        datapoints.extend(decoder.decode(value, topic, partition, on_error=on_error, headers=headers, key=key))
+    counters = {name: count - before[name] for name, count in decoder.counters().items()}
+    observed = decoder.tracker.drain() if decoder.tracker is not None else list()
+    if datapoints:
+        callback(datapoints)
+    return len(datapoints), counters, observed
+
+
+class PartitionWorkerPool:
+    """Consumes with a pool of worker threads or processes that decode, filter and process the messages in parallel.
+
+    The messages are dispatched per partition, with at most one batch of a partition being processed at a time,
+    such that the order within each partition is kept. The offsets of a partition are acknowledged only after its
+    worker has finished the batch, and are committed by the client in coalesced batches. Each worker decodes with its
+    own MessageDecoder, which is created once from the subscriptions at the start of the pool.
+    """
+
+    def __init__(self, client, callback, workers=4, worker_type="thread", on_error="ignore", max_batch=1000,
+                 max_backlog=10000):
+        """
+        :param client: DigitalTwinClient in the "manual" commit_mode
+        :param callback: function that is called with a list of subscribed datapoints of a single partition, it must
+            be picklable for the worker_type "process", i.e., a function defined on module level
+        :param workers: number of workers
+        :param worker_type: "thread" (default) or "process"
+        :param on_error: behaviour on invalid consumed data, "ignore" (default) | "warn" | "break"
+        :param max_batch: maximal number of messages of a partition that are processed by a worker at once
+        :param max_backlog: number of queued messages of a partition above which the partition is paused
+        """
+        # the pools of multiprocessing support initializers of the workers on all supported Python versions
+        initargs = (client.decoder.spec(), client.decoder.tracker is not None)
+        if worker_type == "thread":
+            self.executor = multiprocessing.pool.ThreadPool(workers, initializer=init_worker, initargs=initargs)
+        elif worker_type == "process":
+            self.executor = multiprocessing.pool.Pool(workers, initializer=init_worker, initargs=initargs)
+        else:
+            raise Exception(f"PartitionWorkerPool: Invalid worker_type '{worker_type}', "
+                            f"must be one of 'thread' or 'process'.")
+        self.client = client
+        self.callback = callback
+        self.on_error = on_error
+        self.max_batch = max_batch
+        self.max_backlog = max_backlog
+        # queued messages, running batches as (AsyncResult, next_offset) and paused partitions, per (topic, partition)
+        self.backlog = dict()
+        self.running = dict()
+        self.paused = set()
+
+    def run(self, timeout=1.0, stop_event=None):
+        """
+        Consumes and processes messages until the stop_event is set.
+        :param timeout: maximal duration in seconds to wait for messages
+        :param stop_event: optional threading.Event to stop the pool, runs forever if None
+        :return:
+        """
+        try:
+            while stop_event is None or not stop_event.is_set():
+                # poll shortly while batches are running, to dispatch the next batch of their partitions soon
+                for msg in self.client.fetch_messages(timeout=min(timeout, 0.05) if self.running else timeout):
+                    if msg.error():
+                        continue
+                    self.backlog.setdefault((msg.topic(), msg.partition()), deque()).append(msg)
+                self.collect()
+                self.dispatch()
+                self.apply_backpressure()
+                self.client.commit_offsets()
+        finally:
+            # finish the running batches and commit their offsets
+            for result, _ in self.running.values():
+                result.wait()
+            self.collect()
+            if self.paused:
+                self.client.consumer.resume(list(self.paused))
+            self.client.commit_offsets(force=True, asynchronous=False)
+            self.executor.close()
+            self.executor.join()
+
+    def collect(self):
+        """Acknowledges the offsets of finished batches and merges the counters and recorded sequence numbers of
+        their workers into the client's decoder, re-raises exceptions of the workers."""
+        finished = [key for key, (result, _) in self.running.items() if result.ready()]
+        if not finished:
+            return
+        # partitions that were revoked by a rebalance are processed by their new owner
+        assigned = {(tp.topic, tp.partition) for tp in self.client.consumer.assignment()}
+        decoder = self.client.decoder
+        for key in finished:
+            result, next_offset = self.running.pop(key)
+            _, counters, observed = result.get()
+            decoder.decoded += counters["decoded"]
+            decoder.matched += counters["matched"]
+            decoder.filtered += counters["filtered"]
+            if counters["invalid"]:
+                self.client.statistics.increment("invalid", counters["invalid"])
+            # the batches of a partition are collected in order, such that the sequences are checked in order
+            if decoder.tracker is not None:
+                for sequence_key, sequence in observed:
+                    decoder.tracker.observe(sequence_key, sequence)
+            if key in assigned:
+                self.client.acked_offsets[key] = next_offset
+        for key in [key for key in self.backlog if key not in assigned]:
+            del self.backlog[key]
+            self.paused.discard(confluent_kafka.TopicPartition(*key))
+
+    def dispatch(self):
+        """Submits the next batch of each partition without a running batch."""
+        for key, messages in self.backlog.items():
+            if messages and key not in self.running:
+                batch = [messages.popleft() for _ in range(min(self.max_batch, len(messages)))]
+                # only the messages that may be subscribed are handed over to the worker, with their headers and keys
+                decoder = self.client.decoder
+                selected = [(msg.value(), msg.headers(), msg.key()) for msg in batch
+                            if decoder.prefilter(key[0], msg.headers(), msg.key())]
+                decoder.filtered += len(batch) - len(selected)
+                result = self.executor.apply_async(process_partition_batch, (self.callback, key[0], key[1], selected,
+                                                                             self.on_error))
+                self.running[key] = (result, batch[-1].offset() + 1)
+
+    def apply_backpressure(self):
+        """Pauses partitions whose backlog exceeds max_backlog and resumes them as soon as it is drained."""
+        to_pause = list()
+        to_resume = list()
+        for key, messages in self.backlog.items():
+            tp = confluent_kafka.TopicPartition(*key)
+            if len(messages) > self.max_backlog and tp not in self.paused:
+                to_pause.append(tp)
+            elif len(messages) <= self.max_backlog // 2 and tp in self.paused:
+                to_resume.append(tp)
+        if to_pause:
+            self.client.consumer.pause(to_pause)
+            self.paused.update(to_pause)
+        if to_resume:
+            self.client.consumer.resume(to_resume)
+            self.paused.difference_update(to_resume)
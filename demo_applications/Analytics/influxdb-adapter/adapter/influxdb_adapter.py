@@ -35,6 +35,7 @@ from influxdb import InfluxDBClient
 if os.path.exists("/src/distribution-network"):
     sys.path.append("/src/distribution-network")
 from client.digital_twin_client import DigitalTwinClient
+from client.options import ConsumerOptions
 
 # This config is used to registering a client application on the platform
 # Make sure that Kafka and Postgres are up and running before starting the platform
@@ -70,7 +71,8 @@ except requests.exceptions.ConnectionError as e:
     raise e
 
 # Set the configs, create a new Digital Twin Instance and register file structure
-client = DigitalTwinClient(**CONFIG)
+# Offsets are committed only after the data was written to InfluxDB, which gives at-least-once delivery
+client = DigitalTwinClient(**CONFIG, consumer_options=ConsumerOptions(commit_mode="manual"))
 client.logger.info("Main: Starting client.")
 client.subscribe(subscription_file=SUBSCRIPTIONS)  # Subscribe to datastreams
 
@@ -82,12 +84,10 @@ logger.setLevel(logging.INFO)
 logger.info(f"Loaded clients, InfluxDB-Adapter for {CONFIG['system_name']} is ready.")
 
 try:
-    while True:
+    # Receive all messages of the specified system topic in micro-batches, adapt subscriptions.json to consume a subset
+    # fetching is paused automatically while InfluxDB falls behind
+    for received_quantities in client.stream(max_batch=500, max_wait=1.0, batches=True, on_error="warn"):
         rows_to_insert = list()
-        # Receive all messages of the specified system topic, adapt subscriptions.json to consume a subset
-        # commits every timeout
-        received_quantities = client.consume(timeout=1.0, on_error="warn")
-
         for received_quantity in received_quantities:
             if verbose:
                 logger.info(f'New data: {received_quantity["datastream"]["thing"]}.'
@@ -116,6 +116,8 @@ try:
             rows_to_insert.append(new_row)
 
         influx_client.write_points(rows_to_insert)
+        # acknowledge the written batch, the client commits the offsets in coalesced batches
+        client.ack()
 
 except KeyboardInterrupt:
     client.disconnect()
@@ -29,6 +29,7 @@ import threading
 from datetime import datetime
 
 from client.digital_twin_client import DigitalTwinClient
+from client.options import ProducerOptions
 from demo_applications.simulator.MachineSimulator import MachineSimulator
 
 # This config is used to registering a client application on the platform
@@ -37,8 +38,10 @@ CONFIG = {
     "client_name": "machine-controller",
     "system_name": "at.srfg.MachineFleet.Machine2",
     "server_uri": "localhost:1908",
-    "kafka_bootstrap_servers": "iasset.salzburgresearch.at:9092"
+    "kafka_bootstrap_servers": "iasset.salzburgresearch.at:9092",
     # ,iasset.salzburgresearch.at:9093,iasset.salzburgresearch.at:9094",
+    # the producer and the consumer thread share the client, a sender thread serializes and sends the datapoints
+    "producer_options": ProducerOptions(produce_mode="background")
 }
 INTERVAL = 5  # interval at which to produce (s)
 
@@ -75,12 +78,12 @@ def produce_metrics(interval=10):
 
 # Receive all temperatures of the weather-service and other machines and check whether they are subzero
 def consume_metrics():
-    while not halt_event.is_set():
+    # Data of other instances (and also the same one) can be consumed via the client in micro-batches until the
+    # halt signal is set, commits automatically
+    for received_quantities in client.stream(max_wait=1.0, batches=True, on_error="warn", stop_event=halt_event):
         # In this list, each datapoint is stored that is below zero degC.
         subzero_temp = list()
 
-        # Data of other instances (and also the same one) can be consumed via the client, commits every timeout
-        received_quantities = client.consume(timeout=1.0, on_error="warn")
         for received_quantity in received_quantities:
             # The resolves the all meta-data for an received data-point
             print(f"  -> Received new external data-point from {received_quantity['phenomenonTime']}: "
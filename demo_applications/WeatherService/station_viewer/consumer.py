@@ -47,18 +47,15 @@ client.subscribe(subscription_file=SUBSCRIPTIONS)
 
 fan_status = False
 try:
-    while True:
-        # Receive all queued messages of the weather-service
-        # Data is consumed via the client, commits automatically on return
-        received_quantities = client.consume(timeout=1.0, on_error="warn")
-
-        for received_quantity in received_quantities:
-            # The resolves the all meta-data for an received data-point
-            print(f"  -> Received new external data-point from {received_quantity['phenomenonTime']}: "
-                  f"'{received_quantity['datastream']}' = {received_quantity['result']}.")
+    # Receive all queued messages of the weather-service
+    # Data is streamed lazily via the client, commits automatically
+    for received_quantity in client.stream(max_wait=1.0, on_error="warn"):
+        # The resolves the all meta-data for an received data-point
+        print(f"  -> Received new external data-point from {received_quantity['phenomenonTime']}: "
+              f"'{received_quantity['datastream']}' = {received_quantity['result']}.")
 
         # To view the whole data-point in a pretty format, uncomment:
-        # print("Received new data: {}".format(json.dumps(received_quantity, indent=2)))
+        # print("Received new data: {}".format(json.dumps(received_quantity.to_dict(), indent=2)))
 
 except KeyboardInterrupt:
     client.disconnect()
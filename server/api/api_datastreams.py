@@ -53,7 +53,7 @@ def datastreams_per_system(user_id, system_url):
 
     # 3) Fetch all datastreams that belong to the user with id user_id and system_name
     result_proxy = conn.execute(f"""
-    SELECT ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
+    SELECT ds.id, ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
         creator.email AS contact_mail, ds.description
     FROM systems AS sys
     INNER JOIN is_admin_of_sys AS agf ON sys.name=agf.system_name 
@@ -100,7 +100,7 @@ def datastreams_per_client(user_id, system_url, client_name):
         return jsonify({"value": msg, "url": fct, "status_code": 403}), 403
 
     result_proxy = conn.execute(f"""
-    SELECT ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
+    SELECT ds.id, ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
         creator.email AS contact_mail, ds.description
     FROM systems AS sys
     INNER JOIN is_admin_of_sys AS agf ON sys.name=agf.system_name 
@@ -147,7 +147,7 @@ def datastreams_per_thing(user_id, system_url, thing_name):
         return jsonify({"value": msg, "url": fct, "status_code": 403}), 403
 
     result_proxy = conn.execute(f"""
-    SELECT ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
+    SELECT ds.id, ds.system_name, shortname, ds.name, thing_name, client_name, ds.resource_uri,
         creator.email AS contact_mail, ds.description
     FROM systems AS sys
     INNER JOIN is_admin_of_sys AS agf ON sys.name=agf.system_name 
@@ -161,6 +161,48 @@ def datastreams_per_thing(user_id, system_url, thing_name):
     return jsonify({"datastreams": datastreams})
 
 
+@api_datastreams.route(f"{prefix}/datastream_ids/<string:user_id>/<string:system_url>", methods=['GET'])
+def datastream_ids(user_id, system_url):
+    """
+    Returns the wire format of a system and the ids of its datastreams, by which the messages of the "binary" wire
+    format reference their datastream. Clients and stream apps cache this mapping to resolve the ids.
+    The user_id must be authenticated and an admin of the system.
+    :param user_id: personId of the Identity-service, or (if negative) the user_id of the demo Digital Twin platform
+    :param system_url: system identifier whose levels are separated by '_' or '.'
+    :return: Json of the form {"wire_format": "binary", "datastreams": [{"id": 1, "shortname": ..., ...}, ...]}
+    """
+    # 1) extract the header content with the keys: Host, User-Agent, Accept, Authorization
+    #    check if the user is allowed to get the systems (user_id < 0 -> Panta Rhei, user_id > 0 -> identity-service
+    fct = f"{prefix}/datastream_ids/<string:user_id>/<string:system_url>"
+    user_id = get_user_id(fct, user_id)
+    authorized, msg, status_code = authorize_request(fct=fct, user_id=user_id)
+    if not authorized:
+        return jsonify({"value": msg, "url": fct, "status_code": status_code}), status_code
+
+    # 2) Check if the user is admin of the system, the system name is bound as parameter as it stems from the url
+    system_name = decode_sys_url(system_url)
+    engine = db.create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
+    conn = engine.connect()
+    result_proxy = conn.execute(db.text("""
+    SELECT sys.wire_format FROM systems AS sys
+    INNER JOIN is_admin_of_sys AS iaos ON sys.name=iaos.system_name
+    WHERE iaos.user_id=:user_id AND sys.name=:system_name;"""), user_id=str(user_id), system_name=system_name)
+    systems = [strip_dict(c.items()) for c in result_proxy.fetchall()]
+    if len(systems) == 0:
+        engine.dispose()
+        msg = f"The user '{user_id}' is not an admin of system '{system_name}' or it doesn't exist."
+        app.logger.warning(f"{fct}: {msg}")
+        return jsonify({"value": msg, "url": fct, "status_code": 403}), 403
+
+    # 3) Fetch the ids and identities of the datastreams of the system
+    result_proxy = conn.execute(db.text("""
+    SELECT id, system_name, shortname, thing_name, client_name FROM datastreams
+    WHERE system_name=:system_name;"""), system_name=system_name)
+    engine.dispose()
+    datastreams = [strip_dict(c.items()) for c in result_proxy.fetchall()]
+    return jsonify({"wire_format": systems[0]["wire_format"], "datastreams": datastreams})
+
+
 @api_datastreams.route(f"{prefix}/datastreams/<string:user_id>/<string:system_url>", methods=['POST', 'PUT'])
 def create_datastreams(user_id, system_url):
     """
@@ -21,6 +21,8 @@ from ..utils.useful_functions import get_datetime, is_logged_in, valid_level_nam
 
 prefix = "/distributionnetwork"  # url_prefix="/distributionnetwork/")
 api_system = Blueprint("api_system", __name__)
+# wire formats of the datapoints of a system, "binary" references the datastreams by their ids, see api_datastreams
+WIRE_FORMATS = ("json", "binary")
 
 
 @api_system.route(f"{prefix}", methods=['GET'])
@@ -82,7 +84,7 @@ def systems_by_person(user_id):
         sys = dict()
         res = {k: v for k, v in res.items() if v}
         for key in ["system_name", "created_at", "company", "description", "company_id", "kafka_servers",
-                    "company_id"]:
+                    "company_id", "wire_format"]:
             sys[key] = safe_strip(res.get(key, ""))
         sys["creator"] = {"creator_id": res.get("creator_id", ""),
                           "first_name": res.get("first_name", ""),
@@ -104,6 +106,7 @@ def create_systems_by_person(user_id):
         "company_id": -11,
         "description": "Lorem ipsum dolor sit amet, consectetuer adipiscing elit.",
         "kafka_server": "",
+        "wire_format": "json",
         "mqtt_broker": {
             "mqtt_server": "",
             "mqtt_version": ""
@@ -134,6 +137,11 @@ def create_systems_by_person(user_id):
         app.logger.error(f"{fct}: {msg}")
         return jsonify({"value": msg, "url": fct, "status_code": 406}), 406
 
+    if new_system.get("wire_format", "json") not in WIRE_FORMATS:
+        msg = f"The wire_format of the system must be one of {WIRE_FORMATS}."
+        app.logger.error(f"{fct}: {msg}")
+        return jsonify({"value": msg, "url": fct, "status_code": 406}), 406
+
     company_id = new_system["company_id"]
     if company_id * int(user_id) < 0:
         msg = f"The company_id and user_id must be both either smaller or greater than zero."
@@ -239,6 +247,7 @@ def create_systems_by_person(user_id):
                     "workcenter": workcenter,
                     "station": station,
                     "kafka_servers": new_system.get("kafka_servers", "").strip(),
+                    "wire_format": new_system.get("wire_format", "json"),
                     "datetime": get_datetime(),
                     "description": new_system.get("description", "")}]
     if len(systems) > 0:
@@ -247,6 +256,10 @@ def create_systems_by_person(user_id):
             msg = f"The system with name '{system_name}' already exists."
             app.logger.warning(f"{fct}: {msg}")
             return jsonify({"value": msg, "url": fct, "status_code": 208}), 208
+        # the wire format is negotiated per system, clients pick up a changed format on their next start
+        if "wire_format" in new_system:
+            conn.execute(db.text("UPDATE systems SET wire_format=:wire_format WHERE name=:system_name;"),
+                         wire_format=new_system["wire_format"], system_name=system_name)
     else:
         query = db.insert(app.config["tables"]["systems"])
         conn.execute(query, new_systems)
@@ -69,6 +69,7 @@ def drop_tables(app):
     DROP TABLE IF EXISTS things CASCADE;
     DROP TABLE IF EXISTS datastreams CASCADE;
     DROP TABLE IF EXISTS subscriptions CASCADE;
+    DROP SEQUENCE IF EXISTS datastream_ids;
     """
     result_proxy = conn.execute(query)
     engine.dispose()
@@ -108,6 +109,8 @@ def create_tables(app):
         db.Column('datetime', db.DateTime, nullable=True),
         db.Column('description', db.TEXT, nullable=True),
         db.Column('kafka_servers', db.VARCHAR(1024), nullable=True),
+        # wire format of the datapoints of the system's clients, "json" or "binary", see api_datastreams.datastream_ids
+        db.Column('wire_format', db.VARCHAR(16), nullable=False, server_default='json'),
         db.Column('company_id', db.ForeignKey('companies.id'), nullable=False)
     )
     app.config["tables"]["is_admin_of_com"] = db.Table(
@@ -163,9 +166,13 @@ def create_tables(app):
         db.Column('on_kafka', db.BOOLEAN, nullable=False, default=True),
         db.Column('key', db.TEXT, nullable=True)
     )
+    # compact ids of the datastreams that reference them in messages of the binary wire format, set on insert
+    datastream_ids = db.Sequence('datastream_ids', metadata=app.config['metadata'])
     app.config["tables"]["datastreams"] = db.Table(
         'datastreams', app.config['metadata'],
         db.Column('shortname', db.VARCHAR(32), primary_key=True),
+        db.Column('id', db.INTEGER, datastream_ids, server_default=datastream_ids.next_value(), unique=True,
+                  nullable=False),
         db.Column('name', db.VARCHAR(128)),
         # construct a composite foreign key for thing
         db.Column('thing_name', db.VARCHAR(64), primary_key=True),
@@ -201,6 +208,23 @@ def create_tables(app):
     app.config['metadata'].create_all(engine)
     engine.dispose()
     app.logger.info("Created tables.")
+    migrate_tables(app)
+
+
+def migrate_tables(app):
+    """Adds the columns that were introduced after the tables were created, as create_all skips existing tables."""
+    engine = db.create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
+    conn = engine.connect()
+    # the default of the datastream ids is volatile, such that existing datastreams get distinct ids
+    query = """
+    ALTER TABLE systems ADD COLUMN IF NOT EXISTS wire_format VARCHAR(16) NOT NULL DEFAULT 'json';
+    CREATE SEQUENCE IF NOT EXISTS datastream_ids;
+    ALTER TABLE datastreams ADD COLUMN IF NOT EXISTS id INTEGER NOT NULL DEFAULT nextval('datastream_ids');
+    CREATE UNIQUE INDEX IF NOT EXISTS datastreams_id_key ON datastreams (id);
+    """
+    result_proxy = conn.execute(query)
+    engine.dispose()
+    app.logger.info("Migrated tables.")
 
 
 def insert_sample(app):
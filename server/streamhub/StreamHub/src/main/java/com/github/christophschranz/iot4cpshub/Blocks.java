@@ -0,0 +1,77 @@
+package com.github.christophschranz.iot4cpshub;
+
+import com.google.gson.JsonObject;
+import com.google.gson.JsonParser;
+
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+import java.nio.charset.StandardCharsets;
+import java.util.Base64;
+
+/**
+ * Helpers for the block messages of the Digital Twin Client, that hold the samples of a single datastream as packed
+ * little-endian arrays, see produce_block of the client. A block is either a JSON message with base64 encoded arrays:
+ * {"phenomenonTime": ..., "datastream": {...}, "block": {"count": 1000, "dtype": "float32", "interval": 1000,
+ *  "results": "base64"}, ...} with "deltas" of the sample times instead of an "interval",
+ * or the binary variant, which consists of the magic "\0DTB", the int32 length of the JSON message without the
+ * arrays, the JSON message and the raw deltas and results.
+ */
+public class Blocks {
+    static final byte[] MAGIC = new byte[]{0, 'D', 'T', 'B'};
+    static final int HEADER_SIZE = 8;
+
+    /**
+     * Return whether the value is a block message of the binary variant.
+     * @return boolean whether the value starts with the magic
+     */
+    public static boolean isBinary(byte[] value) {
+        if (value == null || value.length < HEADER_SIZE)
+            return false;
+        for (int i = 0; i < MAGIC.length; i++)
+            if (value[i] != MAGIC[i])
+                return false;
+        return true;
+    }
+
+    /**
+     * Parse the JSON message of a message, the JSON part without the arrays for the binary variant.
+     * @return the parsed jsonInput
+     */
+    public static JsonObject parse(JsonParser jsonParser, byte[] value) {
+        if (isBinary(value)) {
+            int length = ByteBuffer.wrap(value, MAGIC.length, 4).order(ByteOrder.LITTLE_ENDIAN).getInt();
+            return jsonParser.parse(new String(value, HEADER_SIZE, length, StandardCharsets.UTF_8)).getAsJsonObject();
+        }
+        return jsonParser.parse(new String(value, StandardCharsets.UTF_8)).getAsJsonObject();
+    }
+
+    /**
+     * Unpack the results of a block message.
+     * @return the results as doubles
+     */
+    public static double[] results(JsonObject jsonInput, byte[] value) {
+        JsonObject block = jsonInput.get("block").getAsJsonObject();
+        int count = block.get("count").getAsInt();
+        String dtype = block.get("dtype").getAsString();
+        ByteBuffer buffer;
+        if (block.has("results")) {
+            buffer = ByteBuffer.wrap(Base64.getDecoder().decode(block.get("results").getAsString()));
+        } else {
+            int length = ByteBuffer.wrap(value, MAGIC.length, 4).order(ByteOrder.LITTLE_ENDIAN).getInt();
+            int offset = HEADER_SIZE + length + (block.has("interval") ? 0 : 8 * count);
+            buffer = ByteBuffer.wrap(value, offset, value.length - offset);
+        }
+        buffer.order(ByteOrder.LITTLE_ENDIAN);
+
+        double[] results = new double[count];
+        for (int i = 0; i < count; i++) {
+            if (dtype.equals("float32"))
+                results[i] = buffer.getFloat();
+            else if (dtype.equals("int64"))
+                results[i] = buffer.getLong();
+            else
+                results[i] = buffer.getDouble();
+        }
+        return results;
+    }
+}
@@ -0,0 +1,97 @@
+package com.github.christophschranz.iot4cpshub;
+
+import com.google.gson.JsonNull;
+import com.google.gson.JsonObject;
+import com.google.gson.JsonParser;
+
+import java.nio.BufferUnderflowException;
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+import java.nio.charset.StandardCharsets;
+import java.time.Instant;
+import java.time.ZoneOffset;
+import java.time.format.DateTimeFormatter;
+
+/**
+ * Helpers for the binary wire format of the Digital Twin Client, in which a datapoint references its datastream by
+ * the id assigned by the server, see client/envelope.py. A message consists of the magic "\0DTE", the uint32
+ * datastream id, the int64 phenomenonTime and resultTime in microseconds since the unix epoch, the type of the
+ * result and the result, i.e. a float64 or int64, nothing for booleans and null, or the uint32 length and the JSON of
+ * other results. The remaining bytes hold the JSON of the attributes, if any. All numbers are little-endian.
+ */
+public class Envelopes {
+    static final byte[] MAGIC = new byte[]{0, 'D', 'T', 'E'};
+    static final int HEADER_SIZE = 25;
+    static final byte FLOAT = 0, INT = 1, FALSE = 2, TRUE = 3, NULL = 4, JSON = 5;
+    static final DateTimeFormatter ISO_FORMAT =
+            DateTimeFormatter.ofPattern("yyyy-MM-dd'T'HH:mm:ss.SSSSSS'+00:00'").withZone(ZoneOffset.UTC);
+
+    /**
+     * Return whether the value is a message of the binary wire format.
+     * @return boolean whether the value starts with the magic
+     */
+    public static boolean isEnvelope(byte[] value) {
+        if (value == null || value.length < HEADER_SIZE)
+            return false;
+        for (int i = 0; i < MAGIC.length; i++)
+            if (value[i] != MAGIC[i])
+                return false;
+        return true;
+    }
+
+    /**
+     * Convert a message of the binary wire format into the jsonInput of the JSON wire format, the datastream is
+     * resolved by the semantics.
+     * @return the jsonInput, or null if the datastream id is unknown or the message is invalid
+     */
+    public static JsonObject parse(JsonParser jsonParser, Semantics semantics, byte[] value) {
+        ByteBuffer buffer = ByteBuffer.wrap(value, MAGIC.length, value.length - MAGIC.length)
+                .order(ByteOrder.LITTLE_ENDIAN);
+        try {
+            long datastreamId = buffer.getInt() & 0xffffffffL;
+            JsonObject datastream = semantics.resolveDatastreamId(datastreamId);
+            if (datastream == null) {
+                Semantics.logger.warn("Dropping a binary message of the unknown datastream id " + datastreamId + ".");
+                return null;
+            }
+            JsonObject jsonInput = new JsonObject();
+            jsonInput.addProperty("phenomenonTime", toIso8601(buffer.getLong()));
+            jsonInput.addProperty("resultTime", toIso8601(buffer.getLong()));
+            jsonInput.add("datastream", datastream.deepCopy());
+            byte type = buffer.get();
+            if (type == FLOAT)
+                jsonInput.addProperty("result", buffer.getDouble());
+            else if (type == INT)
+                jsonInput.addProperty("result", buffer.getLong());
+            else if (type == FALSE || type == TRUE)
+                jsonInput.addProperty("result", type == TRUE);
+            else if (type == NULL)
+                jsonInput.add("result", JsonNull.INSTANCE);
+            else if (type == JSON) {
+                int length = buffer.getInt();
+                jsonInput.add("result", jsonParser.parse(
+                        new String(value, buffer.position(), length, StandardCharsets.UTF_8)));
+                buffer.position(buffer.position() + length);
+            } else {
+                Semantics.logger.warn("Dropping a binary message with the unknown result type " + type + ".");
+                return null;
+            }
+            if (buffer.hasRemaining())
+                jsonInput.add("attributes", jsonParser.parse(
+                        new String(value, buffer.position(), buffer.remaining(), StandardCharsets.UTF_8)));
+            return jsonInput;
+        } catch (BufferUnderflowException | IndexOutOfBoundsException e) {
+            Semantics.logger.warn("Dropping an invalid binary message: " + e);
+            return null;
+        }
+    }
+
+    /**
+     * Format microseconds since the unix epoch in the form of the client, e.g. 2018-12-03T15:55:39.054752+00:00
+     * @return the ISO 8601 string
+     */
+    static String toIso8601(long us) {
+        return ISO_FORMAT.format(Instant.ofEpochSecond(Math.floorDiv(us, 1000000L),
+                Math.floorMod(us, 1000000L) * 1000L));
+    }
+}
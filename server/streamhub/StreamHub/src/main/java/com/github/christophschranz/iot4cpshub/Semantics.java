@@ -14,12 +14,24 @@ import java.net.HttpURLConnection;
 import java.net.MalformedURLException;
 import java.net.ProtocolException;
 import java.net.URL;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.List;
+import java.util.Map;
 import java.util.Properties;
 
 public class Semantics {
     private String server_uri;
+    private String sourceSystem;
+    // credentials of an admin of the source system, required to fetch the datastream ids
+    private String serverUserId;
+    private String serverAuthorization;
 
     JsonObject streamObjects;
+    // datastreams of the source system by their ids, that reference them in messages of the binary wire format
+    JsonObject datastreamIds = new JsonObject();
+    long lastIdFetch = 0;
+    static final long ID_FETCH_INTERVAL_MS = 10000;
     String semantic;
     boolean verbose;
     String[] knownSemantics = new String[] {"SensorThings", "AAS"};
@@ -36,6 +48,9 @@ public class Semantics {
         // if (semantic.equalsIgnoreCase("gost"))
         this.semantic = semantic;
         this.server_uri = stream_config.getProperty("SERVER_URI", "").replace("\"", "");
+        this.sourceSystem = stream_config.getProperty("SOURCE_SYSTEM", "");
+        this.serverUserId = stream_config.getProperty("SERVER_USER_ID");
+        this.serverAuthorization = stream_config.getProperty("SERVER_AUTHORIZATION");
         this.verbose = verbose;
 
         // the json value is not indexed properly, restructure such that we have {iot_id0: {}, iot_id1: {}, ...}
@@ -79,6 +94,81 @@ public class Semantics {
                 + "\n\tEntries: \t" + size;
     }
 
+    /**
+     * This method expands a record with the results of several datastreams of a thing, i.e. a jsonInput with the key
+     * 'results' instead of 'result' and without 'quantity' in 'datastream', into one jsonInput per datastream.
+     * Other jsonInputs are returned as they are.
+     * @return the list of jsonInputs of single datapoints
+     */
+    public List<JsonObject> expandRecord(JsonObject jsonInput) {
+        if (!jsonInput.has("results"))
+            return Collections.singletonList(jsonInput);
+        JsonObject results = jsonInput.remove("results").getAsJsonObject();
+        List<JsonObject> datapoints = new ArrayList<>();
+        for (Map.Entry<String, JsonElement> entry : results.entrySet()) {
+            JsonObject datapoint = jsonInput.deepCopy();
+            datapoint.get("datastream").getAsJsonObject().addProperty("quantity", entry.getKey());
+            datapoint.add("result", entry.getValue());
+            datapoints.add(datapoint);
+        }
+        return datapoints;
+    }
+
+    /**
+     * Resolves the id of a datastream of the source system, that is referenced by messages of the binary wire format.
+     * The ids are fetched from the server once and again for unknown ids, at most every ID_FETCH_INTERVAL_MS.
+     * @return the datastream as in the JSON wire format, or null if the id is unknown
+     */
+    public JsonObject resolveDatastreamId(long datastreamId) {
+        String key = Long.toString(datastreamId);
+        if (!this.datastreamIds.has(key) && System.currentTimeMillis() - this.lastIdFetch >= ID_FETCH_INTERVAL_MS)
+            fetchDatastreamIds();
+        return this.datastreamIds.has(key) ? this.datastreamIds.get(key).getAsJsonObject() : null;
+    }
+
+    /**
+     *  Fetches the ids of the datastreams of the source system from the server and stores them in datastreamIds.
+     *  */
+    public void fetchDatastreamIds() {
+        this.lastIdFetch = System.currentTimeMillis();
+        if (this.serverUserId == null || this.serverAuthorization == null) {
+            logger.error("The datastream ids can't be fetched without SERVER_USER_ID and SERVER_AUTHORIZATION.");
+            return;
+        }
+        String urlString = "http://" + this.server_uri + "/distributionnetwork/datastream_ids/" +
+                this.serverUserId + "/" + this.sourceSystem.replace(".", "_");
+        logger.info("Fetching the datastream ids from " + urlString);
+
+        StringBuilder result = new StringBuilder();
+        try {
+            URL url = new URL(urlString);
+            HttpURLConnection conn = (HttpURLConnection) url.openConnection();
+            conn.setRequestMethod("GET");
+            conn.setConnectTimeout(5000);
+            conn.setRequestProperty("Authorization", this.serverAuthorization);
+            BufferedReader rd = new BufferedReader(new InputStreamReader(conn.getInputStream()));
+            String line;
+            while ((line = rd.readLine()) != null) {
+                result.append(line);
+            }
+            rd.close();
+            JsonArray datastreams = jsonParser.parse(result.toString()).getAsJsonObject()
+                    .get("datastreams").getAsJsonArray();
+            for (JsonElement element : datastreams) {
+                JsonObject ds = element.getAsJsonObject();
+                JsonObject datastream = new JsonObject();
+                datastream.addProperty("quantity", ds.get("shortname").getAsString());
+                datastream.addProperty("client_app", ds.get("client_name").getAsString());
+                datastream.addProperty("system", ds.get("system_name").getAsString());
+                datastream.addProperty("thing", ds.get("thing_name").getAsString());
+                this.datastreamIds.add(ds.get("id").getAsString(), datastream);
+            }
+            logger.info("Loaded the ids of " + datastreams.size() + " datastreams.");
+        } catch (Exception e) {
+            logger.error("The datastream ids are not available on the server '" + urlString + "': " + e);
+        }
+    }
+
     /**
      * This method parses the raw String input and augments it with attributes specified in the argument
      * @return the Augmented JsonInput
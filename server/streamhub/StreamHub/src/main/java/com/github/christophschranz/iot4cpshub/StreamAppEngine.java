@@ -4,10 +4,18 @@ import org.apache.kafka.common.serialization.Serdes;
 import org.apache.kafka.streams.KafkaStreams;
 import org.apache.kafka.streams.StreamsBuilder;
 import org.apache.kafka.streams.StreamsConfig;
+import com.google.gson.JsonObject;
+import com.google.gson.JsonParser;
+import org.apache.kafka.streams.kstream.Consumed;
 import org.apache.kafka.streams.kstream.KStream;
+import org.apache.kafka.streams.kstream.Produced;
 import org.slf4j.Logger;
 import org.slf4j.LoggerFactory;
 
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.List;
 import java.util.Properties;
 
 /** The StreamAppEngine generates streams between Panta Rhei Systems in Kafka, based on System variables
@@ -45,6 +53,10 @@ public class StreamAppEngine {
         } catch (java.lang.NullPointerException e) {
             logger.info(e + ": One or multiple environment variables are missing, searching for key-value arguments.");
         }
+        // optional credentials of an admin of the source system, required to resolve the binary wire format
+        for (String key: new String[] {"SERVER_USER_ID", "SERVER_AUTHORIZATION"})
+            if (System.getenv(key) != null)
+                globalOptions.setProperty(key, System.getenv(key));
 
                 // parse input parameter to options and check completeness, must be a key-val pair
         if (1 == args.length % 2) {
@@ -100,16 +112,52 @@ public class StreamAppEngine {
         // create topology
         StreamsBuilder streamsBuilder = new StreamsBuilder();
 
-        // input topic, application logic
-        KStream<String, String> inputTopic = streamsBuilder.stream(inputTopicName);
-
-        // Evaluate value to true to forward the input or false
-        KStream<String, String> filteredStream = inputTopic.filter((k, value) ->
-                                                        streamQuery.evaluate(semantics.augmentRawInput(value)));
+        // input topic, application logic, the values are passed as bytes, as block messages may be binary
+        KStream<String, byte[]> inputTopic = streamsBuilder.stream(inputTopicName,
+                Consumed.with(Serdes.String(), Serdes.ByteArray()));
+
+        // Evaluate value to true to forward the input or false, records of several datastreams of a thing are
+        // expanded and their datapoints are evaluated and forwarded one by one, blocks of samples of a datastream
+        // are forwarded as they are if at least one sample is evaluated to true. Datapoints of the binary wire format
+        // are forwarded in the JSON wire format, as their datastream ids are resolved within the source system only
+        JsonParser jsonParser = new JsonParser();
+        KStream<String, byte[]> filteredStream = inputTopic.flatMapValues(value -> {
+            if (Envelopes.isEnvelope(value)) {
+                JsonObject datapoint = Envelopes.parse(jsonParser, semantics, value);
+                if (datapoint == null)
+                    return Collections.<byte[]>emptyList();
+                byte[] datapointValue = datapoint.toString().getBytes(StandardCharsets.UTF_8);
+                return streamQuery.evaluate(semantics.augmentJsonInput(datapoint)) ?
+                        Collections.singletonList(datapointValue) : Collections.<byte[]>emptyList();
+            }
+            JsonObject jsonInput = Blocks.parse(jsonParser, value);
+            if (jsonInput.has("block")) {
+                double[] results = Blocks.results(jsonInput, value);
+                jsonInput.remove("block");
+                JsonObject augmented = semantics.augmentJsonInput(jsonInput);
+                for (double result : results) {
+                    augmented.addProperty("result", result);
+                    if (streamQuery.evaluate(augmented))
+                        return Collections.singletonList(value);
+                }
+                return Collections.<byte[]>emptyList();
+            }
+            if (!jsonInput.has("results"))
+                return streamQuery.evaluate(semantics.augmentJsonInput(jsonInput)) ?
+                        Collections.singletonList(value) : Collections.<byte[]>emptyList();
+            List<byte[]> forwarded = new ArrayList<>();
+            for (JsonObject datapoint : semantics.expandRecord(jsonInput)) {
+                // serialize before the augmentation, which adds the evaluated attributes
+                byte[] datapointValue = datapoint.toString().getBytes(StandardCharsets.UTF_8);
+                if (streamQuery.evaluate(semantics.augmentJsonInput(datapoint)))
+                    forwarded.add(datapointValue);
+            }
+            return forwarded;
+        });
 
 //        KStream<String, String> filteredStream = inputTopic.filter((k, value) -> true);
 
-        filteredStream.to(targetTopic);
+        filteredStream.to(targetTopic, Produced.with(Serdes.String(), Serdes.ByteArray()));
 
         // build the topology
         KafkaStreams kafkaStreams = new KafkaStreams(
@@ -13,7 +13,7 @@ WAIT_TIME = 3
 
 class SimpleStreamApp:
     def __init__(self, system_name, stream_name, source_system, target_system, kafka_bootstrap_servers, server_uri,
-                 filter_logic, verbose):
+                 filter_logic, verbose, server_user_id=None, server_authorization=None):
         self.system_name = system_name
         self.stream_name = stream_name
         self.source_system = source_system
@@ -22,6 +22,9 @@ class SimpleStreamApp:
         self.server_uri = server_uri
         self.filter_logic = filter_logic
         self.verbose = verbose
+        # credentials of an admin of the source system to fetch the datastream ids, not part of the config
+        self.server_user_id = server_user_id
+        self.server_authorization = server_authorization
 
         # create unique name for container
         self.container_name = f"stream-app_{self.system_name}_{self.stream_name}"
@@ -56,16 +59,20 @@ class SimpleStreamApp:
     def deploy(self):
         """Deploys the stream as sibling container"""
         try:
+            environment = {"STREAM_NAME": self.stream_name,
+                           "SOURCE_SYSTEM": self.source_system,
+                           "TARGET_SYSTEM": self.target_system,
+                           "KAFKA_BOOTSTRAP_SERVERS": self.kafka_bootstrap_servers,
+                           "SERVER_URI": self.server_uri,
+                           "FILTER_LOGIC": self.filter_logic,
+                           "VERBOSE": self.verbose}
+            if self.server_user_id is not None and self.server_authorization is not None:
+                environment["SERVER_USER_ID"] = str(self.server_user_id)
+                environment["SERVER_AUTHORIZATION"] = self.server_authorization
             # if app.config["Docker"]:
             self.container = self.client.containers.run(
                 image="streamhub_stream-app", detach=True, name=self.container_name,
-                environment={"STREAM_NAME": self.stream_name,
-                             "SOURCE_SYSTEM": self.source_system,
-                             "TARGET_SYSTEM": self.target_system,
-                             "KAFKA_BOOTSTRAP_SERVERS": self.kafka_bootstrap_servers,
-                             "SERVER_URI": self.server_uri,
-                             "FILTER_LOGIC": self.filter_logic,
-                             "VERBOSE": self.verbose},
+                environment=environment,
                 # network_mode="host",  # may be deprecated in case of sibling container
                 network="iassetinfrastaging_default",
                 restart_policy={"name": "always"})